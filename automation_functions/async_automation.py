@@ -0,0 +1,302 @@
+# Uses async and await so this module needs Python 3.5 or later
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import asyncio
+import socket
+import threading
+import weakref
+
+import paramiko
+
+from automation_functions import connection_pool
+from automation_functions.automation import Automation
+
+
+DEFAULT_MAX_BLOCKING_WORKERS = 16
+
+
+class AsyncAutomation(object):
+    """
+    Awaitable versions of the Automation methods for driving many hosts from one event loop.
+
+    Commands share the pooled, authenticated connections of the wrapped Automation, so synchronous and
+    asynchronous calls reuse the same transports. Opening a channel and starting the command run on a
+    small thread pool since paramiko blocks there; the output is then read with the event loop watching
+    the channel, so a running command holds no thread. Commands per host are limited to the pool's
+    max_connections_per_host so waiting for a connection does not tie up a thread either. The thread pool
+    and the per host limits are shared by every AsyncAutomation in the process, so driving many hosts
+    costs no more threads than driving one.
+
+    Every method takes a timeout in seconds for the whole call. A call which times out returns the same
+    failure tuple as a lost connection. Cancelling a call closes its channel, which hangs up the remote
+    command. remote_copy_files runs in the thread pool and finishes in the background if cancelled.
+
+    async with AsyncAutomation(hostname=ip_address, username='cloud', private_key_file=key) as a:
+        ssh_status, message, status = await a.move_files(['/tmp/a.sql'], '/home/oracle', timeout=30)
+    """
+
+    def __init__(self, automation=None, executor=None, host_semaphores=None, **kwargs):
+        """
+        :param automation: The Automation whose host, credentials, pool and cache are used, created from kwargs if None
+        :param executor: The thread pool used for connecting and starting commands, defaults to the process wide
+        one from get_default_executor() (ThreadPoolExecutor)
+        :param host_semaphores: A dict of connection pool key to the asyncio.Semaphore limiting commands on that
+        host, defaults to the one shared by every AsyncAutomation on the event loop (Dict)
+        """
+        self.automation = automation if automation is not None else Automation(**kwargs)
+        self.executor = executor if executor is not None else get_default_executor()
+        self._host_semaphores = host_semaphores
+
+    @property
+    def hostname(self):
+        return self.automation.hostname
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        # The thread pool, host limits and pooled connections are shared, they stay open for other users
+        pass
+
+    async def execute_remote_command(self, command, timeout=None):
+        """
+        :param command: A list of command parts, the first part may be a sudo su prefix (List)
+        :param timeout: Seconds to allow for the whole call, None waits as long as output keeps arriving (Int)
+        :return: A dict with the keys status, exit_code, stdout, stderr and msg
+        """
+        try:
+            return await asyncio.wait_for(self._execute_remote_command(command), timeout)
+        except asyncio.TimeoutError:
+            return {'status': False,
+                    'exit_code': None,
+                    'stdout': u'',
+                    'stderr': u'',
+                    'msg': u"Timed out after {0} seconds on {1}.".format(timeout, self.hostname)}
+
+    async def remote_copy_files(self, files, destination_directory, transfer_mode=None, skip_unchanged=True,
+                                timeout=None):
+        """
+        :return: Tuple of command execution status (Bool), Result Message (String)
+
+        See Automation.remote_copy_files.
+        """
+        loop = asyncio.get_event_loop()
+        copy = loop.run_in_executor(self.executor, self.automation.remote_copy_files, files,
+                                    destination_directory, transfer_mode, skip_unchanged)
+        try:
+            return await asyncio.wait_for(copy, timeout)
+        except asyncio.TimeoutError:
+            return False, u"Timed out after {0} seconds copying files to {1}.".format(timeout, self.hostname)
+
+    async def execute_shell_script(self, script_file_name, su_as='root', timeout=None):
+        return await self._run_step(self.automation._execute_shell_script_step(script_file_name, su_as), timeout)
+
+    async def move_files(self, files, destination_directory, su_as='root', timeout=None):
+        return await self._run_step(self.automation._move_files_step(files, destination_directory, su_as), timeout)
+
+    async def mount_file_system(self, source_file_system, mount_directory, su_as='root', timeout=None):
+        return await self._run_step(self.automation._mount_file_system_step(source_file_system, mount_directory,
+                                                                            su_as), timeout)
+
+    async def unmount_file_system(self, mount_directory, su_as='root', timeout=None):
+        return await self._run_step(self.automation._unmount_file_system_step(mount_directory, su_as), timeout)
+
+    async def change_file_ownership(self, chown_username, files, chown_groupname='', recursive=False, su_as='root',
+                                    timeout=None):
+        return await self._run_step(self.automation._change_file_ownership_step(chown_username, files,
+                                                                                chown_groupname, recursive,
+                                                                                su_as), timeout)
+
+    async def create_directory(self, folder_path_name, su_as='root', timeout=None):
+        return await self._run_step(self.automation._create_directory_step(folder_path_name, su_as), timeout)
+
+    async def execute_oracle_sql_script(self, script_file, script_parameters, su_as='oracle', timeout=None):
+        return await self._run_step(self.automation._execute_oracle_sql_script_step(script_file, script_parameters,
+                                                                                    su_as), timeout)
+
+    async def check_files_exist(self, file_paths, include_metadata=False, su_as='root', timeout=None):
+        """
+        :return: A tuple of command execution status (Bool), dict of path to result dict (Dict)
+
+        See Automation.check_files_exist.
+        """
+        automation = self.automation
+        results, uncached_paths = automation._cached_file_stats(file_paths, include_metadata, su_as)
+        if not uncached_paths:
+            return True, results
+
+        command = [automation._sudo_su_command(su_as),
+                   automation._build_file_stat_command(uncached_paths, include_metadata)]
+        result = await self.execute_remote_command(command, timeout)
+        return automation._merge_file_stats(file_paths, uncached_paths, result, results, include_metadata, su_as)
+
+    async def _run_step(self, step, timeout):
+        try:
+            return await asyncio.wait_for(self._run_step_checked(step), timeout)
+        except asyncio.TimeoutError:
+            message = u"Timed out after {0} seconds on {1}; {2}".format(timeout, self.hostname, step.error_message)
+            return False, message, None
+
+    async def _run_step_checked(self, step):
+        automation = self.automation
+        if step.check_paths:
+            status, results = await self.check_files_exist(step.check_paths)
+            if not status:
+                return step.unknown_result(self.hostname)
+            for file_path in step.check_paths:
+                if results[file_path]['type'] == 'missing':
+                    return step.missing_result(file_path, self.hostname)
+
+        result = await self._execute_remote_command([automation._sudo_su_command(step.su_as), step.command])
+        step_result = step.parse(result)
+        automation._update_metadata_cache(step, step_result[0] and step_result[2])
+        return step_result
+
+    async def _execute_remote_command(self, command):
+        automation = self.automation
+        loop = asyncio.get_event_loop()
+        if not automation.use_connection_pool or automation.use_elevated_shells:
+            # SshClient and the elevated shells only have a blocking interface
+            return await loop.run_in_executor(self.executor, automation.execute_remote_command, command)
+
+        datetime_executed = datetime.now()
+        result = await self._execute_pooled_command(command)
+        automation._log_remote_command_result('Execute remote command', command, result, datetime_executed)
+        return result
+
+    async def _execute_pooled_command(self, command):
+        automation = self.automation
+        pool = automation.connection_pool or connection_pool.get_default_pool()
+        port = getattr(automation, 'port', 22)
+        key = pool.make_key(automation.hostname, automation.username, automation.private_key_file, port)
+        host_semaphores = self._host_semaphores if self._host_semaphores is not None else get_host_semaphores()
+        semaphore = host_semaphores.get(key)
+        if semaphore is None:
+            semaphore = host_semaphores[key] = asyncio.Semaphore(pool.max_connections_per_host)
+
+        command_string = connection_pool.build_command_string(command)
+        async with semaphore:
+            try:
+                key, connection = await self._run_in_executor(
+                    lambda acquired: pool.release(acquired[0], acquired[1]),
+                    pool.acquire, automation.hostname, automation.username, automation.private_key_file, port,
+                    automation.connection_timeout)
+            except Exception as error:
+                return self._failed_result(error)
+
+            channel = None
+            discard = False
+            try:
+                channel = await self._run_in_executor(lambda started: started.close(),
+                                                      self._start_command, connection.client, command_string)
+                return await self._read_command_output(channel)
+            except (paramiko.SSHException, socket.error, EOFError) as error:
+                discard = True
+                return self._failed_result(error)
+            finally:
+                if channel is not None:
+                    channel.close()
+                pool.release(key, connection, discard=discard)
+
+    async def _run_in_executor(self, cleanup, function, *args):
+        """
+        :param cleanup: Called with the function's result if the call is cancelled before it returns (Callable)
+        :return: The function's result
+
+        A cancelled call cannot stop the thread running function, so whatever it acquires is handed to
+        cleanup once it finishes instead of being leaked.
+        """
+        future = asyncio.get_event_loop().run_in_executor(self.executor, function, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            def clean_up(finished):
+                if not finished.cancelled() and finished.exception() is None:
+                    cleanup(finished.result())
+            future.add_done_callback(clean_up)
+            raise
+
+    @staticmethod
+    def _start_command(client, command_string):
+        channel = client.get_transport().open_session()
+        channel.get_pty()
+        channel.exec_command(command_string)
+        return channel
+
+    async def _read_command_output(self, channel):
+        """
+        :return: A dict with the keys status, exit_code, stdout, stderr and msg
+
+        Waits on the channel's file descriptor, which paramiko makes readable whenever output arrives or the
+        channel reaches end of file.
+        """
+        loop = asyncio.get_event_loop()
+        readable = asyncio.Event()
+        file_descriptor = channel.fileno()
+        loop.add_reader(file_descriptor, readable.set)
+        stdout = []
+        stderr = []
+        try:
+            while True:
+                while channel.recv_stderr_ready():
+                    stderr.append(channel.recv_stderr(32768))
+                if channel.recv_ready():
+                    stdout.append(channel.recv(32768))
+                    continue
+                if channel.eof_received or channel.closed:
+                    break
+                readable.clear()
+                try:
+                    await asyncio.wait_for(readable.wait(), self.automation.command_timeout)
+                except asyncio.TimeoutError:
+                    raise socket.timeout('No output for {0} seconds.'.format(self.automation.command_timeout))
+        finally:
+            loop.remove_reader(file_descriptor)
+
+        # The exit status can follow end of file
+        while not channel.exit_status_ready():
+            await asyncio.sleep(0.005)
+        while channel.recv_stderr_ready():
+            stderr.append(channel.recv_stderr(32768))
+        return {'status': True,
+                'exit_code': channel.recv_exit_status(),
+                'stdout': b''.join(stdout).decode('utf-8', 'replace'),
+                'stderr': b''.join(stderr).decode('utf-8', 'replace'),
+                'msg': u''}
+
+    def _failed_result(self, error):
+        return {'status': False,
+                'exit_code': None,
+                'stdout': u'',
+                'stderr': u'',
+                'msg': u"Unable to run the command on {0}: {1}".format(self.hostname, error)}
+
+
+_default_executor = None
+_default_executor_lock = threading.Lock()
+# An asyncio.Semaphore belongs to one event loop, so each loop gets its own dict of per host semaphores
+_host_semaphores_by_loop = weakref.WeakKeyDictionary()
+
+
+def get_default_executor():
+    """
+    :return: The process wide ThreadPoolExecutor with DEFAULT_MAX_BLOCKING_WORKERS threads shared by every
+    AsyncAutomation instance
+    """
+    global _default_executor
+    with _default_executor_lock:
+        if _default_executor is None:
+            _default_executor = ThreadPoolExecutor(max_workers=DEFAULT_MAX_BLOCKING_WORKERS)
+        return _default_executor
+
+
+def get_host_semaphores():
+    """
+    :return: The dict of connection pool key to asyncio.Semaphore shared by every AsyncAutomation on the
+    running event loop (Dict)
+    """
+    loop = asyncio.get_event_loop()
+    semaphores = _host_semaphores_by_loop.get(loop)
+    if semaphores is None:
+        semaphores = _host_semaphores_by_loop[loop] = {}
+    return semaphores
@@ -1,26 +1,111 @@
 from bash_client import bash_client
 from ssh_client.ssh_client import SshClient
+from automation_functions import bulk
+from automation_functions.compat import string_types
+from automation_functions import connection_pool
+from automation_functions.converge import DesiredState
+from automation_functions import elevated_shell
+from automation_functions.instrumentation import child_span, get_default_instrumentation, traced
+from automation_functions import local_command
+from automation_functions import mounts
+from automation_functions import oracle
+from automation_functions.pipeline import RemotePipeline
+from automation_functions.remote_step import RemoteStep
+from automation_functions.result_log import get_default_result_log
+from automation_functions import script_cache
+from automation_functions.sqlplus_session import SqlPlusSession
+from automation_functions import transfer
 from datetime import datetime
 import os.path
+import posixpath
 import re
 
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+
+FILE_STAT_MARKER = '__AF_STAT__'
+FILE_TYPES = ('file', 'directory', 'missing')
+ORACLE_ERROR_PATTERN = 'ORA-[0-9]{5}'
+# Result log fields left out unless log_command_output is True
+COMMAND_OUTPUT_FIELDS = ('command', 'stdout', 'stderr')
+
 
 class Automation(SshClient):
 
     def __init__(self, *args, **kwargs):
+        # Remote commands reuse pooled connections unless use_connection_pool=False is passed;
+        # connection_pool defaults to the process wide pool shared by every Automation instance
+        self.use_connection_pool = kwargs.pop('use_connection_pool', True)
+        self.connection_pool = kwargs.pop('connection_pool', None)
+        # Run sudo su commands in one persistent login shell per su_as user instead of a new one per command
+        self.use_elevated_shells = kwargs.pop('use_elevated_shells', False)
+        # Timing spans for every public method and remote command; off unless the instrumentation has a sink
+        self.instrumentation = kwargs.pop('instrumentation', None) or get_default_instrumentation()
+        # Command results are queued on this ResultLog and written by its background thread;
+        # result_log defaults to the process wide log in DEFAULT_LOG_DIRECTORY
+        self.result_log = kwargs.pop('result_log', None) or get_default_result_log()
+        # Command lines and output can hold passwords, such as sqlplus script parameters, so results are
+        # logged without them unless log_command_output=True is passed
+        self.log_command_output = kwargs.pop('log_command_output', False)
+        # An optional MetadataCache which answers repeated existence checks without a round trip
+        self.metadata_cache = kwargs.pop('metadata_cache', None)
         super(Automation, self).__init__(*args, **kwargs)
         # Set timeouts and sleeps in seconds
         self.connection_timeout = 60
         self.command_timeout = 60
-        self.command_sleep = 3
+        # Local commands return as soon as the process exits; set command_sleep to a number of seconds
+        # to fall back to bash_client's fixed sleep polling
+        self.command_sleep = None
+        # 'scp' shells out to scp per call, 'sftp' uploads over the pooled transport and skips unchanged files,
+        # 'ranged' splits files into verified ranges sent over several connections and resumes partial uploads
+        self.transfer_mode = 'scp'
+        self.max_transfers_in_flight = 4
+        self.transfer_chunk_size = 8388608
+        self.transfer_compression = False
+        # Local commands with more files than fit in this many characters of arguments are run in chunks
+        self.max_command_line_length = 131072
+        # Local scripts run with local_script=True are cached on the remote system in a directory per sha256
+        self.script_cache_directory = script_cache.DEFAULT_CACHE_DIRECTORY
 
-    def remote_copy_files(self, files, destination_directory):
+    def execute_remote_command(self, command):
+        """
+        :param command: A list of command parts, the first part may be a sudo su prefix (List)
+        :return: A dict with the keys status, exit_code, stdout, stderr and msg
+
+        Runs the command over a pooled, already authenticated connection when pooling is enabled,
+        otherwise falls back to a new connection per command through SshClient. With use_elevated_shells
+        sudo su commands are sent into a persistent login shell for that user. The result is queued on the
+        result log.
+        """
+        datetime_executed = datetime.now()
+        if not self.instrumentation.enabled:
+            result = self._execute_remote_command(command)
+        else:
+            with self.instrumentation.span('execute_remote_command', host=self.hostname,
+                                           su_as=self._su_as_from_command(command)) as span:
+                result = self._execute_remote_command(command)
+                span.record(round_trips=1,
+                            bytes_out=len(connection_pool.build_command_string(command)),
+                            bytes_in=len(result.get('stdout') or '') + len(result.get('stderr') or ''),
+                            exit_code=result.get('exit_code'),
+                            status=bool(result.get('status') and result.get('exit_code') == 0))
+        self._log_remote_command_result('Execute remote command', command, result, datetime_executed)
+        return result
+
+    @traced
+    def remote_copy_files(self, files, destination_directory, transfer_mode=None, skip_unchanged=True):
         """
         :param files: tuple or list of files with there directory paths to be copied over to the destination server (String)
         :param destination_directory: the directory the files will be copied to on the destination server (String)
+        :param transfer_mode: 'scp', 'sftp' or 'ranged', defaults to the transfer_mode attribute (String)
+        :param skip_unchanged: In sftp and ranged mode do not upload files whose remote copy has the same size
+        and hash (Bool)
         :return: Tuple of command execution status (Bool), Result Message (String)
         """
-        if not isinstance(destination_directory, (str, basestring, unicode)):
+        if not isinstance(destination_directory, string_types):
             raise TypeError('destination_directory input variable is not a string or unicode type.')
 
         for index, file_name in enumerate(files):
@@ -28,33 +113,48 @@ class Automation(SshClient):
                 raise IOError('files input variable at index {0} value {1} does not point to a valid file. '
                               'The location or filename maybe incorrect.'.format(index, file_name))
 
-        command = ['scp',
-                   '-o',
-                   'UserKnownHostsFile=/dev/null',
-                   '-o',
-                   'StrictHostKeyChecking=no',
-                   '-i',
-                   '{SSH_KEY}'.format(SSH_KEY=self.private_key_file),
-                   '{USERNAME}@{HOSTNAME}:{DESTINATION}'.format(USERNAME=self.username,
-                                                                HOSTNAME=self.hostname,
-                                                                DESTINATION=destination_directory)]
-
-        # Insert files into command after ssh_key
-        for file in files:
-            command.insert(7, file)
-
-        stdout, stderr, returncode = bash_client.execute_command(command=command,
-                                                                 command_timeout=self.command_timeout,
-                                                                 command_sleep=self.command_sleep)
-
-        bash_client.log_execute_command_results(command=command,
-                                                datetime_executed=datetime.now(),
-                                                action='SCP Files to remote server',
-                                                returncode=returncode,
-                                                stdout=stdout,
-                                                stderr=stderr,
-                                                log_directory='/tmp/',
-                                                server=self.hostname)
+        if self.metadata_cache is not None:
+            self.metadata_cache.invalidate(self.hostname, [transfer.remote_path_for(file_name, destination_directory)
+                                                           for file_name in files])
+
+        transfer_mode = transfer_mode or self.transfer_mode
+        if transfer_mode == 'sftp':
+            return self._sftp_copy_files(files, destination_directory, skip_unchanged)
+        elif transfer_mode == 'ranged':
+            return self._ranged_copy_files(files, destination_directory, skip_unchanged)
+        elif transfer_mode != 'scp':
+            raise ValueError('transfer_mode input variable must be scp, sftp or ranged.')
+
+        command_prefix = ['scp',
+                          '-o',
+                          'UserKnownHostsFile=/dev/null',
+                          '-o',
+                          'StrictHostKeyChecking=no',
+                          '-P',
+                          '{PORT}'.format(PORT=getattr(self, 'port', 22)),
+                          '-i',
+                          '{SSH_KEY}'.format(SSH_KEY=self.private_key_file)]
+        destination = '{USERNAME}@{HOSTNAME}:{DESTINATION}'.format(USERNAME=self.username,
+                                                                   HOSTNAME=self.hostname,
+                                                                   DESTINATION=destination_directory)
+
+        # Copy as many files per scp as fit in the argument length limit
+        command_length = sum(len(part) + 1 for part in command_prefix) + len(destination)
+        for chunk in bulk.chunk_arguments(files, self.max_command_line_length - command_length):
+            command = command_prefix + chunk + [destination]
+
+            # Each scp connects, authenticates and copies its chunk on a connection of its own
+            stdout, stderr, returncode = self._execute_local_command(command, round_trips=1)
+
+            self._log_command_results(command=command,
+                                      datetime_executed=datetime.now(),
+                                      action='SCP Files to remote server',
+                                      returncode=returncode,
+                                      stdout=stdout,
+                                      stderr=stderr,
+                                      server=self.hostname)
+            if returncode != 0:
+                break
 
         if returncode == 0:
             command_execution_status = True
@@ -64,78 +164,35 @@ class Automation(SshClient):
             result_message = u"Failed to scp files to {HOSTNAME}.".format(HOSTNAME=self.hostname)
         return command_execution_status, result_message
 
-    def execute_shell_script(self, script_file_name, su_as='root'):
+    @traced
+    def execute_shell_script(self, script_file_name, su_as='root', local_script=False):
         """
         :param script_file_name: The full path and name of the script (String)
         :param su_as: The name of the user su as to run/execute the command (String)
+        :param local_script: script_file_name is a local script, run from the remote script cache (Bool)
         :return: Tuple of command execution status (Bool), Result Message (String)
         """
-        if not isinstance(script_file_name, (str, basestring, unicode)):
-            raise TypeError('destination_directory input variable is not a string or unicode type.')
-
-        script_file_name = script_file_name.rstrip('/')
-
-        status, file_exists = self._check_if_file_or_directory_exists(script_file_name)
-        if status and not file_exists:
-            message = u"The script '{SCRIPT}' on {HOSTNAME} " \
-                      u"does not exist, cannot execute it.".format(SCRIPT=script_file_name,
-                                                                   HOSTNAME=self.hostname)
-            return True, message, False
-        elif not status:
-            message = u"Unable to determine if the script '{SCRIPT}' on {HOSTNAME} " \
-                      u"exists, cannot execute it.".format(SCRIPT=script_file_name,
-                                                           HOSTNAME=self.hostname)
-            return False, message, None
-
-        sudo_su = self._sudo_su_command(su_as)
-        command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
-                   'sh {SCRIPT}'.format(SCRIPT=script_file_name)]
+        if local_script:
+            return self._run_cached_script(script_file_name, su_as,
+                                           lambda cached_path: self._execute_shell_script_step(cached_path, su_as))
+        return self._run_step(self._execute_shell_script_step(script_file_name, su_as))
 
-        # execute command
-        result = self.execute_remote_command(command)
-        return self._parse_ssh_client_result(result,
-                                             u"Successfully executed script {0}.".format(script_file_name),
-                                             u"Failed to execute script {0}.".format(script_file_name))
-
-    def move_files(self, files, destination_directory, su_as='root'):
+    @traced
+    def move_files(self, files, destination_directory, su_as='root', bulk_mode=False):
         """
         :param files: tuple or list of the full path and name of the files to move (String)
         :param destination_directory: the directory the files will be copied to on the destination server (String)
         :param su_as: The name of the user su as to run/execute the command (String)
+        :param bulk_mode: Stream the paths over stdin to xargs, files may then be any iterable of paths (Bool)
         :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
 
         Move a list of files from directory to another; Does not move directories.
         """
-        if not isinstance(destination_directory, (str, basestring, unicode)):
-            raise TypeError('destination_directory input variable is not a string or unicode type.')
-
-        for index, file_name in enumerate(files):
-            status, file_exists = self._check_if_file_or_directory_exists(file_name)
-            if status and not file_exists:
-                message = u"The source file '{SOURCE_FILE}' on {HOSTNAME} " \
-                          u"does not exist, cannot move it.".format(SOURCE_FILE=file_name,
-                                                                    HOSTNAME=self.hostname)
-                return True, message, False
-            elif not status:
-                message = u"Unable to determine if the source file '{SOURCE_FILE}' on {HOSTNAME} " \
-                          u"exists, cannot move it.".format(SOURCE_FILE=file_name,
-                                                            HOSTNAME=self.hostname)
-                return False, message, None
-
-        # build up command
-        source_files_with_path = self._flatten_list_for_command(files)
-
-        sudo_su = self._sudo_su_command(su_as)
-        command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
-                   'mv {SOURCE_FILES} {DESTINATION_DIRECTORY}'.format(SOURCE_FILES=source_files_with_path,
-                                                                      DESTINATION_DIRECTORY=destination_directory)]
-
-        # execute command
-        result = self.execute_remote_command(command)
-        return self._parse_ssh_client_result(result,
-                                             u"Successfully moved files to folder {0}.".format(destination_directory),
-                                             u"Failed to moved files to folder {0}.".format(destination_directory))
+        if bulk_mode:
+            return self._run_bulk_step(self._bulk_move_files_step(destination_directory, su_as), files)
+        return self._run_step(self._move_files_step(files, destination_directory, su_as))
 
+    @traced
     def mount_file_system(self, source_file_system, mount_directory, su_as='root'):
         """
         :param source_file_system: The mount source either a network location or local drive (String)
@@ -143,139 +200,119 @@ class Automation(SshClient):
         :param su_as: The name of the user su as to run/execute the command (String)
         :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
         """
-        if not isinstance(source_file_system, (str, basestring, unicode)):
-            raise TypeError('source_file_system input variable is not a string or unicode type.')
-        if not isinstance(mount_directory, (str, basestring, unicode)):
-            raise TypeError('mount_directory input variable is not a string or unicode type.')
-
-        source_file_system = source_file_system.rstrip('/')
-        mount_directory = mount_directory.rstrip('/')
-
-        status, file_exists = self._check_if_file_or_directory_exists(mount_directory)
-        if status and not file_exists:
-            message = u"The mount directory '{MOUNT_DIR}' on {HOSTNAME} " \
-                      u"does not exist, cannot mount to it.".format(MOUNT_DIR=mount_directory,
-                                                                    HOSTNAME=self.hostname)
-            return True, message, False
-        elif not status:
-            message = u"Unable to determine if the mount directory '{MOUNT_DIR}' on {HOSTNAME} " \
-                      u"exists, cannot mount to it.".format(MOUNT_DIR=mount_directory,
-                                                            HOSTNAME=self.hostname)
-            return False, message, None
-
-        sudo_su = self._sudo_su_command(su_as)
-        command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
-                   'mount {SOURCE_FS} {MOUNT_DIR}'.format(SOURCE_FS=source_file_system,
-                                                          MOUNT_DIR=mount_directory)]
-
-        result = self.execute_remote_command(command)
-        return self._parse_ssh_client_result(result,
-                                             success_message=u"Successfully mounted file system: '{0}' to the mount "
-                                                             u"folder: '{1}'.".format(source_file_system,
-                                                                                      mount_directory),
-                                             error_message=u"Failed to mounted file system: '{0}' to the "
-                                                           u"mount folder: '{1}'.".format(source_file_system,
-                                                                                          mount_directory))
+        return self._run_step(self._mount_file_system_step(source_file_system, mount_directory, su_as))
 
+    @traced
     def unmount_file_system(self, mount_directory, su_as='root'):
         """
         :param mount_directory: The destination directory where the files system will be mounted to (String)
         :param su_as: The name of the user su as to run/execute the command (String)
         :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
         """
-        if not isinstance(mount_directory, (str, basestring, unicode)):
-            raise TypeError('mount_directory input variable is not a string or unicode type.')
+        return self._run_step(self._unmount_file_system_step(mount_directory, su_as))
 
-        mount_directory = mount_directory.rstrip('/')
+    @traced
+    def mount_file_systems(self, file_systems, su_as='root', create_mount_points=True):
+        """
+        :param file_systems: A tuple or list of (source file system, mount directory) pairs (Tuple or List)
+        :param su_as: The name of the user su as to run/execute the command (String)
+        :param create_mount_points: Create mount directories which do not exist yet (Bool)
+        :return: A list with one tuple of ssh connection status (Bool), Result Message (String), command
+        execution status (Bool) per pair, in the order given
 
-        status, file_exists = self._check_if_file_or_directory_exists(mount_directory)
-        if status and not file_exists:
-            message = u"The mount directory '{MOUNT_DIR}' on {HOSTNAME} " \
-                      u"does not exist, cannot unmount it.".format(MOUNT_DIR=mount_directory,
-                                                                   HOSTNAME=self.hostname)
-            return True, message, False
-        elif not status:
-            message = u"Unable to determine if the mount directory '{MOUNT_DIR}' on {HOSTNAME} " \
-                      u"exists, cannot unmount it.".format(MOUNT_DIR=mount_directory,
-                                                           HOSTNAME=self.hostname)
-            return False, message, None
+        Mounts many file systems in one remote command. /proc/mounts is read once; pairs which are already
+        mounted are left alone and a mount directory with another file system on it is reported as a
+        failure. The rest are mounted concurrently, a mount directory inside another one of the batch
+        after the file system it lives on. A mount directory given twice raises ValueError.
+        """
+        if not isinstance(file_systems, (tuple, list)):
+            raise TypeError('file_systems input variable is not a list or tuple.')
+        for index, pair in enumerate(file_systems):
+            if not isinstance(pair, (tuple, list)) or len(pair) != 2:
+                raise TypeError('file_systems input variable at index {0} is not a (source, mount directory) '
+                                'pair.'.format(index))
+        steps = [self._mount_file_system_step(source_file_system, mount_directory, su_as)
+                 for source_file_system, mount_directory in file_systems]
+        if not steps:
+            return []
 
-        sudo_su = self._sudo_su_command(su_as)
-        command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
-                   'umount -f {MOUNT_DIR}'.format(MOUNT_DIR=mount_directory)]
+        sources = [source_file_system.rstrip('/') for source_file_system, _ in file_systems]
+        script = mounts.build_batch_mount_script([(source_file_system, step.check_paths[0])
+                                                  for source_file_system, step in zip(sources, steps)],
+                                                 create_mount_points)
+        result, entries = self._run_batch_mount_script(script, steps, su_as)
+        if not result.get('status'):
+            return [step.parse(result) for step in steps]
 
-        result = self.execute_remote_command(command)
-        return self._parse_ssh_client_result(result,
-                                             success_message=u"Successfully unmounted file system from mount "
-                                                             u"folder: '{0}'.".format(mount_directory),
-                                             error_message=u"Failed to unmounted file system mount "
-                                                           u"folder: '{0}'.".format(mount_directory))
+        results = []
+        for source_file_system, step, fields in zip(sources, steps, entries):
+            mount_directory = step.check_paths[0]
+            if fields and fields[0] == 'unchanged':
+                results.append((True, u"File system '{0}' is already mounted on '{1}'.".format(source_file_system,
+                                                                                             mount_directory), True))
+            elif fields and fields[0] == 'busy':
+                results.append((True, u"Cannot mount file system '{0}', '{1}' on {2} already has '{3}' mounted "
+                                      u"on it.".format(source_file_system, mount_directory, self.hostname,
+                                                       mounts.unescape_mount_field('|'.join(fields[1:]))), False))
+            elif fields and fields[0] == 'missing':
+                results.append(step.missing_result(mount_directory, self.hostname))
+            else:
+                results.append(self._parse_batch_mount_fields(step, fields))
+        return results
+
+    @traced
+    def unmount_file_systems(self, mount_directories, su_as='root', force=False):
+        """
+        :param mount_directories: A tuple or list of mount directories (Tuple or List)
+        :param su_as: The name of the user su as to run/execute the command (String)
+        :param force: Unmount with umount -f (Bool)
+        :return: A list with one tuple of ssh connection status (Bool), Result Message (String), command
+        execution status (Bool) per mount directory, in the order given
+
+        Unmounts many file systems in one remote command. /proc/mounts is read once and only directories
+        with a file system mounted on them are unmounted, concurrently, a mount directory inside another
+        one of the batch before the file system it lives on. A mount directory given twice raises ValueError.
+        """
+        if not isinstance(mount_directories, (tuple, list)):
+            raise TypeError('mount_directories input variable is not a list or tuple.')
+        steps = [self._unmount_file_system_step(mount_directory, su_as) for mount_directory in mount_directories]
+        if not steps:
+            return []
+
+        script = mounts.build_batch_unmount_script([step.check_paths[0] for step in steps], force)
+        result, entries = self._run_batch_mount_script(script, steps, su_as)
+        if not result.get('status'):
+            return [step.parse(result) for step in steps]
 
-    def change_file_ownership(self, chown_username, files, chown_groupname='', recursive=False, su_as='root'):
+        results = []
+        for step, fields in zip(steps, entries):
+            if fields and fields[0] == 'unchanged':
+                results.append((True, u"Nothing is mounted on '{0}'.".format(step.check_paths[0]), True))
+            else:
+                results.append(self._parse_batch_mount_fields(step, fields))
+        return results
+
+    @traced
+    def change_file_ownership(self, chown_username, files, chown_groupname='', recursive=False, su_as='root',
+                              bulk_mode=False):
         """
         :param chown_username: The username to change the ownership to (String)
         :param chown_groupname: The groupname to change the ownership to optional (String)
         :param files: A tuple or list of file names as strings to change the ownership on (Tuple or List)
         :param recursive: change ownership recursively if True, do not change ownership recursively if False (Bool)
         :param su_as: The name of the user su as to run/execute the command (String)
+        :param bulk_mode: Stream the paths over stdin to xargs, files may then be any iterable of paths (Bool)
         :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
 
         Change the owner and group of a set of files
         """
-        if not isinstance(chown_username, (str, basestring, unicode)):
-            raise TypeError('chown_username input variable is not a string or unicode type.')
-        if not isinstance(chown_groupname, (str, basestring, unicode)):
-            raise TypeError('chown_groupname input variable is not a string or unicode type.')
-        if not isinstance(files, (tuple, list)):
-            raise TypeError('files input variable is not a list or tuple.')
-
-        for index, file_name in enumerate(files):
-            status, file_exists = self._check_if_file_or_directory_exists(file_name)
-            if status and not file_exists:
-                message = u"The file '{FILE}' on {HOSTNAME} " \
-                          u"does not exist, cannot change ownership on it.".format(FILE=file_name,
-                                                                                   HOSTNAME=self.hostname)
-                return True, message, False
-            elif not status:
-                message = u"Unable to determine if the file '{FILE}' on {HOSTNAME} " \
-                          u"exists, cannot change ownership on it.".format(FILE=file_name,
-                                                                           HOSTNAME=self.hostname)
-                return False, message, None
-
-        # build up command
-        files_flattened = self._flatten_list_for_command(files)
-
-        # Get sudo su command
-        sudo_su = self._sudo_su_command(su_as)
-
-        # Set chown command options
-        if recursive:
-            chown_command = 'chown -R'
-        else:
-            chown_command = 'chown'
-
-        if not chown_groupname:
-            command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
-                       '{CHOWN} {USERNAME} {SOURCE_FILES}'.format(CHOWN=chown_command,
-                                                                  USERNAME=chown_username,
-                                                                  SOURCE_FILES=files_flattened)]
-        else:
-            command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
-                       '{CHOWN} {USERNAME}.{GROUPNAME} {SOURCE_FILES}'.format(CHOWN=chown_command,
-                                                                              USERNAME=chown_username,
-                                                                              GROUPNAME=chown_groupname,
-                                                                              SOURCE_FILES=files_flattened)]
-
-        # execute command
-        result = self.execute_remote_command(command)
-        return self._parse_ssh_client_result(result,
-                                             success_message=u"Successfully changed ownership "
-                                                             u"on files {0} to the username {1}.".format(chown_username,
-                                                                                                         files_flattened),
-                                             error_message=u"Failed to change ownership on "
-                                                           u"files {0} to the username {1}.".format(files_flattened,
-                                                                                                    chown_username))
+        if bulk_mode:
+            return self._run_bulk_step(self._bulk_change_file_ownership_step(chown_username, chown_groupname,
+                                                                             recursive, su_as), files)
+        return self._run_step(self._change_file_ownership_step(chown_username, files, chown_groupname,
+                                                               recursive, su_as))
 
+    @traced
     def create_directory(self, folder_path_name, su_as='root'):
         """
         :param folder_path_name: The full path of the folder with the folder name (String)
@@ -284,81 +321,114 @@ class Automation(SshClient):
 
         Creates directories with -p flag on; No error if folder exists already, makes parent directories as needed.
         """
-        if not isinstance(folder_path_name, (str, basestring, unicode)):
-            raise TypeError('folder_path_name input variable is not a string or unicode type.')
-
-        folder_path_name = folder_path_name.rstrip('/')
-
-        sudo_su = self._sudo_su_command(su_as)
-        command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
-                   'mkdir -p {DIRECTORY}'.format(DIRECTORY=folder_path_name)]
+        return self._run_step(self._create_directory_step(folder_path_name, su_as))
 
-        result = self.execute_remote_command(command)
-        return self._parse_ssh_client_result(result,
-                                             success_message=u"Successfully created "
-                                                             u"folder {0}.".format(folder_path_name),
-                                             error_message=u"Failed to create folder {0}.".format(folder_path_name))
-
-    def execute_oracle_sql_script(self, script_file, script_parameters, su_as='oracle'):
+    @traced
+    def execute_oracle_sql_script(self, script_file, script_parameters, su_as='oracle', local_script=False):
         """
         :param script_file: A string of the full path and file name of the sql script (String)
         :param script_parameters: A list or tuple of the parameters for the script (String)
         :param su_as: The name of the user su as to run/execute the command (String)
+        :param local_script: script_file is a local script, run from the remote script cache (Bool)
         :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
 
         Executes an SQL script as the oracle user
         """
-        if not isinstance(script_file, (str, basestring, unicode)):
-            raise TypeError('script_file input variable is not a string or unicode type.')
-        if not isinstance(script_parameters, (list, tuple)):
-            raise TypeError('script_parameters input variable is not a list or tuple.')
+        if local_script:
+            return self._run_cached_script(script_file, su_as,
+                                           lambda cached_path: self._execute_oracle_sql_script_step(
+                                               cached_path, script_parameters, su_as))
+        return self._run_step(self._execute_oracle_sql_script_step(script_file, script_parameters, su_as))
 
-        status, file_exists = self._check_if_file_or_directory_exists(script_file)
-        if status and not file_exists:
-            message = u"The script file '{SCRIPT_FILE}' on {HOSTNAME} " \
-                      u"does not exist, cannot execute it.".format(SCRIPT_FILE=script_file,
-                                                                   HOSTNAME=self.hostname)
-            return True, message, False
-        elif not status:
-            message = u"Unable to determine if the script file '{SCRIPT_FILE}' on {HOSTNAME} " \
-                      u"exists, cannot execute it.".format(SCRIPT_FILE=script_file,
-                                                           HOSTNAME=self.hostname)
-            return False, message, None
+    @traced
+    def execute_oracle_sql_script_streaming(self, script_file, script_parameters, su_as='oracle',
+                                            abort_on_errors=(), tail_size=65536):
+        """
+        :param script_file: A string of the full path and file name of the sql script (String)
+        :param script_parameters: A list or tuple of the parameters for the script (String)
+        :param su_as: The name of the user su as to run/execute the command (String)
+        :param abort_on_errors: ORA codes, like 'ORA-01653', which kill the sqlplus session as soon as they appear (List)
+        :param tail_size: The number of trailing output characters kept in memory (Int)
+        :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool),
+        list of error dicts with the keys code and message (List)
 
-        # build up command
-        script_parameters_flattened = self._flatten_list_for_command(script_parameters)
+        Executes an SQL script as the oracle user, scanning the output for ORA- errors while it is produced
+        instead of buffering all of it.
+        """
+        step = self._execute_oracle_sql_script_step(script_file, script_parameters, su_as)
+
+        status, missing_file = self._find_missing_file(step.check_paths)
+        if status and missing_file:
+            return step.missing_result(missing_file, self.hostname) + ([],)
+        elif not status:
+            return step.unknown_result(self.hostname) + ([],)
 
+        scanner = oracle.OracleOutputScanner(abort_on_errors=abort_on_errors, tail_size=tail_size)
         sudo_su = self._sudo_su_command(su_as)
-        if script_parameters:
-            command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
-                       'sqlplus / as sysdba @{SCRIPT_FILE} {PARAMETERS}'.format(SCRIPT_FILE=script_file,
-                                                                                PARAMETERS=script_parameters_flattened)]
-        else:
-            command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
-                       'sqlplus / as sysdba @{SCRIPT_FILE}'.format(SCRIPT_FILE=script_file)]
+        command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
+                   step.command]
 
         # execute command
-        result = self.execute_remote_command(command)
+        result = self._stream_remote_command(command, scanner.feed)
+        scanner.close()
 
-        if result.get('status') and result.get('exit_code') == 0:
-            if re.search('ORA-01543', result.get('stdout')):
-                return True, u"Error ORA-01543: Oracle Tablespace already exists. Unable to create Tablespace.", False
-            if re.search('ORA-01920', result.get('stdout')):
-                return True, u"Error ORA-01920: Oracle User already exists. Unable to create user.", False
-            if re.search('ORA-00959', result.get('stdout')):
-                return True, u"Error ORA-00959: Oracle Tablespace does not exist. Unable to create user.", False
-            if re.search('ORA-\d{5}', result.get('stdout')):
-                errors = re.findall('ORA-\d{5}', result.get('stdout'))
-                if len(errors) > 1:
-                    error_message = u"Oracle errors occurred {0}."
-                else:
-                    error_message = u"Oracle error occurred {0}."
-                return True, error_message.format(', '.join(errors)), False
+        if scanner.abort_error:
+            message = u"Aborted sql script {0} after Oracle error {1}.".format(script_file, scanner.abort_error)
+            return True, message, False, scanner.errors
+        if result.get('status') and result.get('exit_code') == 0 and scanner.errors:
+            return True, oracle.oracle_errors_message(scanner.error_codes), False, scanner.errors
+        result['stdout'] = scanner.tail
         return self._parse_ssh_client_result(result,
-                                             success_message=u"Successfully executed sql script "
-                                                             u"{0}.".format(script_file),
-                                             error_message=u"Failed to execute script "
-                                                           u"{0}.".format(script_file))
+                                             success_message=step.success_message,
+                                             error_message=step.error_message) + (scanner.errors,)
+
+    def sqlplus_session(self, su_as='oracle', connect_string='/ as sysdba', abort_on_errors=()):
+        """
+        :param su_as: The name of the user su as to run sqlplus (String)
+        :param connect_string: The sqlplus logon (String)
+        :param abort_on_errors: ORA codes which end the session as soon as they appear (List)
+        :return: A SqlPlusSession which runs many sql scripts through one long lived sqlplus process
+        """
+        return SqlPlusSession(self, su_as=su_as, connect_string=connect_string, abort_on_errors=abort_on_errors)
+
+    def pipeline(self, stop_on_failure=True):
+        """
+        :param stop_on_failure: Do not run the remaining steps once a step fails (Bool)
+        :return: A RemotePipeline which queues Automation operations and runs them in one remote execution
+        """
+        return RemotePipeline(self, stop_on_failure=stop_on_failure)
+
+    def converge(self):
+        """
+        :return: A DesiredState which queues create_directory, change_file_ownership, mount_file_system and
+        unmount_file_system targets, reads their current state in one remote command and only runs the
+        operations which change something
+        """
+        return DesiredState(self)
+
+    @traced
+    def check_files_exist(self, file_paths, include_metadata=False, su_as='root'):
+        """
+        :param file_paths: A tuple or list of file names and/or paths on the remote system (Tuple or List)
+        :param include_metadata: Also return size, mtime, owner, group and mode for each path if True (Bool)
+        :param su_as: The name of the user su as to run/execute the command (String)
+        :return: A tuple of command execution status (Bool), dict of path to result dict (Dict)
+
+        Checks any number of paths in one remote command. Each result dict has a type of
+        'file', 'directory' or 'missing'; size, mtime (epoch seconds), owner, group and mode (octal String)
+        are None unless include_metadata is True and the path exists.
+        """
+        results, uncached_paths = self._cached_file_stats(file_paths, include_metadata, su_as)
+        if not uncached_paths:
+            return True, results
+
+        sudo_su = self._sudo_su_command(su_as)
+        command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
+                   self._build_file_stat_command(uncached_paths, include_metadata)]
+
+        # execute command
+        result = self.execute_remote_command(command)
+        return self._merge_file_stats(file_paths, uncached_paths, result, results, include_metadata, su_as)
 
     @staticmethod
     def _sudo_su_command(su_as):
@@ -366,7 +436,7 @@ class Automation(SshClient):
         :param su_as: The user name to su as (String)
         :return: The sudo su command with the requested user (String)
         """
-        if not isinstance(su_as, (str, basestring, unicode)):
+        if not isinstance(su_as, string_types):
             raise TypeError('su_as input variable is not a string or unicode type.')
         su_as = su_as.lower()
         if re.match('^root$', su_as):
@@ -384,39 +454,795 @@ class Automation(SshClient):
         """
         return ' '.join(values)
 
+    def _run_step(self, step):
+        """
+        :param step: The RemoteStep to run (RemoteStep)
+        :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
+
+        Checks the step's paths in one round trip, then runs its command as su_as and parses the result.
+        """
+        if step.check_paths:
+            status, missing_file = self._find_missing_file(step.check_paths)
+            if status and missing_file:
+                return step.missing_result(missing_file, self.hostname)
+            elif not status:
+                return step.unknown_result(self.hostname)
+
+        sudo_su = self._sudo_su_command(step.su_as)
+        command = ['{SUDO_SU}'.format(SUDO_SU=sudo_su),
+                   step.command]
+
+        # execute command
+        result = self.execute_remote_command(command)
+        step_result = step.parse(result)
+        self._update_metadata_cache(step, step_result[0] and step_result[2])
+        return step_result
+
+    def _run_cached_script(self, local_path, su_as, build_step):
+        """
+        :param local_path: The local script (String)
+        :param su_as: The name of the user su as to run the script (String)
+        :param build_step: Called with the remote path of the cached script, returns the RemoteStep to run (Callable)
+        :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
+
+        The script is run from a directory named after its sha256 in script_cache_directory. The run command
+        checks the cached copy itself, so a script which is already cached costs one round trip and no
+        transfer. Otherwise the script is sent, verified and moved into the cache as root and run again. The
+        cache is refused unless it and every directory above it are owned by root and not writable by others.
+        """
+        if not isinstance(local_path, string_types):
+            raise TypeError('script_file_name input variable is not a string or unicode type.')
+        if not os.path.isfile(local_path):
+            return True, u"The local script '{0}' does not exist, cannot execute it.".format(local_path), False
+
+        digest = transfer.local_file_digest(local_path)
+        cached_path = script_cache.cached_script_path(self.script_cache_directory, digest, local_path)
+        step = build_step(cached_path)
+        command = [self._sudo_su_command(step.su_as),
+                   script_cache.build_run_if_cached_command(cached_path, digest, step.command)]
+
+        result = self.execute_remote_command(command)
+        if result.get('status') and script_cache.is_missing(result.get('stdout')):
+            error_message = u"Failed to cache script {0} on {1}; {2}".format(local_path, self.hostname,
+                                                                             step.error_message)
+            for install_command in script_cache.build_install_commands(local_path, cached_path, digest,
+                                                                       self.max_command_line_length):
+                install_result = self.execute_remote_command([self._sudo_su_command('root'), install_command])
+                if not install_result.get('status') or install_result.get('exit_code') != 0:
+                    return self._parse_ssh_client_result(install_result, error_message=error_message)
+                outcome = script_cache.install_outcome(install_result.get('stdout'))
+                if outcome == 'untrusted':
+                    return True, u"{0} The cache directory {1} could not be created, or it or a directory above it " \
+                                 u"is not owned by root or is writable by other users.".format(
+                                     error_message, self.script_cache_directory), False
+            if outcome == 'mismatch':
+                return True, u"{0} The copy sent did not match the local script.".format(error_message), False
+            elif outcome != 'installed':
+                return True, u"{0} It could not be moved into the cache.".format(error_message), False
+            result = self.execute_remote_command(command)
+        return step.parse(result)
+
+    def _run_batch_mount_script(self, script, steps, su_as):
+        """
+        :param script: A script built by mounts.build_batch_mount_script or build_batch_unmount_script (String)
+        :param steps: The mount or unmount RemoteStep of every entry, used for its messages (List)
+        :return: A tuple of the dict returned from execute_remote_command, a list with the marker fields
+        of every entry, None for an entry which reported nothing (List)
+        """
+        result = self.execute_remote_command([self._sudo_su_command(su_as), script])
+        if not result.get('status'):
+            return result, [None] * len(steps)
+
+        entries = mounts.parse_batch_output(len(steps), result.get('stdout'))
+        for step, fields in zip(steps, entries):
+            self._update_metadata_cache(step, bool(fields) and fields[0] != 'missing')
+        return result, entries
+
+    @staticmethod
+    def _parse_batch_mount_fields(step, fields):
+        """
+        :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
+        """
+        if fields and fields[0] == 'done' and len(fields) >= 3 and fields[1].isdigit():
+            if int(fields[1]) == 0:
+                return True, step.success_message, True
+            output = '|'.join(fields[2:]).strip()
+            return True, u"{0} {1}".format(step.error_message, output) if output else step.error_message, False
+        return True, step.error_message, False
+
+    def _run_bulk_step(self, step, files):
+        """
+        :param step: The RemoteStep whose command is a script built by bulk.build_bulk_script (RemoteStep)
+        :param files: Any iterable of paths, read once (Iterable)
+        :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
+
+        The paths are checked and acted on by the remote script in one command, so the number of round trips
+        does not grow with the number of files. The command runs without a pseudo terminal so the NUL
+        delimited paths reach it unchanged.
+        """
+        if isinstance(files, string_types):
+            raise TypeError('files input variable is not an iterable of paths.')
+
+        command = [self._sudo_su_command(step.su_as), step.command]
+        command_string = connection_pool.build_command_string(command)
+        input_errors = []
+        bytes_sent = [0]
+
+        def stdin_chunks():
+            try:
+                for chunk in bulk.nul_delimited_chunks(files):
+                    bytes_sent[0] += len(chunk)
+                    yield chunk
+            except (TypeError, ValueError) as error:
+                # Stop before the closing empty record so the remote script does nothing
+                input_errors.append(error)
+                raise
+
+        pool = self.connection_pool or connection_pool.get_default_pool()
+        datetime_executed = datetime.now()
+        with child_span('execute_remote_command', su_as=self._su_as_from_command(command)) as span:
+            result = pool.execute_command(hostname=self.hostname,
+                                          username=self.username,
+                                          private_key_file=self.private_key_file,
+                                          command=command,
+                                          command_timeout=self.command_timeout,
+                                          port=getattr(self, 'port', 22),
+                                          connection_timeout=self.connection_timeout,
+                                          stdin_data=stdin_chunks(),
+                                          get_pty=False)
+            span.record(round_trips=1,
+                        bytes_out=len(command_string) + bytes_sent[0],
+                        bytes_in=len(result.get('stdout') or '') + len(result.get('stderr') or ''),
+                        exit_code=result.get('exit_code'))
+        self._log_remote_command_result('Execute remote command with paths on stdin', command, result,
+                                        datetime_executed)
+        if input_errors:
+            raise input_errors[0]
+
+        if self.metadata_cache is not None:
+            # The paths were streamed, not kept, so drop everything the command may have changed
+            self.metadata_cache.invalidate(self.hostname)
+
+        output = bulk.parse_bulk_output(result.get('stdout'))
+        if result.get('status') and output['missing'] is not None:
+            return step.missing_result(output['missing'], self.hostname)
+        if result.get('status') and not output['complete']:
+            return True, u"{0} The file list did not arrive complete.".format(step.error_message), False
+        success_message = step.success_message.format(COUNT=output['count'])
+        return self._parse_ssh_client_result(dict(result, exit_code=output['exit_code']),
+                                             success_message=success_message,
+                                             error_message=step.error_message)
+
+    def _update_metadata_cache(self, step, succeeded):
+        """
+        :param step: The RemoteStep whose command was run (RemoteStep)
+        :param succeeded: If the command succeeded (Bool)
+        """
+        if self.metadata_cache is None:
+            return
+        self.metadata_cache.forget_metadata(self.hostname, step.changes_metadata)
+        self.metadata_cache.invalidate(self.hostname, step.invalidates + step.removes + step.creates_directories,
+                                       trees=step.invalidates_trees)
+        if succeeded:
+            for path in step.removes:
+                self.metadata_cache.mark_missing(self.hostname, path)
+            for path in step.creates_directories:
+                self.metadata_cache.mark_directory(self.hostname, path)
+
+    def _execute_shell_script_step(self, script_file_name, su_as='root'):
+        if not isinstance(script_file_name, string_types):
+            raise TypeError('destination_directory input variable is not a string or unicode type.')
+
+        script_file_name = script_file_name.rstrip('/')
+
+        return RemoteStep(name='execute_shell_script',
+                          command='sh {SCRIPT}'.format(SCRIPT=script_file_name),
+                          su_as=su_as,
+                          check_paths=[script_file_name],
+                          missing_message=u"The script '{PATH}' on {HOSTNAME} does not exist, cannot execute it.",
+                          unknown_message=u"Unable to determine if the script '{PATHS}' on {HOSTNAME} "
+                                          u"exists, cannot execute it.",
+                          success_message=u"Successfully executed script {0}.".format(script_file_name),
+                          error_message=u"Failed to execute script {0}.".format(script_file_name),
+                          result_parser=self._parse_ssh_client_result)
+
+    def _move_files_step(self, files, destination_directory, su_as='root'):
+        if not isinstance(destination_directory, string_types):
+            raise TypeError('destination_directory input variable is not a string or unicode type.')
+
+        # build up command
+        source_files_with_path = self._flatten_list_for_command(files)
+
+        return RemoteStep(name='move_files',
+                          command='mv {SOURCE_FILES} {DESTINATION_DIRECTORY}'.format(
+                              SOURCE_FILES=source_files_with_path,
+                              DESTINATION_DIRECTORY=destination_directory),
+                          su_as=su_as,
+                          check_paths=files,
+                          missing_message=u"The source file '{PATH}' on {HOSTNAME} does not exist, cannot move it.",
+                          unknown_message=u"Unable to determine if the source files '{PATHS}' on {HOSTNAME} "
+                                          u"exist, cannot move them.",
+                          success_message=u"Successfully moved files to folder {0}.".format(destination_directory),
+                          error_message=u"Failed to moved files to folder {0}.".format(destination_directory),
+                          result_parser=self._parse_ssh_client_result,
+                          invalidates=[destination_directory.rstrip('/')] +
+                                      [posixpath.join(destination_directory, posixpath.basename(file_name))
+                                       for file_name in files],
+                          removes=files)
+
+    def _bulk_move_files_step(self, destination_directory, su_as='root'):
+        if not isinstance(destination_directory, string_types):
+            raise TypeError('destination_directory input variable is not a string or unicode type.')
+
+        return RemoteStep(name='move_files',
+                          command=bulk.build_bulk_script('sh -c \'mv "$@" "$0"\' {DESTINATION_DIRECTORY}'.format(
+                              DESTINATION_DIRECTORY=quote(destination_directory))),
+                          su_as=su_as,
+                          missing_message=u"The source file '{PATH}' on {HOSTNAME} does not exist, cannot move it.",
+                          success_message=u"Successfully moved {{COUNT}} files to folder {0}.".format(
+                              destination_directory),
+                          error_message=u"Failed to moved files to folder {0}.".format(destination_directory))
+
+    def _mount_file_system_step(self, source_file_system, mount_directory, su_as='root'):
+        if not isinstance(source_file_system, string_types):
+            raise TypeError('source_file_system input variable is not a string or unicode type.')
+        if not isinstance(mount_directory, string_types):
+            raise TypeError('mount_directory input variable is not a string or unicode type.')
+
+        source_file_system = source_file_system.rstrip('/')
+        mount_directory = mount_directory.rstrip('/')
+
+        return RemoteStep(name='mount_file_system',
+                          command='mount {SOURCE_FS} {MOUNT_DIR}'.format(SOURCE_FS=source_file_system,
+                                                                         MOUNT_DIR=mount_directory),
+                          su_as=su_as,
+                          check_paths=[mount_directory],
+                          missing_message=u"The mount directory '{PATH}' on {HOSTNAME} "
+                                          u"does not exist, cannot mount to it.",
+                          unknown_message=u"Unable to determine if the mount directory '{PATHS}' on {HOSTNAME} "
+                                          u"exists, cannot mount to it.",
+                          success_message=u"Successfully mounted file system: '{0}' to the mount "
+                                          u"folder: '{1}'.".format(source_file_system, mount_directory),
+                          error_message=u"Failed to mounted file system: '{0}' to the "
+                                        u"mount folder: '{1}'.".format(source_file_system, mount_directory),
+                          result_parser=self._parse_ssh_client_result,
+                          invalidates_trees=[mount_directory])
+
+    def _unmount_file_system_step(self, mount_directory, su_as='root'):
+        if not isinstance(mount_directory, string_types):
+            raise TypeError('mount_directory input variable is not a string or unicode type.')
+
+        mount_directory = mount_directory.rstrip('/')
+
+        return RemoteStep(name='unmount_file_system',
+                          command='umount -f {MOUNT_DIR}'.format(MOUNT_DIR=mount_directory),
+                          su_as=su_as,
+                          check_paths=[mount_directory],
+                          missing_message=u"The mount directory '{PATH}' on {HOSTNAME} "
+                                          u"does not exist, cannot unmount it.",
+                          unknown_message=u"Unable to determine if the mount directory '{PATHS}' on {HOSTNAME} "
+                                          u"exists, cannot unmount it.",
+                          success_message=u"Successfully unmounted file system from mount "
+                                          u"folder: '{0}'.".format(mount_directory),
+                          error_message=u"Failed to unmounted file system mount "
+                                        u"folder: '{0}'.".format(mount_directory),
+                          result_parser=self._parse_ssh_client_result,
+                          invalidates_trees=[mount_directory])
+
+    def _change_file_ownership_step(self, chown_username, files, chown_groupname='', recursive=False, su_as='root'):
+        if not isinstance(chown_username, string_types):
+            raise TypeError('chown_username input variable is not a string or unicode type.')
+        if not isinstance(chown_groupname, string_types):
+            raise TypeError('chown_groupname input variable is not a string or unicode type.')
+        if not isinstance(files, (tuple, list)):
+            raise TypeError('files input variable is not a list or tuple.')
+
+        # build up command
+        files_flattened = self._flatten_list_for_command(files)
+
+        # Set chown command options
+        if recursive:
+            chown_command = 'chown -R'
+        else:
+            chown_command = 'chown'
+
+        if not chown_groupname:
+            command = '{CHOWN} {USERNAME} {SOURCE_FILES}'.format(CHOWN=chown_command,
+                                                                 USERNAME=chown_username,
+                                                                 SOURCE_FILES=files_flattened)
+        else:
+            command = '{CHOWN} {USERNAME}.{GROUPNAME} {SOURCE_FILES}'.format(CHOWN=chown_command,
+                                                                             USERNAME=chown_username,
+                                                                             GROUPNAME=chown_groupname,
+                                                                             SOURCE_FILES=files_flattened)
+
+        return RemoteStep(name='change_file_ownership',
+                          command=command,
+                          su_as=su_as,
+                          check_paths=files,
+                          missing_message=u"The file '{PATH}' on {HOSTNAME} "
+                                          u"does not exist, cannot change ownership on it.",
+                          unknown_message=u"Unable to determine if the files '{PATHS}' on {HOSTNAME} "
+                                          u"exist, cannot change ownership on them.",
+                          success_message=u"Successfully changed ownership "
+                                          u"on files {0} to the username {1}.".format(chown_username,
+                                                                                      files_flattened),
+                          error_message=u"Failed to change ownership on "
+                                        u"files {0} to the username {1}.".format(files_flattened,
+                                                                                 chown_username),
+                          result_parser=self._parse_ssh_client_result,
+                          changes_metadata=files,
+                          invalidates_trees=files if recursive else ())
+
+    def _bulk_change_file_ownership_step(self, chown_username, chown_groupname='', recursive=False, su_as='root'):
+        if not isinstance(chown_username, string_types):
+            raise TypeError('chown_username input variable is not a string or unicode type.')
+        if not isinstance(chown_groupname, string_types):
+            raise TypeError('chown_groupname input variable is not a string or unicode type.')
+
+        owner = '{0}.{1}'.format(chown_username, chown_groupname) if chown_groupname else chown_username
+        return RemoteStep(name='change_file_ownership',
+                          command=bulk.build_bulk_script('chown {RECURSIVE}{OWNER}'.format(
+                              RECURSIVE='-R ' if recursive else '', OWNER=quote(owner))),
+                          su_as=su_as,
+                          missing_message=u"The file '{PATH}' on {HOSTNAME} "
+                                          u"does not exist, cannot change ownership on it.",
+                          success_message=u"Successfully changed ownership "
+                                          u"on {{COUNT}} files to the username {0}.".format(chown_username),
+                          error_message=u"Failed to change ownership on files to the username {0}.".format(
+                              chown_username))
+
+    def _create_directory_step(self, folder_path_name, su_as='root'):
+        if not isinstance(folder_path_name, string_types):
+            raise TypeError('folder_path_name input variable is not a string or unicode type.')
+
+        folder_path_name = folder_path_name.rstrip('/')
+
+        return RemoteStep(name='create_directory',
+                          command='mkdir -p {DIRECTORY}'.format(DIRECTORY=folder_path_name),
+                          su_as=su_as,
+                          success_message=u"Successfully created folder {0}.".format(folder_path_name),
+                          error_message=u"Failed to create folder {0}.".format(folder_path_name),
+                          result_parser=self._parse_ssh_client_result,
+                          creates_directories=[folder_path_name])
+
+    def _execute_oracle_sql_script_step(self, script_file, script_parameters, su_as='oracle'):
+        if not isinstance(script_file, string_types):
+            raise TypeError('script_file input variable is not a string or unicode type.')
+        if not isinstance(script_parameters, (list, tuple)):
+            raise TypeError('script_parameters input variable is not a list or tuple.')
+
+        # build up command
+        script_parameters_flattened = self._flatten_list_for_command(script_parameters)
+
+        if script_parameters:
+            command = 'sqlplus / as sysdba @{SCRIPT_FILE} {PARAMETERS}'.format(SCRIPT_FILE=script_file,
+                                                                               PARAMETERS=script_parameters_flattened)
+        else:
+            command = 'sqlplus / as sysdba @{SCRIPT_FILE}'.format(SCRIPT_FILE=script_file)
+
+        return RemoteStep(name='execute_oracle_sql_script',
+                          command=command,
+                          su_as=su_as,
+                          check_paths=[script_file],
+                          missing_message=u"The script file '{PATH}' on {HOSTNAME} "
+                                          u"does not exist, cannot execute it.",
+                          unknown_message=u"Unable to determine if the script file '{PATHS}' on {HOSTNAME} "
+                                          u"exists, cannot execute it.",
+                          success_message=u"Successfully executed sql script {0}.".format(script_file),
+                          error_message=u"Failed to execute script {0}.".format(script_file),
+                          result_parser=self._parse_oracle_sql_result,
+                          failure_pattern=ORACLE_ERROR_PATTERN)
+
     def _check_if_file_or_directory_exists(self, file_path):
         """
         :param file_path: File name and/or path on the remote system where to check if the file or directory exists
         :return: A tuple of command_execution_status (Bool), if file or directory exists (Bool)
         """
-        command = ['sudo su -',
-                   '[ -f {FILE_PATH} ] && echo True || [ -d {FILE_PATH} ] && echo True || echo False'.format(FILE_PATH=file_path)]
+        status, results = self.check_files_exist([file_path])
+        if not status:
+            return False, None
+        return True, results[file_path]['type'] != 'missing'
 
-        # execute command
-        result = self.execute_remote_command(command)
+    def _find_missing_file(self, file_paths):
+        """
+        :param file_paths: A tuple or list of file names and/or paths on the remote system (Tuple or List)
+        :return: A tuple of command_execution_status (Bool), the first path that does not exist or None (String)
+
+        Checks all of the paths in a single remote command and returns the first missing one in input order
+        """
+        status, results = self.check_files_exist(file_paths)
+        if not status:
+            return False, None
+        for file_path in file_paths:
+            if results[file_path]['type'] == 'missing':
+                return True, file_path
+        return True, None
+
+    def _cached_file_stats(self, file_paths, include_metadata, su_as):
+        """
+        :return: A tuple of the dict of path to result dict answered from the metadata cache (Dict),
+        list of paths which have to be checked on the remote system (List)
+        """
+        if not isinstance(file_paths, (tuple, list)):
+            raise TypeError('file_paths input variable is not a list or tuple.')
+        for index, file_path in enumerate(file_paths):
+            if not isinstance(file_path, string_types):
+                raise TypeError('file_paths input variable at index {0} is not a string or unicode type.'.format(index))
 
-        try:
-            if result.get('status'):
-                stdout = result.get('stdout').split('\n')[1]
-                if 'True' in stdout:
-                    command_execution_status = True
-                    file_exists = True
-                elif 'False' in stdout:
-                    command_execution_status = True
-                    file_exists = False
-                else:
-                    command_execution_status = False
-                    file_exists = None
+        file_paths = list(file_paths)
+        results = {}
+        if self.metadata_cache is None:
+            return results, file_paths
+        uncached_paths = []
+        for file_path in file_paths:
+            cached = self.metadata_cache.get(self.hostname, file_path, su_as, include_metadata)
+            if cached is None:
+                uncached_paths.append(file_path)
             else:
-                command_execution_status = False
-                file_exists = None
-        except IndexError:
-            command_execution_status = False
-            file_exists = None
-        except AttributeError:
-            command_execution_status = False
-            file_exists = None
-        return command_execution_status, file_exists
+                results[file_path] = cached
+        return results, uncached_paths
+
+    def _merge_file_stats(self, file_paths, uncached_paths, result, results, include_metadata, su_as):
+        """
+        :param result: The result dict of the remote stat command (Dict)
+        :param results: The results answered from the metadata cache, updated in place (Dict)
+        :return: A tuple of command execution status (Bool), dict of path to result dict (Dict)
+        """
+        if not result.get('status') or not isinstance(result.get('stdout'), string_types):
+            return False, results
+
+        remote_results = self._parse_file_stat_output(uncached_paths, result.get('stdout'))
+        if self.metadata_cache is not None:
+            for file_path, file_result in remote_results.items():
+                self.metadata_cache.set(self.hostname, file_path, file_result, su_as, include_metadata)
+        results.update(remote_results)
+        command_execution_status = all(file_path in results for file_path in file_paths)
+        return command_execution_status, results
+
+    @staticmethod
+    def _build_file_stat_command(file_paths, include_metadata=False):
+        """
+        :param file_paths: A tuple or list of file names and/or paths on the remote system (Tuple or List)
+        :param include_metadata: Also print size, mtime, owner, group and mode of each path if True (Bool)
+        :return: A single shell command which prints one marker line per path (String)
+        """
+        checks = []
+        for index, file_path in enumerate(file_paths):
+            quoted_path = quote(file_path)
+            check = 'if [ -f {PATH} ]; then t=file; elif [ -d {PATH} ]; then t=directory; ' \
+                    'else t=missing; fi; '.format(PATH=quoted_path)
+            if include_metadata:
+                check += 'printf \'%s|%s|%s|%s\\n\' {MARKER} {INDEX} "$t" ' \
+                         '"$(stat -c \'%s|%Y|%U|%G|%a\' {PATH} 2>/dev/null)"'.format(MARKER=FILE_STAT_MARKER,
+                                                                                    INDEX=index,
+                                                                                    PATH=quoted_path)
+            else:
+                check += 'printf \'%s|%s|%s\\n\' {MARKER} {INDEX} "$t"'.format(MARKER=FILE_STAT_MARKER,
+                                                                                INDEX=index)
+            checks.append(check)
+        return '; '.join(checks)
+
+    @staticmethod
+    def _parse_file_stat_output(file_paths, stdout):
+        """
+        :param file_paths: The tuple or list of paths the command was built from (Tuple or List)
+        :param stdout: The stdout of the command built by _build_file_stat_command (String)
+        :return: A dict of path to result dict with the keys type, size, mtime, owner, group and mode
+
+        Lines without a well formed marker, such as an echoed command line, are ignored.
+        """
+        results = {}
+        for line in stdout.splitlines():
+            position = line.find(FILE_STAT_MARKER + '|')
+            if position == -1:
+                continue
+            fields = line[position:].strip().split('|')
+            if len(fields) not in (3, 4, 8) or fields[2] not in FILE_TYPES:
+                continue
+            try:
+                file_path = file_paths[int(fields[1])]
+            except (ValueError, IndexError):
+                continue
+
+            result = {'type': fields[2], 'size': None, 'mtime': None, 'owner': None, 'group': None, 'mode': None}
+            if len(fields) == 8 and fields[2] != 'missing':
+                try:
+                    result['size'] = int(fields[3])
+                    result['mtime'] = int(fields[4])
+                except ValueError:
+                    pass
+                result['owner'] = fields[5] or None
+                result['group'] = fields[6] or None
+                result['mode'] = fields[7] or None
+            results[file_path] = result
+        return results
+
+    def _execute_remote_command(self, command):
+        if not self.use_connection_pool:
+            return super(Automation, self).execute_remote_command(command)
+        if self.use_elevated_shells and len(command) > 1 and command[0].startswith('sudo su'):
+            return elevated_shell.get_default_manager().execute(self, command[0], '; '.join(command[1:]))
+        pool = self.connection_pool or connection_pool.get_default_pool()
+        return pool.execute_command(hostname=self.hostname,
+                                    username=self.username,
+                                    private_key_file=self.private_key_file,
+                                    command=command,
+                                    command_timeout=self.command_timeout,
+                                    port=getattr(self, 'port', 22),
+                                    connection_timeout=self.connection_timeout)
+
+    @staticmethod
+    def _su_as_from_command(command):
+        """
+        :param command: A list of command parts, the first part may be a sudo su prefix (List)
+        :return: The user the command runs as, or None if it does not use sudo su (String)
+        """
+        if len(command) > 1 and command[0].startswith('sudo su'):
+            return command[0][len('sudo su -'):].strip() or 'root'
+        return None
+
+    def _log_command_results(self, **kwargs):
+        """
+        Queue the command results on the result log, timed as a log_results span. The disk is written by the
+        result log's writer thread. The command and its output are dropped unless log_command_output is True.
+        """
+        if not self.log_command_output:
+            for field in COMMAND_OUTPUT_FIELDS:
+                kwargs.pop(field, None)
+        with child_span('log_results'):
+            self.result_log.log(**kwargs)
+
+    def _log_remote_command_result(self, action, command, result, datetime_executed):
+        """
+        :param action: What the command was run for (String)
+        :param command: A list of command parts, the first part may be a sudo su prefix (List)
+        :param result: The dict returned from running the command (Dict)
+        :param datetime_executed: When the command was started (Datetime)
+        """
+        self._log_command_results(command=command,
+                                  datetime_executed=datetime_executed,
+                                  action=action,
+                                  returncode=result.get('exit_code'),
+                                  stdout=result.get('stdout'),
+                                  stderr=result.get('stderr'),
+                                  server=self.hostname,
+                                  ssh_status=result.get('status'),
+                                  msg=result.get('msg'))
+
+    def _sftp_copy_files(self, files, destination_directory, skip_unchanged=True):
+        """
+        :param files: tuple or list of local files to upload (Tuple or List)
+        :param destination_directory: the directory the files will be copied to on the destination server (String)
+        :param skip_unchanged: Do not upload files whose remote copy has the same size and hash (Bool)
+        :return: Tuple of command execution status (Bool), Result Message (String)
+
+        Uploads over SFTP on the pooled transport with several files in flight at once. When skip_unchanged
+        is True a single remote command hashes every remote copy which already has the local file's size.
+        """
+        uploads = [(file_name, transfer.remote_path_for(file_name, destination_directory)) for file_name in files]
+
+        unchanged = []
+        if skip_unchanged and uploads:
+            remote_files = [(remote_path, os.path.getsize(local_path)) for local_path, remote_path in uploads]
+            result = self.execute_remote_command([transfer.build_remote_digest_command(remote_files)])
+            if result.get('status') and result.get('exit_code') == 0:
+                remote_digests = transfer.parse_remote_digest_output(remote_files, result.get('stdout'))
+                for local_path, remote_path in uploads:
+                    if remote_path in remote_digests and \
+                            remote_digests[remote_path] == transfer.local_file_digest(local_path):
+                        unchanged.append(local_path)
+            uploads = [upload for upload in uploads if upload[0] not in unchanged]
+
+        pool = self.connection_pool or connection_pool.get_default_pool()
+        errors = {}
+        if uploads:
+            try:
+                with pool.connection(self.hostname, self.username, self.private_key_file,
+                                     getattr(self, 'port', 22), self.connection_timeout) as client:
+                    with child_span('sftp_upload') as span:
+                        errors = transfer.upload_files(client.get_transport(), uploads, self.max_transfers_in_flight)
+                        span.record(round_trips=1,
+                                    bytes_out=sum(os.path.getsize(local_path) for local_path, remote_path in uploads
+                                                  if local_path not in errors))
+            except Exception as error:
+                errors = dict((local_path, u"{0}".format(error)) for local_path, remote_path in uploads)
+
+        stdout = u'\n'.join([u"skipped unchanged {0}".format(file_name) for file_name in unchanged] +
+                             [u"uploaded {0} to {1}".format(local_path, remote_path)
+                              for local_path, remote_path in uploads if local_path not in errors])
+        stderr = u'\n'.join(u"failed {0}: {1}".format(local_path, error) for local_path, error in errors.items())
+        self._log_command_results(command=['sftp'] + list(files) + [destination_directory],
+                                  datetime_executed=datetime.now(),
+                                  action='SFTP Files to remote server',
+                                  returncode=1 if errors else 0,
+                                  stdout=stdout,
+                                  stderr=stderr,
+                                  server=self.hostname)
+
+        if errors:
+            return False, u"Failed to sftp files {0} to {HOSTNAME}.".format(', '.join(sorted(errors)),
+                                                                           HOSTNAME=self.hostname)
+        return True, u"Successfully sftp files to {HOSTNAME}, {UPLOADED} uploaded and " \
+                     u"{UNCHANGED} unchanged.".format(HOSTNAME=self.hostname,
+                                                      UPLOADED=len(uploads),
+                                                      UNCHANGED=len(unchanged))
+
+    def _ranged_copy_files(self, files, destination_directory, skip_unchanged=True):
+        """
+        :param files: tuple or list of local files to upload (Tuple or List)
+        :param destination_directory: the directory the files will be copied to on the destination server (String)
+        :param skip_unchanged: Do not upload files whose remote copy has the same size and hash (Bool)
+        :return: Tuple of command execution status (Bool), Result Message (String)
+
+        Splits every file into ranges of transfer_chunk_size bytes which are written into a partial file over
+        max_transfers_in_flight pooled connections at once, gzipped on the fly if transfer_compression is True.
+        Each range is hashed again on the remote side and recorded in a manifest next to the partial file, so
+        copying the same file again after a failure only sends the ranges which were not verified. The
+        partial file is moved into place once its whole file hash matches.
+        """
+        all_plans = [transfer.plan_ranged_upload(file_name,
+                                                 transfer.remote_path_for(file_name, destination_directory),
+                                                 self.transfer_chunk_size) for file_name in files]
+        if not all_plans:
+            return True, u"Successfully copied files to {HOSTNAME}, 0 uploaded.".format(HOSTNAME=self.hostname)
+
+        # One command finds unchanged remote copies and the verified ranges of partial uploads
+        query = transfer.build_resume_query_command(all_plans)
+        if skip_unchanged:
+            remote_files = [(plan['remote_path'], plan['size']) for plan in all_plans]
+            query = '{0}; {1}'.format(transfer.build_remote_digest_command(remote_files), query)
+        result = self.execute_remote_command([query])
+        if not result.get('status') or result.get('exit_code') != 0:
+            return False, u"Unable to check the partial uploads on {HOSTNAME}.".format(HOSTNAME=self.hostname)
+        verified = transfer.parse_resume_query_output(all_plans, result.get('stdout'))
+        remote_digests = {}
+        if skip_unchanged:
+            remote_digests = transfer.parse_remote_digest_output(remote_files, result.get('stdout'))
+
+        unchanged = []
+        plans = []
+        verified_chunks = []
+        for plan, plan_verified in zip(all_plans, verified):
+            if remote_digests.get(plan['remote_path']) == plan['digest']:
+                unchanged.append(plan['local_path'])
+            else:
+                plans.append(plan)
+                verified_chunks.append(plan_verified)
+
+        errors = {}
+        fresh = [index for index, plan_verified in enumerate(verified_chunks) if plan_verified is None]
+        if fresh:
+            result = self.execute_remote_command([transfer.build_resume_start_command([plans[index]
+                                                                                       for index in fresh])])
+            ready = transfer.parse_marker_results(len(fresh), result.get('stdout') or u'')
+            for position, index in enumerate(fresh):
+                verified_chunks[index] = set()
+                if ready.get(position) != 'ready':
+                    errors[index] = u"Unable to create {0}.".format(plans[index]['partial_path'])
+
+        pending_chunks = [(index, chunk) for index, plan in enumerate(plans) if index not in errors
+                          for chunk in plan['chunks'] if chunk[0] not in verified_chunks[index]]
+        resumed = sum(len(plan_verified) for plan_verified in verified_chunks)
+        if pending_chunks:
+            pool = self.connection_pool or connection_pool.get_default_pool()
+            with child_span('ranged_upload') as span:
+                range_errors, bytes_sent = transfer.upload_ranges(
+                    lambda: pool.connection(self.hostname, self.username, self.private_key_file,
+                                            getattr(self, 'port', 22), self.connection_timeout),
+                    plans, pending_chunks, self.max_transfers_in_flight, self.transfer_compression,
+                    command_timeout=self.command_timeout)
+                span.record(round_trips=len(pending_chunks), bytes_out=bytes_sent)
+            errors.update(range_errors)
+
+        finished = [index for index in range(len(plans)) if index not in errors]
+        if finished:
+            result = self.execute_remote_command([transfer.build_finish_command([plans[index]
+                                                                                 for index in finished])])
+            outcomes = transfer.parse_marker_results(len(finished), result.get('stdout') or u'')
+            for position, index in enumerate(finished):
+                if outcomes.get(position) != 'ok':
+                    errors[index] = u"The whole file check of {0} was {1}.".format(
+                        plans[index]['remote_path'], outcomes.get(position, 'not run'))
+
+        stdout = u'\n'.join([u"skipped unchanged {0}".format(file_name) for file_name in unchanged] +
+                             [u"uploaded {0} to {1}".format(plan['local_path'], plan['remote_path'])
+                              for index, plan in enumerate(plans) if index not in errors])
+        stderr = u'\n'.join(u"failed {0}: {1}".format(plans[index]['local_path'], error)
+                             for index, error in sorted(errors.items()))
+        self._log_command_results(command=['ranged'] + list(files) + [destination_directory],
+                                  datetime_executed=datetime.now(),
+                                  action='Ranged copy of files to remote server',
+                                  returncode=1 if errors else 0,
+                                  stdout=stdout,
+                                  stderr=stderr,
+                                  server=self.hostname)
+
+        if errors:
+            return False, u"Failed to copy files {0} to {HOSTNAME}.".format(
+                ', '.join(sorted(plans[index]['local_path'] for index in errors)), HOSTNAME=self.hostname)
+        return True, u"Successfully copied files to {HOSTNAME}, {UPLOADED} uploaded with {RESUMED} ranges " \
+                     u"resumed and {UNCHANGED} unchanged.".format(HOSTNAME=self.hostname,
+                                                                UPLOADED=len(plans),
+                                                                RESUMED=resumed,
+                                                                UNCHANGED=len(unchanged))
+
+    def _stream_remote_command(self, command, on_stdout):
+        """
+        :param command: A list of command parts, the first part may be a sudo su prefix (List)
+        :param on_stdout: Called with every chunk of output; returning False stops the command (Callable)
+        :return: A dict with the keys status, exit_code, aborted and msg
+
+        Without connection pooling the output cannot be streamed, so it is passed to on_stdout in one chunk.
+        """
+        with child_span('stream_remote_command', su_as=self._su_as_from_command(command)) as span:
+            if self.use_connection_pool:
+                datetime_executed = datetime.now()
+                received = [0]
+
+                def counting_on_stdout(data):
+                    received[0] += len(data)
+                    return on_stdout(data)
+
+                pool = self.connection_pool or connection_pool.get_default_pool()
+                result = pool.stream_command(hostname=self.hostname,
+                                             username=self.username,
+                                             private_key_file=self.private_key_file,
+                                             command=command,
+                                             on_stdout=counting_on_stdout,
+                                             command_timeout=self.command_timeout,
+                                             port=getattr(self, 'port', 22),
+                                             connection_timeout=self.connection_timeout)
+                span.record(round_trips=1,
+                            bytes_out=len(connection_pool.build_command_string(command)),
+                            bytes_in=received[0],
+                            exit_code=result.get('exit_code'))
+                # The output went to on_stdout as it arrived and was not kept
+                self._log_remote_command_result('Stream remote command', command, result, datetime_executed)
+                return result
+            result = self.execute_remote_command(command)
+            aborted = False
+            if result.get('stdout'):
+                aborted = on_stdout(result.get('stdout')) is False
+            result['aborted'] = aborted
+            return result
+
+    def _execute_local_command(self, command, round_trips=0):
+        """
+        :param command: The local command and its arguments (List)
+        :param round_trips: The round trips to the remote system the command makes, recorded on its span (Int)
+        :return: Tuple of stdout (String), stderr (String), returncode (Int)
+        """
+        with child_span('execute_command') as span:
+            if self.command_sleep is None:
+                stdout, stderr, returncode = local_command.execute_command(command=command,
+                                                                           command_timeout=self.command_timeout)
+            else:
+                stdout, stderr, returncode = bash_client.execute_command(command=command,
+                                                                         command_timeout=self.command_timeout,
+                                                                         command_sleep=self.command_sleep)
+            span.record(round_trips=round_trips, bytes_in=len(stdout or '') + len(stderr or ''), exit_code=returncode,
+                        status=returncode == 0)
+            return stdout, stderr, returncode
+
+    @classmethod
+    def _parse_oracle_sql_result(cls, result,
+                                 success_message=u"Successfully executed sql script.",
+                                 error_message=u"Failed to execute script."):
+        """
+        :param result: the result from ssh client
+        :param success_message: message for success
+        :param error_message:  message for failure
+        :return: Parses the returned sqlplus result into a tuple of ssh connection status (Bool),
+        Result Message (String), command execution status (Bool); ORA- errors in stdout fail the command
+        """
+        if result.get('status') and result.get('exit_code') == 0:
+            scanner = oracle.scan_oracle_output(result.get('stdout'))
+            if scanner.errors:
+                return True, oracle.oracle_errors_message(scanner.error_codes), False
+        return cls._parse_ssh_client_result(result,
+                                            success_message=success_message,
+                                            error_message=error_message)
 
     @staticmethod
     def _parse_ssh_client_result(result,
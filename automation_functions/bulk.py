@@ -0,0 +1,99 @@
+from automation_functions.compat import string_types
+
+
+BULK_MARKER = '__AF_BULK__'
+
+
+def nul_delimited_chunks(paths, chunk_size=32768):
+    """
+    :param paths: Any iterable of paths, it is read once and never held in memory as a whole (Iterable)
+    :param chunk_size: The approximate number of bytes per chunk (Int)
+    :return: A generator of NUL terminated paths in chunks of about chunk_size bytes, followed by an empty
+    record which tells the remote script the list is complete
+    """
+    chunk = []
+    size = 0
+    for index, path in enumerate(paths):
+        if not isinstance(path, string_types):
+            raise TypeError('files input variable at index {0} is not a string or unicode type.'.format(index))
+        if not isinstance(path, bytes):
+            path = path.encode('utf-8')
+        if not path or b'\0' in path:
+            raise ValueError('files input variable at index {0} is empty or contains a NUL character.'.format(index))
+        chunk.append(path + b'\0')
+        size += len(path) + 1
+        if size >= chunk_size:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+    chunk.append(b'\0')
+    yield b''.join(chunk)
+
+
+def build_bulk_script(command):
+    """
+    :param command: The command xargs runs with the paths appended, for example 'chown oracle' (String)
+    :return: A shell script which reads NUL delimited paths from stdin (String)
+
+    The paths are spooled to a temporary file, so neither side holds the list in memory. Nothing is run
+    unless the list ended with the empty record and every path exists, then xargs runs the command as
+    many times as the argument length limit requires. Marker lines report the first missing path, an
+    incomplete list, or the exit code and number of paths.
+    """
+    return ('af_list=$(mktemp) && af_paths=$(mktemp) || exit 1; '
+            'trap \'rm -f "$af_list" "$af_paths"\' EXIT; '
+            'cat > "$af_list"; '
+            'af_count=0; af_complete=0; '
+            'while IFS= read -r -d \'\' af_path; do '
+            'if [ -z "$af_path" ]; then af_complete=1; break; fi; '
+            'if [ ! -e "$af_path" ]; then printf \'%s|MISSING|%s\\n\' {MARKER} "$af_path"; exit 1; fi; '
+            'printf \'%s\\0\' "$af_path" >&4; '
+            'af_count=$((af_count + 1)); '
+            'done < "$af_list" 4> "$af_paths"; '
+            'if [ "$af_complete" != 1 ]; then printf \'%s|INCOMPLETE\\n\' {MARKER}; exit 1; fi; '
+            'xargs -0 -r {COMMAND} < "$af_paths" 2>&1; '
+            'af_rc=$?; '
+            'printf \'\\n%s|END|%s|%s\\n\' {MARKER} "$af_rc" "$af_count"; '
+            'exit $af_rc').format(MARKER=BULK_MARKER, COMMAND=command)
+
+
+def parse_bulk_output(stdout):
+    """
+    :param stdout: The output of a script built by build_bulk_script (String)
+    :return: A dict with the keys missing (the first missing path or None), complete (Bool),
+    exit_code (Int or None) and count (Int or None)
+    """
+    result = {'missing': None, 'complete': True, 'exit_code': None, 'count': None}
+    prefix = BULK_MARKER + '|'
+    for line in (stdout or '').splitlines():
+        position = line.find(prefix)
+        if position == -1:
+            continue
+        fields = line[position + len(prefix):].split('|')
+        if fields[0] == 'MISSING' and len(fields) >= 2:
+            result['missing'] = '|'.join(fields[1:])
+        elif fields[0] == 'INCOMPLETE':
+            result['complete'] = False
+        elif fields[0] == 'END' and len(fields) == 3 and fields[1].isdigit() and fields[2].isdigit():
+            result['exit_code'] = int(fields[1])
+            result['count'] = int(fields[2])
+    return result
+
+
+def chunk_arguments(arguments, max_length):
+    """
+    :param arguments: The arguments to split (List)
+    :param max_length: The longest total length of the arguments in one chunk, counting a separator each (Int)
+    :return: A generator of lists of arguments, every chunk holds at least one argument
+    """
+    chunk = []
+    length = 0
+    for argument in arguments:
+        if chunk and length + len(argument) + 1 > max_length:
+            yield chunk
+            chunk = []
+            length = 0
+        chunk.append(argument)
+        length += len(argument) + 1
+    if chunk:
+        yield chunk
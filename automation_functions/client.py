@@ -0,0 +1,215 @@
+import json
+import os
+import socket
+import threading
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+
+# The daemon serves one user, its socket lives in that user's runtime directory. Jobs run from cron have no
+# XDG_RUNTIME_DIR set and use the directory a login session of the same user gets
+DEFAULT_SOCKET_PATH = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or '/run/user/{0}'.format(os.getuid()),
+                                   'automation_functions.sock')
+
+# The Automation methods served by the daemon, all of them take and return plain JSON friendly values
+DAEMON_METHODS = ('execute_remote_command',
+                  'remote_copy_files',
+                  'execute_shell_script',
+                  'move_files',
+                  'mount_file_system',
+                  'unmount_file_system',
+                  'mount_file_systems',
+                  'unmount_file_systems',
+                  'change_file_ownership',
+                  'create_directory',
+                  'execute_oracle_sql_script',
+                  'execute_oracle_sql_script_streaming',
+                  'check_files_exist')
+
+# Methods returning a list of result tuples rather than one tuple
+LIST_RESULT_METHODS = ('mount_file_systems', 'unmount_file_systems')
+
+# The local path argument of each method as (position, keyword, position of local_script or None when the
+# path is always local), the daemon would resolve relative paths in its own working directory
+LOCAL_PATH_ARGUMENTS = {'remote_copy_files': (0, 'files', None),
+                        'execute_shell_script': (0, 'script_file_name', 2),
+                        'execute_oracle_sql_script': (0, 'script_file', 3)}
+
+
+class AutomationClient(object):
+    """
+    Calls Automation methods through the automation daemon on this machine.
+
+    Only the standard library is imported, so a short job starts in milliseconds and the connection to
+    the host is usually already open and authenticated in the daemon. Methods take the same arguments and
+    return the same values as on Automation.
+
+    client = AutomationClient(hostname=ip_address, username='cloud', private_key_file=key)
+    ssh_status, message, status = client.create_directory('/u01/app/oracle')
+
+    Start the daemon with python -m automation_functions.daemon.
+    """
+
+    def __init__(self, hostname, username, private_key_file, port=22, use_elevated_shells=False,
+                 socket_path=DEFAULT_SOCKET_PATH, timeout=None):
+        """
+        :param hostname: The host the methods run against (String)
+        :param username: The user to log in with (String)
+        :param private_key_file: The private key to log in with, read by the daemon (String)
+        :param port: The ssh port (Int)
+        :param use_elevated_shells: Run sudo su commands in the daemon's persistent login shells (Bool)
+        :param socket_path: The daemon's Unix socket, refused unless it is owned by this user (String)
+        :param timeout: Seconds to wait for the daemon to answer, None waits as long as the method runs (Int)
+        """
+        self.host = {'hostname': hostname,
+                     'username': username,
+                     'private_key_file': os.path.abspath(private_key_file),
+                     'port': port,
+                     'use_elevated_shells': use_elevated_shells}
+        self.hostname = hostname
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._socket = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name not in DAEMON_METHODS:
+            raise AttributeError('AutomationClient has no method named {0}.'.format(name))
+
+        def method(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        method.__name__ = name
+        return method
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def call(self, method_name, *args, **kwargs):
+        """
+        :param method_name: The name of the Automation method to call (String)
+        :return: What the method returned, with tuples restored
+        """
+        args, kwargs = absolute_local_paths(method_name, args, kwargs)
+        request = json.dumps({'host': self.host, 'method': method_name, 'args': args, 'kwargs': kwargs})
+        with self._lock:
+            try:
+                response = self._send(request.encode('utf-8') + b'\n')
+            except (socket.error, ValueError):
+                self.close()
+                raise
+
+        if 'error' in response:
+            raise exception_from_response(response['error'])
+        return restore_result(method_name, response['result'])
+
+    def close(self):
+        if self._socket is not None:
+            self._reader.close()
+            self._socket.close()
+            self._socket = None
+            self._reader = None
+
+    def _send(self, data):
+        """
+        :return: The decoded response (Dict)
+
+        A request which cannot be written on a kept connection, because the daemon restarted since the
+        last call, is sent once more on a new connection. Nothing is resent once it was written.
+        """
+        reused = self._socket is not None
+        try:
+            self._connect()
+            self._socket.sendall(data)
+        except socket.error:
+            if not reused:
+                raise
+            self.close()
+            self._connect()
+            self._socket.sendall(data)
+        line = self._reader.readline()
+        if not line:
+            raise socket.error('The automation daemon closed the connection.')
+        return json.loads(line.decode('utf-8'))
+
+    def _connect(self):
+        if self._socket is None:
+            owner = os.stat(self.socket_path).st_uid
+            if owner != os.getuid():
+                raise socket.error('The automation daemon socket {0} is owned by user id {1}, not by this '
+                                   'user.'.format(self.socket_path, owner))
+            connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            connection.settimeout(self.timeout)
+            connection.connect(self.socket_path)
+            self._socket = connection
+            self._reader = connection.makefile('rb')
+
+
+def absolute_local_paths(method_name, args, kwargs):
+    """
+    :param method_name: The Automation method being called (String)
+    :param args: The positional arguments of the call (Tuple)
+    :param kwargs: The keyword arguments of the call (Dict)
+    :return: A tuple of the args (List) and kwargs (Dict) with the method's local paths made absolute
+    """
+    args = list(args)
+    kwargs = dict(kwargs)
+    if method_name not in LOCAL_PATH_ARGUMENTS:
+        return args, kwargs
+    position, keyword, local_script_position = LOCAL_PATH_ARGUMENTS[method_name]
+    if local_script_position is not None:
+        if len(args) > local_script_position:
+            local_script = args[local_script_position]
+        else:
+            local_script = kwargs.get('local_script', False)
+        if not local_script:
+            return args, kwargs
+
+    if len(args) > position:
+        args[position] = _absolute_paths(args[position])
+    elif keyword in kwargs:
+        kwargs[keyword] = _absolute_paths(kwargs[keyword])
+    return args, kwargs
+
+
+def _absolute_paths(value):
+    """
+    :return: The path, or each path in a list or tuple, made absolute, anything else is left for the daemon
+    to reject
+    """
+    if isinstance(value, (list, tuple)):
+        return [_absolute_paths(path) for path in value]
+    if isinstance(value, (str, type(u''))):
+        return os.path.abspath(value)
+    return value
+
+
+def exception_from_response(error):
+    """
+    :param error: The type and message of an exception raised in the daemon (Dict)
+    :return: The builtin exception of the same type, such as IOError for a missing local file, or a
+    RuntimeError naming the type for the package's own exceptions
+    """
+    error_type = getattr(builtins, error['type'], None)
+    if isinstance(error_type, type) and issubclass(error_type, Exception):
+        return error_type(error['message'])
+    return RuntimeError(u"{0}: {1}".format(error['type'], error['message']))
+
+
+def restore_result(method_name, result):
+    """
+    :param method_name: The Automation method which returned the result (String)
+    :param result: The result as decoded from JSON
+    :return: The result with the tuples JSON turned into lists restored
+    """
+    if method_name == 'execute_remote_command' or result is None:
+        return result
+    if method_name in LIST_RESULT_METHODS:
+        return [tuple(entry) for entry in result]
+    return tuple(result)
@@ -0,0 +1,5 @@
+# The package runs on Python 2 and 3, isinstance checks for text use string_types instead of basestring
+try:
+    string_types = (str, basestring, unicode)
+except NameError:
+    string_types = (str,)
@@ -0,0 +1,387 @@
+from contextlib import contextmanager
+import atexit
+import select
+import socket
+import threading
+import time
+
+import paramiko
+
+from automation_functions.compat import string_types
+from automation_functions.instrumentation import child_span
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+
+class ConnectionPoolError(Exception):
+    pass
+
+
+class _PooledConnection(object):
+
+    def __init__(self, client):
+        self.client = client
+        self.created = time.time()
+        self.last_used = self.created
+        # Long lived channels, such as elevated shells, kept open on the connection while it sits in the pool
+        self.attached_channels = 0
+
+    def is_healthy(self):
+        """
+        :return: True if the underlying transport is still active and accepts traffic (Bool)
+        """
+        transport = self.client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except (paramiko.SSHException, EOFError, IOError):
+            return False
+        return True
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool(object):
+    """
+    A thread safe pool of authenticated paramiko SSH clients keyed by (hostname, username, private_key_file, port).
+
+    Idle connections are kept open with keepalives and reused by later commands to the same host so that
+    TCP setup, key exchange and authentication are only paid once. Connections idle for longer than
+    idle_timeout are closed, and at most max_connections_per_host are open for a single key at a time.
+
+    Host keys are checked against the system known_hosts files, a host with a different key is refused and
+    a host which is not listed is handled by missing_host_key_policy.
+    """
+
+    def __init__(self, max_connections_per_host=4, idle_timeout=300, keepalive_interval=30,
+                 connection_timeout=60, acquire_timeout=60, missing_host_key_policy=None):
+        """
+        :param max_connections_per_host: The maximum number of connections open to one key at once (Int)
+        :param idle_timeout: Seconds an unused connection is kept before it is closed (Int)
+        :param keepalive_interval: Seconds between SSH keepalive packets, 0 disables keepalives (Int)
+        :param connection_timeout: Default TCP connection timeout in seconds (Int)
+        :param acquire_timeout: Seconds to wait for a free connection slot before giving up (Int)
+        :param missing_host_key_policy: The paramiko policy for hosts not in known_hosts, defaults to
+        AutoAddPolicy like SshClient, pass paramiko.RejectPolicy() to only connect to known hosts
+        """
+        self.max_connections_per_host = max_connections_per_host
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        self.connection_timeout = connection_timeout
+        self.acquire_timeout = acquire_timeout
+        self.missing_host_key_policy = missing_host_key_policy or paramiko.AutoAddPolicy()
+        self._idle = {}
+        self._in_use = {}
+        self._condition = threading.Condition()
+
+    @staticmethod
+    def make_key(hostname, username, private_key_file, port=22):
+        return hostname, username, private_key_file, port
+
+    def acquire(self, hostname, username, private_key_file, port=22, connection_timeout=None):
+        """
+        :param hostname: The host to connect to (String)
+        :param username: The user to authenticate as (String)
+        :param private_key_file: The private key file to authenticate with (String)
+        :param port: The ssh port (Int)
+        :param connection_timeout: TCP connection timeout in seconds, defaults to the pool setting (Int)
+        :return: A tuple of pool key (Tuple), paramiko SSHClient
+        """
+        key = self.make_key(hostname, username, private_key_file, port)
+        deadline = time.time() + self.acquire_timeout
+
+        while True:
+            with self._condition:
+                self._evict_idle_locked()
+                while True:
+                    idle = self._idle.get(key)
+                    candidate = idle.pop() if idle else None
+                    if candidate is not None or self._in_use.get(key, 0) < self.max_connections_per_host:
+                        # Reserve the slot before checking or connecting so other threads respect the limit
+                        self._in_use[key] = self._in_use.get(key, 0) + 1
+                        break
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise ConnectionPoolError('Timed out waiting for a free connection to {0}.'.format(hostname))
+                    self._condition.wait(remaining)
+
+            if candidate is None:
+                break
+            # The health check talks to the host, so it runs without the lock and a stalled host only holds
+            # up its own callers
+            if candidate.is_healthy():
+                candidate.last_used = time.time()
+                return key, candidate
+            candidate.close()
+            with self._condition:
+                self._in_use[key] -= 1
+                self._condition.notify()
+
+        try:
+            connection = self._connect(hostname, username, private_key_file, port, connection_timeout)
+        except Exception:
+            with self._condition:
+                self._in_use[key] -= 1
+                self._condition.notify()
+            raise
+        return key, connection
+
+    def release(self, key, connection, discard=False):
+        """
+        :param key: The pool key returned from acquire (Tuple)
+        :param connection: The connection returned from acquire
+        :param discard: Close the connection instead of returning it to the pool if True (Bool)
+        """
+        with self._condition:
+            self._in_use[key] = max(self._in_use.get(key, 1) - 1, 0)
+            if discard:
+                connection.close()
+            else:
+                connection.last_used = time.time()
+                self._idle.setdefault(key, []).append(connection)
+            self._condition.notify()
+
+    @contextmanager
+    def connection(self, hostname, username, private_key_file, port=22, connection_timeout=None):
+        """
+        Context manager yielding a paramiko SSHClient; the connection is discarded if the block raises.
+        """
+        key, connection = self.acquire(hostname, username, private_key_file, port, connection_timeout)
+        try:
+            yield connection.client
+        except Exception:
+            self.release(key, connection, discard=True)
+            raise
+        else:
+            self.release(key, connection)
+
+    def execute_command(self, hostname, username, private_key_file, command,
+                        command_timeout=60, port=22, connection_timeout=None, stdin_data=None, get_pty=True):
+        """
+        :param command: A list of command parts as passed to SshClient.execute_remote_command (List)
+        :param command_timeout: Seconds to wait for the command to produce output or finish (Int)
+        :param stdin_data: Optional data, or an iterable of data chunks, written to the command's stdin (String)
+        :param get_pty: Request a pseudo terminal; must be False for binary stdin data (Bool)
+        :return: A dict with the keys status, exit_code, stdout, stderr and msg like SshClient.execute_remote_command
+        """
+        command_string = build_command_string(command)
+        try:
+            with self.connection(hostname, username, private_key_file, port, connection_timeout) as client:
+                return run_command_on_transport(client.get_transport(), command_string, command_timeout,
+                                                stdin_data, get_pty)
+        except Exception as error:
+            return {'status': False,
+                    'exit_code': None,
+                    'stdout': '',
+                    'stderr': '',
+                    'msg': u"Unable to execute command on {0}: {1}".format(hostname, error)}
+
+    def stream_command(self, hostname, username, private_key_file, command, on_stdout,
+                       command_timeout=60, port=22, connection_timeout=None):
+        """
+        :param command: A list of command parts as passed to SshClient.execute_remote_command (List)
+        :param on_stdout: Called with every chunk of output as it arrives; returning False stops the command (Callable)
+        :param command_timeout: Seconds to wait for the command to produce output or finish (Int)
+        :return: A dict with the keys status, exit_code, aborted and msg; output is only passed to on_stdout
+        """
+        command_string = build_command_string(command)
+        try:
+            with self.connection(hostname, username, private_key_file, port, connection_timeout) as client:
+                exit_code = stream_command_on_transport(client.get_transport(), command_string, on_stdout,
+                                                        on_stdout, command_timeout)
+        except Exception as error:
+            return {'status': False,
+                    'exit_code': None,
+                    'aborted': False,
+                    'msg': u"Unable to execute command on {0}: {1}".format(hostname, error)}
+        return {'status': True, 'exit_code': exit_code, 'aborted': exit_code is None, 'msg': u''}
+
+    def attach_channel(self, connection):
+        """
+        Record that a long lived channel was opened on the connection, which keeps it from being closed for
+        being idle while the channel is open. The connection itself goes back to the pool as usual.
+        """
+        with self._condition:
+            connection.attached_channels += 1
+
+    def detach_channel(self, connection):
+        """
+        Record that a channel opened with attach_channel was closed.
+        """
+        with self._condition:
+            connection.attached_channels = max(connection.attached_channels - 1, 0)
+            connection.last_used = time.time()
+
+    def evict_idle(self):
+        """
+        Close all idle connections which have been unused longer than idle_timeout and have no attached channels,
+        or whose transport dropped.
+        """
+        with self._condition:
+            self._evict_idle_locked()
+
+    def close_all(self):
+        """
+        Close every idle connection. Connections in use are closed when they are released with discard=True
+        or evicted later.
+        """
+        with self._condition:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+    def stats(self):
+        """
+        :return: A dict of pool key to a dict of idle and in_use connection counts (Dict)
+        """
+        with self._condition:
+            keys = set(self._idle) | set(self._in_use)
+            return dict((key, {'idle': len(self._idle.get(key, [])), 'in_use': self._in_use.get(key, 0)})
+                        for key in keys)
+
+    def _evict_idle_locked(self):
+        now = time.time()
+        for key, connections in list(self._idle.items()):
+            keep = []
+            for connection in connections:
+                transport = connection.client.get_transport()
+                expired = now - connection.last_used > self.idle_timeout and not connection.attached_channels
+                if expired or transport is None or not transport.is_active():
+                    connection.close()
+                else:
+                    keep.append(connection)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+
+    def _connect(self, hostname, username, private_key_file, port, connection_timeout):
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        client.set_missing_host_key_policy(self.missing_host_key_policy)
+        with child_span('connect', host=hostname) as span:
+            client.connect(hostname=hostname,
+                           port=port,
+                           username=username,
+                           key_filename=private_key_file,
+                           timeout=connection_timeout or self.connection_timeout)
+            span.record(round_trips=1)
+        if self.keepalive_interval:
+            client.get_transport().set_keepalive(self.keepalive_interval)
+        return _PooledConnection(client)
+
+
+def build_command_string(command):
+    """
+    :param command: A list of command parts where the first part may be a sudo su prefix (List)
+    :return: A single command line suitable for exec_command (String)
+
+    ['sudo su - oracle', 'cmd'] becomes "sudo su - oracle -c 'cmd'" so the command runs in the login shell.
+    """
+    if isinstance(command, (list, tuple)):
+        command = [part for part in command if part]
+        if len(command) > 1 and command[0].startswith('sudo su'):
+            return '{SUDO_SU} -c {COMMAND}'.format(SUDO_SU=command[0], COMMAND=quote('; '.join(command[1:])))
+        return '; '.join(command)
+    return command
+
+
+def run_command_on_transport(transport, command_string, command_timeout=60, stdin_data=None, get_pty=True):
+    """
+    :param transport: An active paramiko Transport
+    :param command_string: The command line to execute (String)
+    :param command_timeout: Seconds to wait for the command to produce output or finish (Int)
+    :param stdin_data: Optional data, or an iterable of data chunks, written to the command's stdin before it
+    is closed (String)
+    :param get_pty: Request a pseudo terminal so sudo works with requiretty; stderr is merged into stdout (Bool)
+    :return: A dict with the keys status, exit_code, stdout, stderr and msg
+    """
+    stdout = []
+    stderr = []
+    exit_code = stream_command_on_transport(transport, command_string, stdout.append, stderr.append,
+                                            command_timeout, stdin_data, get_pty)
+    return {'status': True,
+            'exit_code': exit_code,
+            'stdout': b''.join(stdout).decode('utf-8', 'replace'),
+            'stderr': b''.join(stderr).decode('utf-8', 'replace'),
+            'msg': u''}
+
+
+def stream_command_on_transport(transport, command_string, on_stdout, on_stderr=None, command_timeout=60,
+                                stdin_data=None, get_pty=True):
+    """
+    :param transport: An active paramiko Transport
+    :param command_string: The command line to execute (String)
+    :param on_stdout: Called with every chunk of stdout as it arrives; returning False stops the command (Callable)
+    :param on_stderr: Called with every chunk of stderr as it arrives (Callable)
+    :param command_timeout: Seconds to wait for the command to produce output or finish (Int)
+    :param stdin_data: Optional data, or an iterable of data chunks, written to the command's stdin before it
+    is closed (String)
+    :param get_pty: Request a pseudo terminal so sudo works with requiretty; stderr is merged into stdout (Bool)
+    :return: The exit code of the command or None if it was stopped by on_stdout (Int)
+
+    Stopping closes the channel, which hangs up the remote session and the command with it.
+    """
+    channel = transport.open_session()
+    try:
+        channel.settimeout(command_timeout)
+        if get_pty:
+            channel.get_pty()
+        channel.exec_command(command_string)
+        if stdin_data is not None:
+            if isinstance(stdin_data, (bytes,) + string_types):
+                stdin_data = [stdin_data]
+            for data in stdin_data:
+                channel.sendall(data)
+            channel.shutdown_write()
+
+        while True:
+            # Wait for either stream and only read stdout once it has data, so a command writing to stderr
+            # while stdout is quiet keeps being drained instead of stalling on a full channel window
+            if not (channel.recv_ready() or channel.recv_stderr_ready() or channel.eof_received):
+                readable, _, _ = select.select([channel], [], [], command_timeout)
+                if not readable:
+                    raise socket.timeout('Timed out waiting for output from the command.')
+            while channel.recv_stderr_ready():
+                data = channel.recv_stderr(32768)
+                if on_stderr is not None:
+                    on_stderr(data)
+            if channel.recv_ready():
+                if on_stdout(channel.recv(32768)) is False:
+                    return None
+            elif channel.eof_received:
+                break
+        while True:
+            data = channel.recv_stderr(32768)
+            if not data:
+                break
+            if on_stderr is not None:
+                on_stderr(data)
+        return channel.recv_exit_status()
+    finally:
+        channel.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """
+    :return: The process wide ConnectionPool shared by every Automation instance
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ConnectionPool()
+            atexit.register(_default_pool.close_all)
+        return _default_pool
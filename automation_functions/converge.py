@@ -0,0 +1,195 @@
+from automation_functions import mounts
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+
+STATE_MARKER = '__AF_STATE__'
+
+
+class DesiredState(object):
+    """
+    Queues the state a host should be in and changes only what differs.
+
+    execute() reads the current state of every queued target in one remote command: directory presence,
+    owner and group of files (and of everything below them when recursive) and /proc/mounts. Only the
+    targets which differ are turned into steps, and those run together in one pipeline script, so a host
+    which is already converged costs a single query.
+
+    state = automation.converge()
+    state.create_directory('/u01/app/oracle')
+    state.change_file_ownership('oracle', ['/u01/app/oracle'], 'dba', recursive=True)
+    state.mount_file_system('nfs01:/export/dumps', '/mnt/dumps')
+    for ssh_status, message, status, changed in state.execute():
+        ...
+    """
+
+    def __init__(self, automation):
+        """
+        :param automation: The Automation instance the state is read and changed with
+        """
+        self.automation = automation
+        self._targets = []
+
+    def __len__(self):
+        return len(self._targets)
+
+    def create_directory(self, folder_path_name, su_as='root'):
+        # Build the step now so bad input raises here like it does on Automation
+        step = self.automation._create_directory_step(folder_path_name, su_as)
+        self._targets.append({'kind': 'directory', 'path': step.creates_directories[0], 'su_as': su_as})
+        return self
+
+    def change_file_ownership(self, chown_username, files, chown_groupname='', recursive=False, su_as='root'):
+        self.automation._change_file_ownership_step(chown_username, files, chown_groupname, recursive, su_as)
+        self._targets.append({'kind': 'ownership', 'owner': chown_username, 'group': chown_groupname,
+                              'files': list(files), 'recursive': recursive, 'su_as': su_as})
+        return self
+
+    def mount_file_system(self, source_file_system, mount_directory, su_as='root'):
+        self.automation._mount_file_system_step(source_file_system, mount_directory, su_as)
+        self._targets.append({'kind': 'mounted', 'source': source_file_system.rstrip('/'),
+                              'path': mount_directory.rstrip('/'), 'su_as': su_as})
+        return self
+
+    def unmount_file_system(self, mount_directory, su_as='root'):
+        self.automation._unmount_file_system_step(mount_directory, su_as)
+        self._targets.append({'kind': 'unmounted', 'path': mount_directory.rstrip('/'), 'su_as': su_as})
+        return self
+
+    def execute(self):
+        """
+        :return: A list with one tuple of ssh connection status (Bool), Result Message (String), command
+        execution status (Bool), changed (Bool) per queued target, in queue order. changed is False for
+        targets which were already in the desired state and None if the state could not be read
+
+        The queue is emptied so the desired state can be reused.
+        """
+        targets = self._targets
+        self._targets = []
+        if not targets:
+            return []
+
+        automation = self.automation
+        result = automation.execute_remote_command([automation._sudo_su_command('root'),
+                                                    self.build_state_query(targets)])
+        if not result.get('status') or result.get('exit_code') != 0:
+            message = u"Unable to read the current state on {0}.".format(automation.hostname)
+            return [(False, message, None, None) for _ in targets]
+        state = parse_state_output(result.get('stdout'))
+
+        results = [None] * len(targets)
+        pipeline = automation.pipeline(stop_on_failure=False)
+        changing = []
+        for index, target in enumerate(targets):
+            step, unchanged_result = self._plan_target(index, target, state)
+            if step is None:
+                results[index] = unchanged_result
+            else:
+                pipeline._add_step(step)
+                changing.append(index)
+
+        if changing:
+            for index, step_result in zip(changing, pipeline.execute()):
+                results[index] = tuple(step_result) + (bool(step_result[0] and step_result[2]),)
+        return results
+
+    @staticmethod
+    def build_state_query(targets):
+        """
+        :param targets: The queued targets (List)
+        :return: A single shell command printing marker lines with the current state of every target (String)
+        """
+        checks = []
+        for index, target in enumerate(targets):
+            if target['kind'] == 'directory':
+                checks.append('if [ -d {PATH} ]; then t=directory; else t=missing; fi; '
+                              'printf \'%s|%s|0|%s\\n\' {MARKER} {INDEX} "$t"'.format(PATH=quote(target['path']),
+                                                                                      MARKER=STATE_MARKER,
+                                                                                      INDEX=index))
+            elif target['kind'] == 'ownership':
+                for file_index, file_name in enumerate(target['files']):
+                    check = 'o=$(stat -c \'%U|%G\' {PATH} 2>/dev/null); d=0; '.format(PATH=quote(file_name))
+                    if target['recursive']:
+                        # Anything below the path with another owner or group means it has to be changed
+                        condition = '! -user {0}'.format(quote(target['owner']))
+                        if target['group']:
+                            condition = '\\( {0} -o ! -group {1} \\)'.format(condition, quote(target['group']))
+                        check += 'if [ -n "$o" ] && [ -n "$(find {PATH} -mindepth 1 {CONDITION} -print -quit ' \
+                                 '2>/dev/null)" ]; then d=1; fi; '.format(PATH=quote(file_name), CONDITION=condition)
+                    check += 'printf \'%s|%s|%s|%s|%s\\n\' {MARKER} {INDEX} {FILE_INDEX} "$d" "$o"'.format(
+                        MARKER=STATE_MARKER, INDEX=index, FILE_INDEX=file_index)
+                    checks.append(check)
+        if any(target['kind'] in ('mounted', 'unmounted') for target in targets):
+            checks.append(mounts.build_mount_table_command(STATE_MARKER))
+        return '; '.join(checks) or 'true'
+
+    def _plan_target(self, index, target, state):
+        """
+        :return: A tuple of the RemoteStep which brings the target to its desired state or None if nothing
+        is run for it (RemoteStep), the result tuple of a target nothing is run for (Tuple)
+        """
+        hostname = self.automation.hostname
+        automation = self.automation
+        target_state = state['targets'].get(index, {})
+        if target['kind'] == 'directory':
+            if target_state.get(0) == ['directory']:
+                return None, self._unchanged(u"Folder {0} already exists.".format(target['path']))
+            return automation._create_directory_step(target['path'], target['su_as']), None
+
+        if target['kind'] == 'ownership':
+            changing = []
+            for file_index, file_name in enumerate(target['files']):
+                fields = target_state.get(file_index)
+                if not fields or len(fields) != 3 or fields[0] != '0' or fields[1] != target['owner'] or \
+                        (target['group'] and fields[2] != target['group']):
+                    changing.append(file_name)
+            if not changing:
+                return None, self._unchanged(u"Files {0} are already owned by {1}.".format(
+                    ' '.join(target['files']), target['owner']))
+            return automation._change_file_ownership_step(target['owner'], changing, target['group'],
+                                                          target['recursive'], target['su_as']), None
+
+        mounted_sources = [source for source, mount_point in state['mounts'] if mount_point == target['path']]
+        if target['kind'] == 'mounted':
+            if target['source'] in mounted_sources:
+                return None, self._unchanged(u"File system '{0}' is already mounted on '{1}'.".format(
+                    target['source'], target['path']))
+            if mounted_sources:
+                # Mounting over another file system would hide it rather than converge
+                return None, (True, u"Cannot mount file system '{0}', '{1}' on {2} already has '{3}' mounted "
+                                    u"on it.".format(target['source'], target['path'], hostname,
+                                                     mounted_sources[-1]), False, False)
+            return automation._mount_file_system_step(target['source'], target['path'], target['su_as']), None
+
+        if not mounted_sources:
+            return None, self._unchanged(u"Nothing is mounted on '{0}'.".format(target['path']))
+        return automation._unmount_file_system_step(target['path'], target['su_as']), None
+
+    @staticmethod
+    def _unchanged(message):
+        return True, message, True, False
+
+
+def parse_state_output(stdout):
+    """
+    :param stdout: The stdout of the command built by DesiredState.build_state_query (String)
+    :return: A dict with targets, a dict of target index to a dict of sub index to the remaining fields,
+    and mounts, a list of (source, mount point) tuples from /proc/mounts (Dict)
+    """
+    state = {'targets': {}, 'mounts': []}
+    prefix = STATE_MARKER + '|'
+    for line in (stdout or '').splitlines():
+        position = line.find(prefix)
+        if position == -1:
+            continue
+        fields = line[position + len(prefix):].rstrip('\r').split('|')
+        if fields[0] == 'mount' and len(fields) == 3:
+            state['mounts'].append((mounts.unescape_mount_field(fields[1]).rstrip('/') or '/',
+                                    mounts.unescape_mount_field(fields[2]).rstrip('/') or '/'))
+        elif len(fields) >= 3 and fields[0].isdigit() and fields[1].isdigit():
+            state['targets'].setdefault(int(fields[0]), {})[int(fields[1])] = fields[2:]
+    return state
+
@@ -0,0 +1,254 @@
+"""
+Keeps Automation connections and elevated shells warm for every short lived job of one user.
+
+python -m automation_functions.daemon --max-requests-per-host 4
+
+Jobs call it with automation_functions.client.AutomationClient.
+"""
+import argparse
+import json
+import os
+import socket
+import stat
+import struct
+import sys
+import threading
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+from automation_functions.automation import Automation
+from automation_functions.client import DAEMON_METHODS, DEFAULT_SOCKET_PATH
+
+
+class AutomationDaemon(object):
+    """
+    Serves the Automation methods to local clients of the user it runs as over a Unix socket.
+
+    Requests name the private key, login and local paths to use, so the daemon only serves its own user: the
+    socket is readable by that user alone and, where the platform reports it, a client running as any other
+    user is refused. Run one daemon per user which needs one.
+
+    Every request names its host and login, the daemon keeps one Automation per login so connections
+    stay in the process wide pool and elevated shells stay open between jobs. Identical requests which
+    arrive while one is running wait for it and get its result instead of running again. Requests per
+    host are limited to max_requests_per_host across every client of the user.
+
+    Requests and responses are one JSON object per line:
+    {"host": {"hostname": ..., "username": ..., "private_key_file": ..., "port": 22,
+              "use_elevated_shells": false},
+     "method": "create_directory", "args": ["/u01/app"], "kwargs": {}}
+    {"result": [true, "Successfully created folder /u01/app.", true]}
+    {"error": {"type": "TypeError", "message": ...}}
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, max_requests_per_host=4, automation_class=Automation,
+                 **automation_kwargs):
+        """
+        :param socket_path: The Unix socket to listen on, a socket left by a daemon which died is replaced. Its
+        directory is created if missing and refused unless it is owned by this user or root and not writable by
+        group or others (String)
+        :param max_requests_per_host: The number of requests run against one host at the same time (Int)
+        :param automation_class: The Automation class or subclass to build for each login
+        :param automation_kwargs: Keyword arguments passed to every Automation, for example connection_pool
+        """
+        if not isinstance(max_requests_per_host, int) or max_requests_per_host < 1:
+            raise ValueError('max_requests_per_host input variable must be a positive integer.')
+
+        self.socket_path = socket_path
+        self.max_requests_per_host = max_requests_per_host
+        self.automation_class = automation_class
+        self.automation_kwargs = automation_kwargs
+        self.requests_run = 0
+        self.requests_coalesced = 0
+        self._automations = {}
+        self._host_limits = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def serve_forever(self):
+        """
+        Listen on the socket until shutdown() is called.
+        """
+        self._check_socket_directory()
+        self._remove_stale_socket()
+        daemon = self
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                peer_uid = daemon._peer_uid(self.request)
+                if peer_uid is not None and peer_uid != os.getuid():
+                    # Answer the first request so the client sees why, then hang up
+                    self.rfile.readline()
+                    error = {'type': 'PermissionError',
+                             'message': u"The automation daemon only serves user id {0}.".format(os.getuid())}
+                    self.wfile.write(json.dumps({'error': error}).encode('utf-8') + b'\n')
+                    return
+                for line in iter(self.rfile.readline, b''):
+                    self.wfile.write(daemon.handle_request(line) + b'\n')
+                    self.wfile.flush()
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, RequestHandler)
+        self._server.daemon_threads = True
+        try:
+            os.chmod(self.socket_path, 0o600)
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+    def handle_request(self, line):
+        """
+        :param line: One JSON request (Bytes)
+        :return: One JSON response, without the line end (Bytes)
+        """
+        try:
+            request = json.loads(line.decode('utf-8'))
+            response = {'result': self.run(request.get('host') or {}, request.get('method'),
+                                           request.get('args') or [], request.get('kwargs') or {})}
+        except Exception as error:
+            response = {'error': {'type': type(error).__name__, 'message': u"{0}".format(error)}}
+        return json.dumps(response).encode('utf-8')
+
+    def run(self, host, method_name, args, kwargs):
+        """
+        :param host: The hostname, username, private_key_file, port and use_elevated_shells of the login (Dict)
+        :param method_name: One of the DAEMON_METHODS (String)
+        :return: What the method returned
+        """
+        if method_name not in DAEMON_METHODS:
+            raise AttributeError('The automation daemon has no method named {0}.'.format(method_name))
+        login = (host.get('hostname'), host.get('username'), host.get('private_key_file'), host.get('port', 22),
+                 bool(host.get('use_elevated_shells')))
+        key = json.dumps([login, method_name, args, kwargs], sort_keys=True)
+
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                in_flight = self._in_flight[key] = _InFlightRequest()
+                leader = True
+            else:
+                self.requests_coalesced += 1
+                leader = False
+        if not leader:
+            return in_flight.wait()
+
+        try:
+            automation = self._automation(login)
+            with self._host_limit(login[0]):
+                in_flight.result = getattr(automation, method_name)(*args, **kwargs)
+        except Exception as error:
+            in_flight.error = error
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                self.requests_run += 1
+            in_flight.done.set()
+        return in_flight.wait()
+
+    def _automation(self, login):
+        with self._lock:
+            automation = self._automations.get(login)
+            if automation is None:
+                hostname, username, private_key_file, port, use_elevated_shells = login
+                automation = self.automation_class(hostname=hostname,
+                                                   username=username,
+                                                   private_key_file=private_key_file,
+                                                   port=port,
+                                                   use_elevated_shells=use_elevated_shells,
+                                                   **self.automation_kwargs)
+                self._automations[login] = automation
+            return automation
+
+    def _host_limit(self, hostname):
+        with self._lock:
+            limit = self._host_limits.get(hostname)
+            if limit is None:
+                limit = self._host_limits[hostname] = threading.BoundedSemaphore(self.max_requests_per_host)
+            return limit
+
+    @staticmethod
+    def _peer_uid(connection):
+        """
+        :param connection: An accepted Unix socket
+        :return: The user id of the client process, None where the platform has no SO_PEERCRED (Int)
+        """
+        peer_credentials = getattr(socket, 'SO_PEERCRED', None)
+        if peer_credentials is None:
+            return None
+        credentials = connection.getsockopt(socket.SOL_SOCKET, peer_credentials, struct.calcsize('3i'))
+        pid, uid, gid = struct.unpack('3i', credentials)
+        return uid
+
+    def _check_socket_directory(self):
+        directory = os.path.dirname(os.path.abspath(self.socket_path))
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory, 0o700)
+            except OSError as error:
+                raise ValueError('The socket directory {0} could not be created ({1}), pass a socket_path in a '
+                                 'directory this user owns.'.format(directory, error.strerror))
+        status = os.stat(directory)
+        if status.st_uid not in (os.getuid(), 0) or status.st_mode & 0o022:
+            raise ValueError('The socket directory {0} must be owned by this user or root and not writable by '
+                             'group or others.'.format(directory))
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        if not stat.S_ISSOCK(os.stat(self.socket_path).st_mode):
+            raise ValueError('socket_path {0} exists and is not a socket.'.format(self.socket_path))
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except socket.error:
+            os.remove(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise ValueError('An automation daemon is already listening on {0}.'.format(self.socket_path))
+
+
+class _InFlightRequest(object):
+    """
+    The outcome of a running request, shared with the identical requests which wait for it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Serve Automation methods to local jobs over a Unix socket.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help='The Unix socket to listen on')
+    parser.add_argument('--max-requests-per-host', type=int, default=4,
+                        help='Requests run against one host at the same time')
+    options = parser.parse_args(arguments)
+
+    daemon = AutomationDaemon(socket_path=options.socket,
+                              max_requests_per_host=options.max_requests_per_host)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+import atexit
+import re
+import socket
+import threading
+
+from automation_functions import connection_pool
+from automation_functions.instrumentation import child_span
+
+
+SHELL_MARKER = '__AF_SHELL__'
+READY_LINE = '{0}|READY'.format(SHELL_MARKER)
+END_LINE_RE = re.compile(r'^' + re.escape(SHELL_MARKER) + r'\|(\d+)\|(-?\d+)$')
+
+
+class ElevatedShellError(Exception):
+    pass
+
+
+class ElevatedShell(object):
+    """
+    One interactive 'sudo su - <user>' login shell kept open on a single channel.
+
+    Each command is run in a subshell with stdin from /dev/null and stderr merged into stdout, followed
+    by a sentinel line carrying a sequence number and the exit code, so many small commands cost one
+    line of shell I/O each instead of a new login shell each. Commands are run one at a time.
+
+    The shell's channel is opened on a pooled connection which then goes straight back to the pool, so
+    shells share the connection with other commands instead of holding one of its max_connections_per_host
+    slots each. The pool keeps a connection with shells on it open however long it is idle.
+    """
+
+    def __init__(self, pool, pool_key, sudo_su, command_timeout=60):
+        """
+        :param pool: The ConnectionPool the shell's connection comes from
+        :param pool_key: The (hostname, username, private_key_file, port) key of the connection (Tuple)
+        :param sudo_su: The sudo su command which starts the shell, for example 'sudo su - oracle' (String)
+        :param command_timeout: Seconds to wait for output before the shell is given up on (Int)
+        """
+        self.pool = pool
+        self.pool_key = pool_key
+        self.sudo_su = sudo_su
+        self.command_timeout = command_timeout
+        self.commands_run = 0
+        self.lock = threading.Lock()
+        self._connection = None
+        self._channel = None
+        self._buffer = b''
+
+    @property
+    def is_open(self):
+        return self._channel is not None and not self._channel.closed
+
+    def start(self, connection_timeout=None):
+        """
+        Open the login shell on a pooled connection and return the connection to the pool.
+
+        The shell is first started without a pseudo terminal, so commands of any length are read as plain
+        input. If that shell exits straight away, as it does when sudo requires a tty, it is started again
+        on a pseudo terminal with echo and line editing completion turned off.
+        """
+        # Let go of a shell which exited so its connection is no longer kept open for it
+        self.close()
+        hostname, username, private_key_file, port = self.pool_key
+        self.pool_key, connection = self.pool.acquire(hostname, username, private_key_file, port,
+                                                      connection_timeout)
+        try:
+            with child_span('shell_start') as span:
+                span.record(round_trips=1)
+                if not self._start_shell(connection, use_pty=False):
+                    self._channel.close()
+                    span.record(round_trips=1)
+                    if not self._start_shell(connection, use_pty=True):
+                        raise ElevatedShellError('The shell {0} exited while starting.'.format(self.sudo_su))
+        except ElevatedShellError:
+            self.close()
+            self.pool.release(self.pool_key, connection)
+            raise
+        except Exception:
+            self.close()
+            self.pool.release(self.pool_key, connection, discard=True)
+            raise
+        self.pool.attach_channel(connection)
+        self._connection = connection
+        self.pool.release(self.pool_key, connection)
+
+    def execute(self, command_string, command_timeout=None):
+        """
+        :param command_string: The command to run in the shell (String)
+        :param command_timeout: Seconds to wait for output, defaults to the shell setting (Int)
+        :return: A dict with the keys status, exit_code, stdout, stderr and msg
+        """
+        index = self.commands_run
+        self.commands_run += 1
+        if self._channel is not None:
+            self._channel.settimeout(command_timeout or self.command_timeout)
+
+        try:
+            self._send('( {COMMAND}\n) </dev/null 2>&1; '
+                       'printf \'\\n%s|%s|%s\\n\' {MARKER} {INDEX} $?\n'.format(COMMAND=command_string,
+                                                                            MARKER=SHELL_MARKER,
+                                                                            INDEX=index))
+            output = []
+            while True:
+                line = self._read_line()
+                if line is None:
+                    self.close()
+                    return {'status': False,
+                            'exit_code': None,
+                            'stdout': u'\n'.join(output),
+                            'stderr': u'',
+                            'msg': u"The shell {0} exited unexpectedly.".format(self.sudo_su)}
+                match = END_LINE_RE.match(line)
+                if match and int(match.group(1)) == index:
+                    break
+                output.append(line)
+        except (socket.timeout, socket.error, EOFError, IOError) as error:
+            self.close()
+            return {'status': False,
+                    'exit_code': None,
+                    'stdout': u'',
+                    'stderr': u'',
+                    'msg': u"Lost the shell {0}: {1}".format(self.sudo_su, error)}
+
+        # The sentinel is printed after a newline, drop the empty line it adds
+        if output and output[-1] == u'':
+            output.pop()
+        stdout = u'\n'.join(output)
+        if output:
+            stdout += u'\n'
+        return {'status': True, 'exit_code': int(match.group(2)), 'stdout': stdout, 'stderr': u'', 'msg': u''}
+
+    def close(self):
+        """
+        Exit the shell. The connection stays in the pool for other commands.
+        """
+        if self._channel is not None:
+            try:
+                if not self._channel.closed:
+                    self._channel.sendall(b'exit\n')
+            except (socket.error, EOFError, IOError):
+                pass
+            self._channel.close()
+            self._channel = None
+        if self._connection is not None:
+            self.pool.detach_channel(self._connection)
+            self._connection = None
+
+    def _start_shell(self, connection, use_pty):
+        """
+        :param connection: The pooled connection to open the shell's channel on
+        :return: True once the shell printed the ready line, False if it exited first (Bool)
+        """
+        channel = connection.client.get_transport().open_session()
+        channel.settimeout(self.command_timeout)
+        if use_pty:
+            channel.get_pty()
+        else:
+            channel.set_combine_stderr(True)
+        channel.exec_command(self.sudo_su)
+        self._channel = channel
+        self._buffer = b''
+        setup = "stty -echo 2>/dev/null; PS1=''; PS2=''; unset PROMPT_COMMAND; "
+        if use_pty:
+            setup += "bind 'set disable-completion on' 2>/dev/null; "
+        # Wait for the ready line so the login banner and any echoed input are discarded
+        self._send("{0}printf '%s|READY\\n' {1}\n".format(setup, SHELL_MARKER))
+        while True:
+            line = self._read_line()
+            if line is None:
+                return False
+            if line == READY_LINE:
+                return True
+
+    def _send(self, text):
+        self._channel.sendall(text.encode('utf-8'))
+
+    def _read_line(self):
+        """
+        :return: The next line of output without its line ending, or None once the shell has exited (String)
+        """
+        while b'\n' not in self._buffer:
+            data = self._channel.recv(32768)
+            if not data:
+                return None
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line.rstrip(b'\r').decode('utf-8', 'replace')
+
+
+class ElevatedShellManager(object):
+    """
+    Keeps one ElevatedShell per (hostname, username, private_key_file, port, sudo su command) and restarts
+    shells which have exited. Commands for the same shell are serialised.
+    """
+
+    def __init__(self):
+        self._shells = {}
+        self._lock = threading.Lock()
+
+    def execute(self, automation, sudo_su, command_string):
+        """
+        :param automation: The Automation instance whose host and credentials are used
+        :param sudo_su: The sudo su command of the user to run as (String)
+        :param command_string: The command to run (String)
+        :return: A dict with the keys status, exit_code, stdout, stderr and msg
+        """
+        pool = automation.connection_pool or connection_pool.get_default_pool()
+        pool_key = pool.make_key(automation.hostname, automation.username, automation.private_key_file,
+                                 getattr(automation, 'port', 22))
+        key = pool_key + (sudo_su,)
+        with self._lock:
+            shell = self._shells.get(key)
+            if shell is None:
+                shell = ElevatedShell(pool, pool_key, sudo_su, automation.command_timeout)
+                self._shells[key] = shell
+
+        with shell.lock:
+            if not shell.is_open:
+                try:
+                    shell.start(automation.connection_timeout)
+                except Exception as error:
+                    return {'status': False,
+                            'exit_code': None,
+                            'stdout': u'',
+                            'stderr': u'',
+                            'msg': u"Unable to start {0} on {1}: {2}".format(sudo_su, automation.hostname, error)}
+            return shell.execute(command_string, automation.command_timeout)
+
+    def close_all(self):
+        with self._lock:
+            shells = list(self._shells.values())
+            self._shells.clear()
+        for shell in shells:
+            with shell.lock:
+                shell.close()
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_default_manager():
+    """
+    :return: The process wide ElevatedShellManager
+    """
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = ElevatedShellManager()
+            atexit.register(_default_manager.close_all)
+        return _default_manager
@@ -0,0 +1,161 @@
+from collections import OrderedDict
+import threading
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+from automation_functions.automation import Automation
+
+
+CONTINUE_ON_ERROR = 'continue'
+FAIL_FAST = 'fail_fast'
+
+# The Automation methods which return a tuple of ssh connection status, Result Message, command execution status
+STATUS_TUPLE_METHODS = ('execute_shell_script',
+                        'move_files',
+                        'mount_file_system',
+                        'unmount_file_system',
+                        'change_file_ownership',
+                        'create_directory',
+                        'execute_oracle_sql_script')
+
+# The Automation methods which return a tuple of command execution status, Result Message
+STATUS_PAIR_METHODS = ('remote_copy_files',)
+
+
+class FleetRunner(object):
+    """
+    Runs one Automation method against many hosts at once on a bounded pool of worker threads.
+
+    Every host gets its own Automation instance built with the shared keyword arguments (username,
+    private_key_file, ...), so wall clock time is bounded by the slowest host rather than the sum of all hosts.
+    """
+
+    def __init__(self, hosts, max_workers=20, host_timeout=None, error_policy=CONTINUE_ON_ERROR,
+                 automation_class=Automation, **automation_kwargs):
+        """
+        :param hosts: A tuple or list of hostnames or ip addresses to run against, each listed once (Tuple or List)
+        :param max_workers: The maximum number of hosts worked on at the same time (Int)
+        :param host_timeout: Seconds a single host may take before it is reported as timed out, None waits forever (Int)
+        :param error_policy: CONTINUE_ON_ERROR to run every host, FAIL_FAST to stop starting hosts after a failure (String)
+        :param automation_class: The Automation class or subclass to build for each host
+        :param automation_kwargs: Keyword arguments passed to every Automation, for example username and private_key_file
+        """
+        if not isinstance(hosts, (tuple, list)):
+            raise TypeError('hosts input variable is not a list or tuple.')
+        if len(set(hosts)) != len(hosts):
+            raise ValueError('hosts input variable lists {0} more than once.'.format(
+                ', '.join(sorted(set(host for host in hosts if list(hosts).count(host) > 1)))))
+        if not isinstance(max_workers, int) or max_workers < 1:
+            raise ValueError('max_workers input variable must be a positive integer.')
+        if error_policy not in (CONTINUE_ON_ERROR, FAIL_FAST):
+            raise ValueError('error_policy input variable must be {0} or {1}.'.format(CONTINUE_ON_ERROR, FAIL_FAST))
+
+        self.hosts = list(hosts)
+        self.max_workers = max_workers
+        self.host_timeout = host_timeout
+        self.error_policy = error_policy
+        self.automation_class = automation_class
+        self.automation_kwargs = automation_kwargs
+
+    def run(self, method_name, *args, **kwargs):
+        """
+        :param method_name: The name of the Automation method to call, for example 'create_directory' (String)
+        :param args: Positional arguments passed to the method on every host
+        :param kwargs: Keyword arguments passed to the method on every host
+        :return: An OrderedDict of host to a tuple of ssh connection status (Bool), Result Message (String),
+        command execution status (Bool), in the order the hosts were given
+
+        Only methods which return a status tuple can be run. remote_copy_files returns two items and is
+        reported as (status, message, status) so every host result has the same shape.
+        """
+        if not callable(getattr(self.automation_class, method_name, None)) or method_name.startswith('_'):
+            raise AttributeError('{0} has no public method named {1}.'.format(self.automation_class.__name__,
+                                                                              method_name))
+        if method_name not in STATUS_TUPLE_METHODS + STATUS_PAIR_METHODS:
+            raise ValueError('{0} does not return a status tuple and cannot be run by FleetRunner, methods which '
+                             'can are {1}.'.format(method_name, ', '.join(STATUS_TUPLE_METHODS + STATUS_PAIR_METHODS)))
+
+        results = {}
+        results_lock = threading.Lock()
+        stop = threading.Event()
+        pending = Queue()
+        for host in self.hosts:
+            pending.put(host)
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    host = pending.get_nowait()
+                except Empty:
+                    return
+                result = self._run_host(host, method_name, args, kwargs)
+                with results_lock:
+                    results[host] = result
+                if self.error_policy == FAIL_FAST and not (result[0] and result[2]):
+                    stop.set()
+
+        workers = [threading.Thread(target=worker) for _ in range(min(self.max_workers, len(self.hosts)))]
+        for thread in workers:
+            thread.daemon = True
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        ordered_results = OrderedDict()
+        for host in self.hosts:
+            if host in results:
+                ordered_results[host] = results[host]
+            else:
+                ordered_results[host] = (True,
+                                         u"Skipped {0} on {1} because an earlier host failed.".format(method_name,
+                                                                                                      host),
+                                         False)
+        return ordered_results
+
+    def _run_host(self, host, method_name, args, kwargs):
+        """
+        :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
+
+        Runs the method in its own thread so a hung host can be abandoned after host_timeout.
+        """
+        outcome = {}
+
+        def call():
+            try:
+                automation = self.automation_class(hostname=host, **self.automation_kwargs)
+                if self.host_timeout is not None:
+                    automation.command_timeout = min(automation.command_timeout, self.host_timeout)
+                outcome['result'] = getattr(automation, method_name)(*args, **kwargs)
+            except Exception as error:
+                outcome['result'] = (False, u"Failed to run {0} on {1}: {2}".format(method_name, host, error), None)
+
+        thread = threading.Thread(target=call)
+        thread.daemon = True
+        thread.start()
+        thread.join(self.host_timeout)
+
+        if thread.is_alive():
+            return False, u"Timed out running {0} on {1} after {2} seconds.".format(method_name,
+                                                                                     host,
+                                                                                     self.host_timeout), None
+
+        result = outcome['result']
+        if method_name in STATUS_PAIR_METHODS and len(result) == 2:
+            return result[0], result[1], result[0]
+        return tuple(result)
+
+
+def run_on_fleet(hosts, method_name, method_args=(), method_kwargs=None, **runner_kwargs):
+    """
+    :param hosts: A tuple or list of hostnames or ip addresses to run against (Tuple or List)
+    :param method_name: The name of the Automation method to call (String)
+    :param method_args: Positional arguments passed to the method (Tuple)
+    :param method_kwargs: Keyword arguments passed to the method (Dict)
+    :param runner_kwargs: Keyword arguments for FleetRunner, including the Automation keyword arguments
+    :return: An OrderedDict of host to a tuple of ssh connection status (Bool), Result Message (String),
+    command execution status (Bool)
+    """
+    return FleetRunner(hosts, **runner_kwargs).run(method_name, *method_args, **(method_kwargs or {}))
@@ -0,0 +1,281 @@
+from functools import wraps
+import itertools
+import json
+import math
+import threading
+import time
+
+
+# The innermost open span on each thread, across every Instrumentation, so code without access to an
+# Automation instance, like the connection pool, can add child spans
+_active = threading.local()
+
+
+class Span(object):
+    """
+    The timing of one operation. Round trips and bytes recorded on a span are added to its parent when
+    it finishes, so a public method's span covers every remote command it made.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, instrumentation, name, parent=None, host=None, su_as=None):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.parent = parent
+        self.span_id = next(self._ids)
+        self.host = host if host is not None or parent is None else parent.host
+        self.su_as = su_as
+        self.round_trips = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.exit_code = None
+        self.status = None
+        self.error = None
+        self.start = time.time()
+        self._clock_start = _clock()
+        self.duration = None
+
+    def __enter__(self):
+        self.instrumentation._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_value is not None:
+            self.status = False
+            self.error = u"{0}".format(exc_value)
+        self.finish()
+
+    def record(self, round_trips=0, bytes_in=0, bytes_out=0, exit_code=None, status=None, su_as=None):
+        """
+        Add round trips and bytes to the span and set its exit code, status or su_as user if given.
+        """
+        self.round_trips += round_trips
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        if exit_code is not None:
+            self.exit_code = exit_code
+        if status is not None:
+            self.status = status
+        if su_as is not None:
+            self.su_as = su_as
+
+    def finish(self):
+        self.duration = _clock() - self._clock_start
+        self.instrumentation._pop(self)
+        if self.parent is not None:
+            self.parent.record(round_trips=self.round_trips, bytes_in=self.bytes_in, bytes_out=self.bytes_out)
+            if self.parent.su_as is None:
+                self.parent.su_as = self.su_as
+        self.instrumentation._emit(self.to_dict())
+
+    def to_dict(self):
+        return {'name': self.name,
+                'span_id': self.span_id,
+                'parent_id': self.parent.span_id if self.parent is not None else None,
+                'host': self.host,
+                'su_as': self.su_as,
+                'start': self.start,
+                'duration': self.duration,
+                'round_trips': self.round_trips,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'exit_code': self.exit_code,
+                'status': self.status,
+                'error': self.error}
+
+
+class _NoopSpan(object):
+    """
+    Returned whenever instrumentation is off so callers can record unconditionally at almost no cost.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def record(self, *args, **kwargs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Instrumentation(object):
+    """
+    Records timing spans and sends each finished span, as a dict, to every sink.
+
+    A sink is any object with an emit(record) method; HistogramSink, JsonLinesSink and CallbackSink are
+    provided. When enabled is False span() returns a shared no-op span and nothing is recorded.
+    """
+
+    def __init__(self, sinks=(), enabled=True):
+        self.sinks = list(sinks)
+        self.enabled = enabled and bool(self.sinks)
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        self.enabled = True
+
+    def span(self, name, host=None, su_as=None):
+        """
+        :param name: The operation name, for example 'move_files' or 'execute_remote_command' (String)
+        :param host: The remote host, defaults to the parent span's host (String)
+        :param su_as: The user the operation runs as (String)
+        :return: A span to use as a context manager
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, parent=self.current_span(), host=host, su_as=su_as)
+
+    @staticmethod
+    def current_span():
+        """
+        :return: The innermost open span on this thread or None
+        """
+        stack = getattr(_active, 'stack', None)
+        return stack[-1] if stack else None
+
+    @staticmethod
+    def _push(span):
+        stack = getattr(_active, 'stack', None)
+        if stack is None:
+            stack = _active.stack = []
+        stack.append(span)
+
+    @staticmethod
+    def _pop(span):
+        stack = getattr(_active, 'stack', None)
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def _emit(self, record):
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception:
+                # A broken sink must never break the operation being measured
+                pass
+
+
+class HistogramSink(object):
+    """
+    Keeps per operation count, total, min and max duration and a histogram of durations in power of two
+    millisecond buckets, plus total round trips and bytes.
+    """
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        duration_ms = record['duration'] * 1000.0
+        bucket = 0 if duration_ms < 1 else int(math.ceil(math.log(duration_ms, 2)))
+        with self._lock:
+            stats = self._stats.get(record['name'])
+            if stats is None:
+                stats = self._stats[record['name']] = {'count': 0, 'total': 0.0, 'min': None, 'max': None,
+                                                       'round_trips': 0, 'bytes_in': 0, 'bytes_out': 0,
+                                                       'buckets': {}}
+            stats['count'] += 1
+            stats['total'] += record['duration']
+            stats['min'] = record['duration'] if stats['min'] is None else min(stats['min'], record['duration'])
+            stats['max'] = record['duration'] if stats['max'] is None else max(stats['max'], record['duration'])
+            stats['round_trips'] += record['round_trips']
+            stats['bytes_in'] += record['bytes_in']
+            stats['bytes_out'] += record['bytes_out']
+            upper_bound_ms = 2 ** bucket
+            stats['buckets'][upper_bound_ms] = stats['buckets'].get(upper_bound_ms, 0) + 1
+
+    def summary(self):
+        """
+        :return: A dict of operation name to its statistics, buckets map an upper bound in milliseconds
+        to the number of spans at or below it and above the previous bound (Dict)
+        """
+        with self._lock:
+            summary = {}
+            for name, stats in self._stats.items():
+                summary[name] = dict(stats, buckets=dict(stats['buckets']),
+                                     mean=stats['total'] / stats['count'])
+            return summary
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class JsonLinesSink(object):
+    """
+    Appends every span as one JSON object per line to a file.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = json.dumps(record, sort_keys=True)
+        with self._lock:
+            with open(self.file_name, 'a') as file_object:
+                file_object.write(line + '\n')
+
+
+class CallbackSink(object):
+    """
+    Calls a function with every span record.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def emit(self, record):
+        self.callback(record)
+
+
+def traced(method):
+    """
+    Decorator for Automation methods which records a span named after the method on the instance's
+    instrumentation. Only an attribute lookup is added when instrumentation is off.
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        instrumentation = self.instrumentation
+        if instrumentation is None or not instrumentation.enabled:
+            return method(self, *args, **kwargs)
+        with instrumentation.span(name, host=self.hostname, su_as=kwargs.get('su_as')) as span:
+            result = method(self, *args, **kwargs)
+            if isinstance(result, tuple) and len(result) == 2:
+                span.record(status=bool(result[0]))
+            elif isinstance(result, tuple) and len(result) >= 3:
+                span.record(status=bool(result[0] and result[2]))
+            return result
+    return wrapper
+
+
+def child_span(name, **kwargs):
+    """
+    :param name: The operation name (String)
+    :return: A span nested in the innermost open span on this thread, or a no-op span if there is none
+    """
+    parent = Instrumentation.current_span()
+    if parent is None:
+        return NOOP_SPAN
+    return parent.instrumentation.span(name, **kwargs)
+
+
+_default_instrumentation = Instrumentation(enabled=False)
+
+
+def get_default_instrumentation():
+    """
+    :return: The process wide Instrumentation used by Automation instances which were not given their own.
+    It is off until a sink is added.
+    """
+    return _default_instrumentation
+
+
+_clock = getattr(time, 'perf_counter', time.time)
@@ -0,0 +1,38 @@
+import subprocess
+import threading
+
+
+def execute_command(command, command_timeout=60):
+    """
+    :param command: The command and its arguments (List)
+    :param command_timeout: Seconds before the process is killed (Int)
+    :return: Tuple of stdout (String), stderr (String), returncode (Int)
+
+    Waits on the process itself rather than polling with a fixed sleep, so the call returns as soon
+    as the command exits. A command still running after command_timeout seconds is killed.
+    """
+    process = subprocess.Popen(command,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    timed_out = threading.Event()
+
+    def kill():
+        timed_out.set()
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+    timer = threading.Timer(command_timeout, kill)
+    timer.daemon = True
+    timer.start()
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        timer.cancel()
+
+    if timed_out.is_set():
+        message = u"Command timed out after {0} seconds and was killed.".format(command_timeout)
+        stderr = u"{0}\n{1}".format(stderr, message) if stderr else message
+    return stdout, stderr, process.returncode
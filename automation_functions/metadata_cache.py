@@ -0,0 +1,139 @@
+from collections import OrderedDict
+import posixpath
+import threading
+import time
+
+
+class MetadataCache(object):
+    """
+    A size bounded LRU cache of remote existence and stat results with a time to live.
+
+    Entries are keyed by (host, su_as, path) since what a user can see depends on the host and on who is
+    asking, so one cache can be shared by the Automation instances of many hosts. Automation updates or
+    invalidates entries whenever one of its methods changes a path, and counts hits and misses so the saved
+    round trips can be measured.
+    """
+
+    def __init__(self, ttl=30, max_entries=1024):
+        """
+        :param ttl: Seconds an entry is trusted after it was read from the remote system (Int)
+        :param max_entries: The maximum number of entries kept, least recently used entries are evicted first (Int)
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, host, path, su_as='root', include_metadata=False):
+        """
+        :param host: The host the path is on (String)
+        :param path: The remote path (String)
+        :param su_as: The user the check is run as (String)
+        :param include_metadata: Only entries which carry size, mtime, owner, group and mode match if True (Bool)
+        :return: A copy of the cached result dict or None on a miss
+        """
+        key = (host, su_as, path)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                expires, has_metadata, result = entry
+                if expires < time.time():
+                    entry = None
+                elif include_metadata and not has_metadata and result['type'] != 'missing':
+                    # Keep it for plain existence checks but it cannot answer this one
+                    self._entries[key] = entry
+                    entry = None
+                else:
+                    self._entries[key] = entry
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(entry[2])
+
+    def set(self, host, path, result, su_as='root', has_metadata=False):
+        """
+        :param host: The host the path is on (String)
+        :param path: The remote path (String)
+        :param result: A result dict as returned by Automation.check_files_exist (Dict)
+        :param su_as: The user the check was run as (String)
+        :param has_metadata: The result carries size, mtime, owner, group and mode (Bool)
+        """
+        key = (host, su_as, path)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, has_metadata, dict(result))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def mark_missing(self, host, path):
+        """
+        Record that a path no longer exists for every user, for example after it was moved away.
+        """
+        self.invalidate(host, [path])
+        self.set(host, path, {'type': 'missing', 'size': None, 'mtime': None, 'owner': None, 'group': None, 'mode': None},
+                 has_metadata=True)
+
+    def mark_directory(self, host, path):
+        """
+        Record that a directory now exists; its stat metadata is unknown so only existence checks are answered.
+        The directories above it are dropped, mkdir -p may just have created them.
+        """
+        parents = []
+        parent = posixpath.dirname(path.rstrip('/'))
+        while parent and parent not in parents:
+            parents.append(parent)
+            parent = posixpath.dirname(parent)
+        self.invalidate(host, [path] + parents)
+        self.set(host, path, {'type': 'directory', 'size': None, 'mtime': None, 'owner': None, 'group': None, 'mode': None})
+
+    def forget_metadata(self, host, paths):
+        """
+        :param host: The host the paths are on (String)
+        :param paths: Paths whose owner, group, mode, size or mtime changed but which still exist (List)
+
+        Existence is kept so later existence checks are still answered, only the stat metadata is dropped.
+        """
+        paths = set(paths)
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == host and key[2] in paths:
+                    expires, has_metadata, result = self._entries[key]
+                    result = dict(result, size=None, mtime=None, owner=None, group=None, mode=None)
+                    self._entries[key] = (expires, result['type'] == 'missing', result)
+
+    def invalidate(self, host=None, paths=None, trees=()):
+        """
+        :param host: The host to drop paths for, None drops them on every host (String)
+        :param paths: Paths to drop for every user, None drops every path (List)
+        :param trees: Directories which are dropped together with every path below them (List)
+        """
+        with self._lock:
+            if host is None and paths is None:
+                self._entries.clear()
+                return
+            if paths is not None:
+                paths = set(paths)
+                paths.update(tree.rstrip('/') for tree in trees)
+            prefixes = tuple(tree.rstrip('/') + '/' for tree in trees)
+            for key in list(self._entries):
+                entry_host, _, path = key
+                if host is not None and entry_host != host:
+                    continue
+                if paths is None or path in paths or (prefixes and path.startswith(prefixes)):
+                    del self._entries[key]
+
+    def stats(self):
+        """
+        :return: A dict of hits, misses, evictions and entries (Dict)
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries)}
@@ -0,0 +1,163 @@
+import posixpath
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+
+MOUNT_MARKER = '__AF_MOUNT__'
+MOUNTS_FILE = '/proc/mounts'
+
+# Prints the exit code and the output of the mount or umount command on the entry's marker line
+_REPORT_COMMAND = ('printf \'%s|%s|done|%s|%s\\n\' {MARKER} {INDEX} "$af_rc" '
+                   '"$(printf \'%s\' "$af_output" | tr \'\\n|\' \'  \')"; ')
+
+# /proc/mounts escapes these characters in sources and mount points, the backslash has to be escaped first
+MOUNT_ESCAPES = (('\\', '\\134'), (' ', '\\040'), ('\t', '\\011'), ('\n', '\\012'))
+
+
+def escape_mount_field(field):
+    """
+    :param field: A mount source or mount point (String)
+    :return: The field as /proc/mounts writes it (String)
+    """
+    for character, escaped in MOUNT_ESCAPES:
+        field = field.replace(character, escaped)
+    return field
+
+
+def unescape_mount_field(field):
+    """
+    :param field: A source or mount point as written in /proc/mounts (String)
+    :return: The field with the octal escapes for space, tab, newline and backslash decoded (String)
+    """
+    for character, escaped in reversed(MOUNT_ESCAPES):
+        field = field.replace(escaped, character)
+    return field
+
+
+def build_mount_table_command(marker):
+    """
+    :param marker: The marker each line starts with (String)
+    :return: A shell command printing one marker|mount|source|mount point line per mounted file system (String)
+    """
+    return ('while read -r af_source af_mount_point af_rest; do '
+            'printf \'%s|mount|%s|%s\\n\' {MARKER} "$af_source" "$af_mount_point"; '
+            'done < {MOUNTS}').format(MARKER=marker, MOUNTS=MOUNTS_FILE)
+
+
+def mount_waves(mount_directories, deepest_first=False):
+    """
+    :param mount_directories: The mount points of a batch (List)
+    :param deepest_first: Order the waves for unmounting instead of mounting (Bool)
+    :return: A list of lists of indexes into mount_directories, the entries in one wave do not depend on
+    each other and can run at the same time, a mount point nested in another comes in a later wave, or
+    an earlier one when deepest_first is True (List)
+
+    A mount point given twice would be mounted on twice at the same time, so it raises ValueError.
+    """
+    seen = set()
+    for directory in mount_directories:
+        normalised = posixpath.normpath(directory)
+        if normalised in seen:
+            raise ValueError('Mount directory {0} is given more than once.'.format(directory))
+        seen.add(normalised)
+
+    # An entry nested in n other entries of the batch can run once those n have
+    levels = [len([other for other in mount_directories if directory.startswith(other.rstrip('/') + '/')])
+              for directory in mount_directories]
+    order = sorted(set(levels), reverse=deepest_first)
+    return [[index for index, level in enumerate(levels) if level == wave] for wave in order]
+
+
+def build_batch_mount_script(mounts, create_mount_points=True):
+    """
+    :param mounts: A list of (source file system, mount directory) tuples (List)
+    :param create_mount_points: Create missing mount directories with mkdir -p (Bool)
+    :return: A shell script which mounts every entry not already mounted and prints one marker line per entry (String)
+
+    The mount table is read once up front. Entries in the same wave are mounted in the background and
+    waited for together, so a batch takes as long as its slowest mount rather than the sum of them.
+    """
+    template = ('( if af_mounted_from {MOUNT_DIR_ESCAPED} {SOURCE_ESCAPED}; then '
+                'printf \'%s|%s|unchanged\\n\' {MARKER} {INDEX}; '
+                'elif af_source=$(af_mounted_on {MOUNT_DIR_ESCAPED}); then '
+                'printf \'%s|%s|busy|%s\\n\' {MARKER} {INDEX} "$af_source"; '
+                'elif [ ! -d {MOUNT_DIR} ] && {CREATE}; then '
+                'printf \'%s|%s|missing\\n\' {MARKER} {INDEX}; '
+                'else af_output=$(mount {SOURCE} {MOUNT_DIR} 2>&1); af_rc=$?; ' + _REPORT_COMMAND + 'fi ) &')
+    script = [_mount_table_prelude()]
+    for wave in mount_waves([mount_directory for _, mount_directory in mounts]):
+        for index in wave:
+            source_file_system, mount_directory = mounts[index]
+            if create_mount_points:
+                create = '! mkdir -p {0} 2>/dev/null'.format(quote(mount_directory))
+            else:
+                create = 'true'
+            script.append(template.format(MARKER=MOUNT_MARKER,
+                                          INDEX=index,
+                                          SOURCE=quote(source_file_system),
+                                          MOUNT_DIR=quote(mount_directory),
+                                          SOURCE_ESCAPED=quote(escape_mount_field(source_file_system)),
+                                          MOUNT_DIR_ESCAPED=quote(escape_mount_field(mount_directory)),
+                                          CREATE=create))
+        script.append('wait')
+    return '\n'.join(script)
+
+
+def build_batch_unmount_script(mount_directories, force=False):
+    """
+    :param mount_directories: The mount points to unmount (List)
+    :param force: Unmount with umount -f (Bool)
+    :return: A shell script which unmounts every entry which has a file system mounted and prints one
+    marker line per entry (String)
+
+    Nested mount points are unmounted before the file system they are mounted in.
+    """
+    template = ('( if ! af_mounted_on {MOUNT_DIR_ESCAPED} > /dev/null; then '
+                'printf \'%s|%s|unchanged\\n\' {MARKER} {INDEX}; '
+                'else af_output=$(umount {FORCE}{MOUNT_DIR} 2>&1); af_rc=$?; ' + _REPORT_COMMAND + 'fi ) &')
+    script = [_mount_table_prelude()]
+    for wave in mount_waves(mount_directories, deepest_first=True):
+        for index in wave:
+            script.append(template.format(MARKER=MOUNT_MARKER,
+                                          INDEX=index,
+                                          FORCE='-f ' if force else '',
+                                          MOUNT_DIR=quote(mount_directories[index]),
+                                          MOUNT_DIR_ESCAPED=quote(escape_mount_field(mount_directories[index]))))
+        script.append('wait')
+    return '\n'.join(script)
+
+
+def parse_batch_output(count, stdout):
+    """
+    :param count: The number of entries in the batch (Int)
+    :param stdout: The output of a script built by build_batch_mount_script or build_batch_unmount_script (String)
+    :return: A list with one list of fields per entry, None for an entry which reported nothing (List)
+    """
+    results = [None] * count
+    prefix = MOUNT_MARKER + '|'
+    for line in (stdout or '').splitlines():
+        position = line.find(prefix)
+        if position == -1:
+            continue
+        fields = line[position + len(prefix):].rstrip('\r').split('|')
+        if len(fields) >= 2 and fields[0].isdigit() and int(fields[0]) < count:
+            results[int(fields[0])] = fields[1:]
+    return results
+
+
+def _mount_table_prelude():
+    """
+    :return: Shell functions over a snapshot of the mount table taken once, which compare the still
+    escaped sources and mount points exactly (String)
+    """
+    return ('af_mounts=$(mktemp) || exit 1; trap \'rm -f "$af_mounts"\' EXIT; '
+            'cat {MOUNTS} > "$af_mounts"; '
+            'af_mounted_on() {{ af_dir="$1" awk \'$2 == ENVIRON["af_dir"] {{ source = $1 }} '
+            'END {{ if (source == "") exit 1; print source }}\' "$af_mounts"; }}; '
+            'af_mounted_from() {{ af_dir="$1" af_source="$2" awk \'$2 == ENVIRON["af_dir"] && '
+            '$1 == ENVIRON["af_source"] {{ found = 1 }} END {{ exit !found }}\' "$af_mounts"; }}'
+            ).format(MOUNTS=MOUNTS_FILE)
+
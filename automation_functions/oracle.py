@@ -0,0 +1,103 @@
+import re
+
+
+ORACLE_ERROR_RE = re.compile(r'ORA-(\d{5})[^\r\n]*')
+
+# Errors with a friendlier message, checked in this order before the generic message
+KNOWN_ORACLE_ERRORS = (('ORA-01543', u"Error ORA-01543: Oracle Tablespace already exists. Unable to create Tablespace."),
+                       ('ORA-01920', u"Error ORA-01920: Oracle User already exists. Unable to create user."),
+                       ('ORA-00959', u"Error ORA-00959: Oracle Tablespace does not exist. Unable to create user."))
+
+
+class OracleOutputScanner(object):
+    """
+    Scans sqlplus output incrementally for ORA- errors with one precompiled pattern.
+
+    Only complete lines are matched so an error split across two chunks is still found. At most
+    tail_size characters of output are kept, so memory stays flat however much the script prints.
+    """
+
+    def __init__(self, abort_on_errors=(), tail_size=65536, max_line_size=65536):
+        """
+        :param abort_on_errors: ORA codes, like 'ORA-01653', which should stop the script as soon as they appear (List)
+        :param tail_size: The number of trailing output characters kept (Int)
+        :param max_line_size: Longest partial line buffered before it is scanned anyway (Int)
+        """
+        self.abort_on_errors = set(code.upper() for code in abort_on_errors)
+        self.tail_size = tail_size
+        self.max_line_size = max_line_size
+        self.errors = []
+        self.abort_error = None
+        self.bytes_seen = 0
+        self._tail = u''
+        self._partial_line = u''
+
+    @property
+    def tail(self):
+        return self._tail + self._partial_line
+
+    @property
+    def error_codes(self):
+        return [error['code'] for error in self.errors]
+
+    def feed(self, data):
+        """
+        :param data: The next chunk of output (String)
+        :return: False if an abort error was seen and the command should be stopped, otherwise True (Bool)
+        """
+        if isinstance(data, bytes):
+            data = data.decode('utf-8', 'replace')
+        self.bytes_seen += len(data)
+
+        text = self._partial_line + data
+        complete, separator, self._partial_line = text.rpartition(u'\n')
+        if len(self._partial_line) > self.max_line_size:
+            complete, self._partial_line = u'{0}{1}{2}'.format(complete, separator, self._partial_line), u''
+            separator = u''
+        if complete or separator:
+            self._scan(complete + separator)
+        return self.abort_error is None
+
+    def close(self):
+        """
+        Scan whatever partial line is left once the output has ended.
+        """
+        if self._partial_line:
+            partial_line, self._partial_line = self._partial_line, u''
+            self._scan(partial_line)
+
+    def _scan(self, text):
+        for match in ORACLE_ERROR_RE.finditer(text):
+            code = u'ORA-{0}'.format(match.group(1))
+            self.errors.append({'code': code, 'message': match.group(0).strip()})
+            if self.abort_error is None and code in self.abort_on_errors:
+                self.abort_error = code
+        self._tail = (self._tail + text)[-self.tail_size:]
+
+
+def oracle_errors_message(error_codes):
+    """
+    :param error_codes: The ORA codes found in the output, in order (List)
+    :return: The result message for the errors or None if there were none (String)
+    """
+    if not error_codes:
+        return None
+    for code, message in KNOWN_ORACLE_ERRORS:
+        if code in error_codes:
+            return message
+    if len(error_codes) > 1:
+        error_message = u"Oracle errors occurred {0}."
+    else:
+        error_message = u"Oracle error occurred {0}."
+    return error_message.format(', '.join(error_codes))
+
+
+def scan_oracle_output(output, abort_on_errors=()):
+    """
+    :param output: The complete sqlplus output (String)
+    :return: An OracleOutputScanner which has scanned the output
+    """
+    scanner = OracleOutputScanner(abort_on_errors)
+    scanner.feed(output)
+    scanner.close()
+    return scanner
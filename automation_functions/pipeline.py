@@ -0,0 +1,235 @@
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+
+STEP_MARKER = '__AF_STEP__'
+
+
+class RemotePipeline(object):
+    """
+    Queues Automation operations and runs every queued remote step, including its existence checks,
+    as one generated script in a single remote command. Results are split back into the same tuples
+    the individual Automation methods return, in the order the operations were queued.
+
+    remote_copy_files is a local transfer, so it is run on its own between the remote scripts.
+
+    pipeline = automation.pipeline()
+    pipeline.remote_copy_files(['/local/create_ts.sql'], '/tmp/')
+    pipeline.move_files(['/tmp/create_ts.sql'], '/home/oracle')
+    pipeline.change_file_ownership('oracle', ['/home/oracle/create_ts.sql'])
+    pipeline.execute_oracle_sql_script('/home/oracle/create_ts.sql', ['TS1'])
+    results = pipeline.execute()
+    """
+
+    def __init__(self, automation, stop_on_failure=True):
+        """
+        :param automation: The Automation instance the steps are built and run with
+        :param stop_on_failure: Do not run the remaining steps once a step fails (Bool)
+        """
+        self.automation = automation
+        self.stop_on_failure = stop_on_failure
+        self._operations = []
+
+    def __len__(self):
+        return len(self._operations)
+
+    def remote_copy_files(self, files, destination_directory, **kwargs):
+        self._operations.append(('copy', (files, destination_directory), kwargs))
+        return self
+
+    def execute_shell_script(self, script_file_name, su_as='root'):
+        return self._add_step(self.automation._execute_shell_script_step(script_file_name, su_as))
+
+    def move_files(self, files, destination_directory, su_as='root'):
+        return self._add_step(self.automation._move_files_step(files, destination_directory, su_as))
+
+    def mount_file_system(self, source_file_system, mount_directory, su_as='root'):
+        return self._add_step(self.automation._mount_file_system_step(source_file_system, mount_directory, su_as))
+
+    def unmount_file_system(self, mount_directory, su_as='root'):
+        return self._add_step(self.automation._unmount_file_system_step(mount_directory, su_as))
+
+    def change_file_ownership(self, chown_username, files, chown_groupname='', recursive=False, su_as='root'):
+        return self._add_step(self.automation._change_file_ownership_step(chown_username, files, chown_groupname,
+                                                                          recursive, su_as))
+
+    def create_directory(self, folder_path_name, su_as='root'):
+        return self._add_step(self.automation._create_directory_step(folder_path_name, su_as))
+
+    def execute_oracle_sql_script(self, script_file, script_parameters, su_as='oracle'):
+        return self._add_step(self.automation._execute_oracle_sql_script_step(script_file, script_parameters, su_as))
+
+    def execute(self):
+        """
+        :return: A list with one result tuple per queued operation, in queue order. Operations which were not
+        run because an earlier one failed get (True, message, None)
+
+        The queue is emptied so the pipeline can be reused.
+        """
+        operations = self._operations
+        self._operations = []
+        with self.automation.instrumentation.span('pipeline', host=self.automation.hostname) as span:
+            results = self._execute_operations(operations)
+            span.record(status=all(self._succeeded(result) for result in results))
+            return results
+
+    def build_script(self, steps):
+        """
+        :param steps: A list of RemoteStep (List)
+        :return: A shell script which runs every step as its su_as user and prints marker lines around the
+        output of each step (String)
+
+        The script is run as root. Each step prints BEGIN, then MISSING with the first missing path or its
+        output followed by END with the exit code and whether the step failed.
+        """
+        lines = []
+        for index, step in enumerate(steps):
+            lines.append("printf '%s|%s|BEGIN\\n' {MARKER} {INDEX}".format(MARKER=STEP_MARKER, INDEX=index))
+            lines.append('af_missing=')
+            if step.check_paths:
+                lines.append('for af_path in {PATHS}; do if [ ! -f "$af_path" ] && [ ! -d "$af_path" ]; then '
+                             'af_missing=$af_path; break; fi; done'.format(
+                                 PATHS=' '.join(quote(path) for path in step.check_paths)))
+            lines.append('if [ -n "$af_missing" ]; then')
+            lines.append("printf '%s|%s|MISSING|%s\\n' {MARKER} {INDEX} \"$af_missing\"".format(MARKER=STEP_MARKER,
+                                                                                              INDEX=index))
+            if self.stop_on_failure:
+                lines.append('exit 0')
+            lines.append('else')
+            command = self._step_command(step)
+            if step.failure_pattern:
+                lines.append('af_output=$({COMMAND} 2>&1); af_rc=$?'.format(COMMAND=command))
+                lines.append("printf '%s\\n' \"$af_output\"")
+                lines.append('af_failed=0; [ $af_rc -ne 0 ] && af_failed=1')
+                lines.append("printf '%s\\n' \"$af_output\" | grep -Eq {PATTERN} && af_failed=1".format(
+                    PATTERN=quote(step.failure_pattern)))
+            else:
+                lines.append('{COMMAND} 2>&1; af_rc=$?'.format(COMMAND=command))
+                lines.append('af_failed=0; [ $af_rc -ne 0 ] && af_failed=1')
+            lines.append("printf '\\n%s|%s|END|%s|%s\\n' {MARKER} {INDEX} $af_rc $af_failed".format(
+                MARKER=STEP_MARKER, INDEX=index))
+            if self.stop_on_failure:
+                lines.append('[ $af_failed -ne 0 ] && exit 0')
+            lines.append('fi')
+        return '\n'.join(lines)
+
+    def parse_script_output(self, steps, result):
+        """
+        :param steps: The list of RemoteStep the script was built from (List)
+        :param result: The dict returned from execute_remote_command for the script
+        :return: A list with one result tuple per step (List)
+        """
+        hostname = self.automation.hostname
+        if not result.get('status'):
+            return [step.parse(result) for step in steps]
+
+        outputs = {}
+        ends = {}
+        missing = {}
+        current = None
+        for line in (result.get('stdout') or '').splitlines():
+            position = line.find(STEP_MARKER + '|')
+            fields = line[position:].strip().split('|') if position != -1 else []
+            if len(fields) >= 3 and fields[1].isdigit() and fields[2] in ('BEGIN', 'MISSING', 'END'):
+                index = int(fields[1])
+                if fields[2] == 'BEGIN':
+                    current = index
+                    outputs[index] = []
+                elif fields[2] == 'MISSING' and len(fields) >= 4:
+                    missing[index] = '|'.join(fields[3:])
+                    current = None
+                elif fields[2] == 'END' and len(fields) == 5:
+                    ends[index] = int(fields[3]) if fields[3].lstrip('-').isdigit() else None
+                    current = None
+                continue
+            if current is not None:
+                outputs[current].append(line)
+
+        results = []
+        for index, step in enumerate(steps):
+            if index in missing:
+                results.append(step.missing_result(missing[index], hostname))
+            elif index in ends:
+                results.append(step.parse({'status': True,
+                                           'exit_code': ends[index],
+                                           'stdout': u'\n'.join(outputs[index]).rstrip(u'\n'),
+                                           'stderr': u'',
+                                           'msg': u''}))
+            elif index in outputs:
+                # The step started but the script ended before it finished
+                results.append(step.parse({'status': True,
+                                           'exit_code': None,
+                                           'stdout': u'\n'.join(outputs[index]),
+                                           'stderr': u'',
+                                           'msg': u''}))
+            else:
+                results.append(self._skipped_result(step.name))
+        return results
+
+    def _add_step(self, step):
+        self._operations.append(('step', step))
+        return self
+
+    def _execute_operations(self, operations):
+        results = []
+        batch = []
+        failed = False
+        for operation in operations + [None]:
+            if operation is not None and operation[0] == 'step':
+                batch.append(operation[1])
+                continue
+
+            if batch:
+                if failed:
+                    results.extend(self._skipped_result(step.name) for step in batch)
+                else:
+                    batch_results = self._run_steps(batch)
+                    results.extend(batch_results)
+                    failed = self.stop_on_failure and any(not self._succeeded(result) for result in batch_results)
+                batch = []
+
+            if operation is not None:
+                if failed:
+                    results.append(self._skipped_result('remote_copy_files'))
+                else:
+                    args, kwargs = operation[1], operation[2]
+                    result = self.automation.remote_copy_files(*args, **kwargs)
+                    results.append(result)
+                    failed = self.stop_on_failure and not self._succeeded(result)
+        return results
+
+    def _run_steps(self, steps):
+        command = ['sudo su -', self.build_script(steps)]
+        result = self.automation.execute_remote_command(command)
+        results = self.parse_script_output(steps, result)
+        if self.automation.metadata_cache is not None:
+            if not result.get('status'):
+                # Unknown how far the script got
+                self.automation.metadata_cache.invalidate(self.automation.hostname)
+            else:
+                for step, step_result in zip(steps, results):
+                    # Steps skipped after an earlier failure report None and changed nothing
+                    if step_result[2] is not None:
+                        self.automation._update_metadata_cache(step, step_result[0] and step_result[2])
+        return results
+
+    def _step_command(self, step):
+        """
+        :return: The step's command run as its su_as user from inside the root script (String)
+        """
+        sudo_su = self.automation._sudo_su_command(step.su_as)
+        if sudo_su == 'sudo su -':
+            return '( {COMMAND} )'.format(COMMAND=step.command)
+        return 'su - {SU_AS} -c {COMMAND}'.format(SU_AS=step.su_as.lower(), COMMAND=quote(step.command))
+
+    @staticmethod
+    def _succeeded(result):
+        if len(result) == 2:
+            return bool(result[0])
+        return bool(result[0] and result[2])
+
+    def _skipped_result(self, name):
+        return True, u"Did not run {0} on {1} because an earlier step failed.".format(name,
+                                                                                      self.automation.hostname), None
@@ -0,0 +1,65 @@
+class RemoteStep(object):
+    """
+    One remote operation as built by an Automation method: the paths that must exist before it runs,
+    the command to run as su_as and how to turn the ssh client result into the method's result tuple.
+
+    Automation runs a single step on its own, RemotePipeline compiles many steps into one remote script.
+    """
+
+    def __init__(self, name, command, su_as='root', check_paths=(),
+                 missing_message=u"The file '{PATH}' on {HOSTNAME} does not exist.",
+                 unknown_message=u"Unable to determine if the files '{PATHS}' on {HOSTNAME} exist.",
+                 success_message=u"Successfully executed.", error_message=u"Failed to execute.",
+                 result_parser=None, failure_pattern=None, invalidates=(), invalidates_trees=(),
+                 removes=(), creates_directories=(), changes_metadata=()):
+        """
+        :param name: The name of the Automation method which built the step (String)
+        :param command: The shell command to run, without the sudo su prefix (String)
+        :param su_as: The name of the user su as to run/execute the command (String)
+        :param check_paths: Remote paths which must exist as a file or directory before the command runs (List)
+        :param missing_message: Message template with {PATH} and {HOSTNAME} for a missing path (String)
+        :param unknown_message: Message template with {PATHS} and {HOSTNAME} when the check fails (String)
+        :param success_message: Message when the command succeeds (String)
+        :param error_message: Message when the command fails (String)
+        :param result_parser: Callable of (result, success_message, error_message) returning the result tuple
+        :param failure_pattern: Extended regex which marks the step failed when found in its output (String)
+        :param invalidates: Remote paths whose cached metadata is stale once the command ran (List)
+        :param invalidates_trees: Remote directories whose cached metadata, and everything below, is stale (List)
+        :param removes: Remote paths which no longer exist once the command succeeded (List)
+        :param creates_directories: Remote directories which exist once the command succeeded (List)
+        :param changes_metadata: Remote paths which still exist but whose stat metadata changed (List)
+        """
+        self.name = name
+        self.command = command
+        self.su_as = su_as
+        self.check_paths = list(check_paths)
+        self.missing_message = missing_message
+        self.unknown_message = unknown_message
+        self.success_message = success_message
+        self.error_message = error_message
+        self.result_parser = result_parser
+        self.failure_pattern = failure_pattern
+        self.invalidates = list(invalidates)
+        self.invalidates_trees = list(invalidates_trees)
+        self.removes = list(removes)
+        self.creates_directories = list(creates_directories)
+        self.changes_metadata = list(changes_metadata)
+
+    def missing_result(self, path, hostname):
+        """
+        :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
+        """
+        return True, self.missing_message.format(PATH=path, HOSTNAME=hostname), False
+
+    def unknown_result(self, hostname):
+        """
+        :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
+        """
+        return False, self.unknown_message.format(PATHS=' '.join(self.check_paths), HOSTNAME=hostname), None
+
+    def parse(self, result):
+        """
+        :param result: The dict returned from execute_remote_command
+        :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool)
+        """
+        return self.result_parser(result, self.success_message, self.error_message)
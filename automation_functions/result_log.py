@@ -0,0 +1,205 @@
+from datetime import datetime
+import atexit
+import json
+import os
+import tempfile
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+# One directory per user, the temp directory is shared with every other user on the machine
+DEFAULT_LOG_DIRECTORY = os.path.join(tempfile.gettempdir(), 'automation_functions-{0}'.format(os.getuid()))
+LOG_FILE_NAME = 'command_results.jsonl'
+
+
+class ResultLog(object):
+    """
+    Writes command results as JSON lines from a background thread.
+
+    log() only puts the record on a bounded queue, so callers never wait on the disk. The writer thread
+    takes every record waiting on the queue at once and appends them with a single write, rolling
+    command_results.jsonl over to command_results.jsonl.1 and so on once it reaches max_bytes. When the
+    queue is full log() waits up to put_timeout seconds for room and then drops the record, counting it
+    in dropped. Records still queued are written when the process exits.
+
+    The directory is created readable by its owner only and the log files are created with mode 0600. An
+    existing directory owned by another user is refused, its records are counted in write_errors.
+
+    result_log = ResultLog(directory='/var/log/automation', max_bytes=52428800)
+    automation = Automation(hostname=ip_address, username='cloud', private_key_file=key, result_log=result_log)
+    """
+
+    def __init__(self, directory=DEFAULT_LOG_DIRECTORY, max_bytes=10485760, backup_count=5, max_queue_size=10000,
+                 batch_size=1000, put_timeout=0):
+        """
+        :param directory: The directory the log files are written to, created with mode 0700 if missing (String)
+        :param max_bytes: The size a log file is rolled over at, 0 never rolls over (Int)
+        :param backup_count: The number of rolled over files kept (Int)
+        :param max_queue_size: The number of records which can wait for the writer (Int)
+        :param batch_size: The most records written with one write (Int)
+        :param put_timeout: Seconds log() waits for room on a full queue before dropping the record (Float)
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.put_timeout = put_timeout
+        self.dropped = 0
+        self.write_errors = 0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    @property
+    def file_name(self):
+        return os.path.join(self.directory, LOG_FILE_NAME)
+
+    def log(self, **record):
+        """
+        Queue a record for writing. Datetimes are written in ISO 8601 and bytes are decoded as UTF-8.
+
+        :return: True if the record was queued, False if it was dropped (Bool)
+        """
+        if self._closed:
+            return False
+        self._start()
+        try:
+            if self.put_timeout:
+                self._queue.put(record, timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def flush(self, timeout=None):
+        """
+        :param timeout: Seconds to wait for the writer, None waits until it is done (Float)
+        :return: True once every record queued before the call is written, False on timeout (Bool)
+        """
+        if self._thread is None or self._closed:
+            return True
+        written = threading.Event()
+        try:
+            self._queue.put(written, timeout=timeout)
+        except queue.Full:
+            return False
+        return written.wait(timeout)
+
+    def close(self, timeout=None):
+        """
+        Write the queued records and stop the writer thread. Records logged afterwards are dropped.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._closed:
+                thread = threading.Thread(target=self._write_records, name='ResultLogWriter')
+                thread.daemon = True
+                thread.start()
+                self._thread = thread
+                atexit.register(self.close)
+
+    def _write_records(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [record for record in batch if isinstance(record, dict)]
+            if records:
+                try:
+                    self._append([_to_json_line(record).encode('utf-8') for record in records])
+                except (IOError, OSError, TypeError, ValueError):
+                    self.write_errors += len(records)
+
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+            if None in batch:
+                return
+
+    def _append(self, lines):
+        """
+        :param lines: Encoded JSON lines, written with one write per log file they fill (List)
+        """
+        self._check_directory()
+        size = os.path.getsize(self.file_name) if os.path.exists(self.file_name) else 0
+        while lines:
+            # Fill the current file up to max_bytes, a file always takes at least one line
+            count = len(lines)
+            if self.max_bytes:
+                count = 0
+                while count < len(lines) and (size + len(lines[count]) <= self.max_bytes or (size == 0 and count == 0)):
+                    size += len(lines[count])
+                    count += 1
+            if count == 0:
+                self._roll_over()
+                size = 0
+                continue
+            with os.fdopen(os.open(self.file_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600), 'ab') as log_file:
+                log_file.write(b''.join(lines[:count]))
+            lines = lines[count:]
+
+    def _check_directory(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory, 0o700)
+        if os.stat(self.directory).st_uid != os.getuid():
+            raise OSError('Result log directory {0} is not owned by the current user.'.format(self.directory))
+
+    def _roll_over(self):
+        for index in range(self.backup_count - 1, 0, -1):
+            source = '{0}.{1}'.format(self.file_name, index)
+            if os.path.exists(source):
+                os.rename(source, '{0}.{1}'.format(self.file_name, index + 1))
+        if self.backup_count:
+            os.rename(self.file_name, self.file_name + '.1')
+        else:
+            os.remove(self.file_name)
+
+
+def _to_json_line(record):
+    return u"{0}\n".format(json.dumps(record, sort_keys=True, default=_json_default))
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode('utf-8', 'replace')
+    return u"{0}".format(value)
+
+
+_default_result_log = None
+_default_result_log_lock = threading.Lock()
+
+
+def get_default_result_log():
+    """
+    :return: The process wide ResultLog shared by every Automation instance, writing to DEFAULT_LOG_DIRECTORY
+    """
+    global _default_result_log
+    with _default_result_log_lock:
+        if _default_result_log is None:
+            _default_result_log = ResultLog()
+        return _default_result_log
@@ -0,0 +1,124 @@
+import base64
+import os
+import posixpath
+import uuid
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+
+SCRIPT_MARKER = '__AF_SCRIPT__'
+DEFAULT_CACHE_DIRECTORY = '/var/lib/automation_functions/scripts'
+PARTIAL_SUFFIX = '.af_partial'
+
+# Succeeds if the directory and every directory above it are owned by root and cannot be written by the
+# group or other users, so nobody but root can replace a cached script or the directories holding it
+_TRUSTED_FUNCTION = ('af_trusted() { af_dir="$1"; while :; do '
+                     '[ -n "$(find "$af_dir" -maxdepth 0 -user 0 ! -perm /022 2>/dev/null)" ] || return 1; '
+                     'case "$af_dir" in /|.) return 0 ;; esac; af_dir=$(dirname "$af_dir"); done; }; ')
+
+
+def cached_script_path(cache_directory, digest, local_path):
+    """
+    :param cache_directory: The remote directory holding the cached scripts (String)
+    :param digest: The sha256 hex digest of the script (String)
+    :param local_path: The local script (String)
+    :return: The remote path the script is cached at, a directory named after the digest holding the
+    script under its own file name so sqlplus and error messages still see that name (String)
+    """
+    return posixpath.join(cache_directory, digest, os.path.basename(local_path))
+
+
+def build_run_if_cached_command(cached_path, digest, command):
+    """
+    :param cached_path: The remote path of the cached script (String)
+    :param digest: The sha256 hex digest of the script (String)
+    :param command: The command which runs the cached script (String)
+    :return: A shell command which runs command if the script is cached and otherwise only prints a
+    marker line saying it is missing (String)
+
+    The cached copy is only run if it and the directories holding it are root's alone and it still has
+    its digest. Anything else is reported as missing and installed again.
+    """
+    return _TRUSTED_FUNCTION + (
+        'if af_trusted {DIRECTORY} && [ -n "$(find {PATH} -maxdepth 0 -type f -user 0 ! -perm /022 2>/dev/null)" ] '
+        '&& [ "$(sha256sum < {PATH} | cut -d" " -f1)" = {DIGEST} ]; then {COMMAND}; '
+        'else printf \'%s|missing\\n\' {MARKER}; fi').format(DIRECTORY=quote(posixpath.dirname(cached_path)),
+                                                           PATH=quote(cached_path),
+                                                           DIGEST=digest,
+                                                           COMMAND=command,
+                                                           MARKER=SCRIPT_MARKER)
+
+
+def is_missing(stdout):
+    """
+    :param stdout: The stdout of a command built by build_run_if_cached_command (String)
+    :return: True if the script was not in the cache and nothing was run (Bool)
+    """
+    return u"{0}|missing".format(SCRIPT_MARKER) in (stdout or u'')
+
+
+def build_install_commands(local_path, cached_path, digest, max_length):
+    """
+    :param local_path: The local script (String)
+    :param cached_path: The remote path to cache it at (String)
+    :param digest: The sha256 hex digest of the local script (String)
+    :param max_length: The longest command to build, longer scripts are sent over several commands (Int)
+    :return: A list of shell commands to run as root in order, each prints a marker line with untrusted if
+    the cache directory is not root's alone and the last one prints installed, mismatch or failed (List)
+
+    The script is sent base64 encoded inside the commands, so installing works over any connection and
+    through elevated shells. It is written next to its final name and only moved there once its digest
+    matches, so a cached script is always complete and a cache directory always holds what its name says.
+    Every install writes to a partial file of its own, so installs of the same script at the same time do
+    not mix their chunks and the last one to finish moves its verified copy into place. Partial files left
+    by installs which were cut off are removed after an hour. Cached scripts stay owned by root with mode
+    0644 so every su_as user can run them and none can change them.
+    """
+    with open(local_path, 'rb') as script_file:
+        encoded = base64.b64encode(script_file.read()).decode('ascii')
+
+    directory = quote(posixpath.dirname(cached_path))
+    partial_path = quote('{0}.{1}{2}'.format(cached_path, uuid.uuid4().hex, PARTIAL_SUFFIX))
+    # Leave room for the command around the encoded script, base64 needs multiples of 4 characters
+    chunk_size = max(4, (max_length - 1024) // 4 * 4)
+    chunks = [encoded[offset:offset + chunk_size] for offset in range(0, len(encoded), chunk_size)] or ['']
+
+    commands = []
+    for index, chunk in enumerate(chunks):
+        if index == 0:
+            write = '(umask 022 && mkdir -p {DIRECTORY}) && chmod 0755 {DIRECTORY} && af_trusted {DIRECTORY}; then ' \
+                    'find {DIRECTORY} -maxdepth 1 -name \'*{SUFFIX}\' -mmin +60 -delete; ' \
+                    'printf \'%s\' \'{CHUNK}\' | base64 -d > {PARTIAL}'
+        else:
+            write = 'af_trusted {DIRECTORY}; then printf \'%s\' \'{CHUNK}\' | base64 -d >> {PARTIAL}'
+        if index == len(chunks) - 1:
+            write += ('; if [ "$(sha256sum < {PARTIAL} | cut -d" " -f1)" != {DIGEST} ]; then '
+                      'rm -f {PARTIAL}; printf \'%s|mismatch\\n\' {MARKER}; '
+                      'elif chmod 0644 {PARTIAL} && mv -f {PARTIAL} {PATH}; then '
+                      'printf \'%s|installed\\n\' {MARKER}; '
+                      'else rm -f {PARTIAL}; printf \'%s|failed\\n\' {MARKER}; fi')
+        command = 'if ' + write + '; else printf \'%s|untrusted\\n\' {MARKER}; fi'
+        commands.append(_TRUSTED_FUNCTION + command.format(DIRECTORY=directory,
+                                                           CHUNK=chunk,
+                                                           PARTIAL=partial_path,
+                                                           SUFFIX=PARTIAL_SUFFIX,
+                                                           DIGEST=digest,
+                                                           PATH=quote(cached_path),
+                                                           MARKER=SCRIPT_MARKER))
+    return commands
+
+
+def install_outcome(stdout):
+    """
+    :param stdout: The stdout of a command built by build_install_commands (String)
+    :return: untrusted if the cache directory or a directory above it is not owned by root or can be written
+    by other users, installed if the script was verified and moved into the cache, mismatch if the copy sent
+    did not have the script's digest, failed if it could not be moved, or None (String)
+    """
+    for outcome in ('untrusted', 'installed', 'mismatch', 'failed'):
+        if u"{0}|{1}".format(SCRIPT_MARKER, outcome) in (stdout or u''):
+            return outcome
+    return None
@@ -0,0 +1,198 @@
+from datetime import datetime
+import socket
+
+from automation_functions import connection_pool
+from automation_functions import oracle
+
+
+SQL_MARKER = '__AF_SQL__'
+
+
+class SqlPlusSession(object):
+    """
+    Keeps one sqlplus process open on a host and runs many scripts through it, so the login shell,
+    sqlplus startup and database connection are paid once instead of once per script.
+
+    Every script is wrapped in PROMPT delimiters so its output, and the ORA- errors in it, are attributed
+    to that script alone. A script which ends with EXIT ends the session; it is reopened for the next script.
+    Session settings such as WHENEVER SQLERROR carry over from one script to the next.
+
+    with automation.sqlplus_session() as session:
+        ssh_status, message, status, errors = session.run_script('/home/oracle/create_ts.sql', ['TS1'])
+    """
+
+    def __init__(self, automation, su_as='oracle', connect_string='/ as sysdba', abort_on_errors=(),
+                 tail_size=65536):
+        """
+        :param automation: The Automation instance whose host and credentials are used
+        :param su_as: The name of the user su as to run sqlplus (String)
+        :param connect_string: The sqlplus logon, for example '/ as sysdba' (String)
+        :param abort_on_errors: ORA codes which end the session as soon as they appear in a script's output (List)
+        :param tail_size: The number of trailing output characters kept per script (Int)
+        """
+        self.automation = automation
+        self.su_as = su_as
+        self.connect_string = connect_string
+        self.abort_on_errors = abort_on_errors
+        self.tail_size = tail_size
+        self.scripts_run = 0
+        self._pool = None
+        self._pool_key = None
+        self._connection = None
+        self._channel = None
+        self._buffer = b''
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def is_open(self):
+        return self._channel is not None and not self._channel.closed
+
+    def open(self):
+        """
+        Start sqlplus in a login shell of su_as on a pooled connection. Does nothing if already open.
+        """
+        if self.is_open:
+            return
+        self.close()
+        automation = self.automation
+        self._pool = automation.connection_pool or connection_pool.get_default_pool()
+        self._pool_key, self._connection = self._pool.acquire(automation.hostname,
+                                                               automation.username,
+                                                               automation.private_key_file,
+                                                               getattr(automation, 'port', 22),
+                                                               automation.connection_timeout)
+        try:
+            channel = self._connection.client.get_transport().open_session()
+            channel.settimeout(automation.command_timeout)
+            channel.get_pty()
+            sudo_su = automation._sudo_su_command(self.su_as)
+            channel.exec_command(connection_pool.build_command_string(
+                [sudo_su, 'stty -echo; sqlplus -S {0}'.format(self.connect_string)]))
+        except Exception:
+            self._pool.release(self._pool_key, self._connection, discard=True)
+            self._connection = None
+            raise
+        self._channel = channel
+        self._buffer = b''
+
+    def close(self):
+        """
+        Exit sqlplus and return the connection to the pool.
+        """
+        if self._channel is not None:
+            try:
+                if not self._channel.closed:
+                    self._channel.sendall(b'EXIT\n')
+            except (socket.error, EOFError, IOError):
+                pass
+            self._channel.close()
+            self._channel = None
+        if self._connection is not None:
+            self._pool.release(self._pool_key, self._connection)
+            self._connection = None
+
+    def run_script(self, script_file, script_parameters=()):
+        """
+        :param script_file: A string of the full path and file name of the sql script (String)
+        :param script_parameters: A list or tuple of the parameters for the script (String)
+        :return: A tuple of ssh connection status (Bool), Result Message (String), command execution status (Bool),
+        list of error dicts with the keys code and message (List)
+        """
+        step = self.automation._execute_oracle_sql_script_step(script_file, script_parameters, self.su_as)
+        try:
+            self.open()
+        except Exception as error:
+            message = u"Unable to start sqlplus on {0}: {1}; {2}".format(self.automation.hostname, error,
+                                                                          step.error_message)
+            return False, message, None, []
+
+        index = self.scripts_run
+        self.scripts_run += 1
+        invocation = '@{0} {1}'.format(script_file, ' '.join(script_parameters)).rstrip()
+        request = 'PROMPT {MARKER}|{INDEX}|BEGIN\n{INVOCATION}\nPROMPT {MARKER}|{INDEX}|END\n'.format(
+            MARKER=SQL_MARKER, INDEX=index, INVOCATION=invocation)
+
+        scanner = oracle.OracleOutputScanner(abort_on_errors=self.abort_on_errors, tail_size=self.tail_size)
+        datetime_executed = datetime.now()
+        try:
+            with self.automation.instrumentation.span('sqlplus_run_script', host=self.automation.hostname,
+                                                      su_as=self.su_as) as span:
+                self._channel.sendall(request.encode('utf-8'))
+                finished = self._read_script_output(index, scanner)
+                span.record(round_trips=1, bytes_out=len(request), bytes_in=scanner.bytes_seen,
+                            status=finished and not scanner.errors)
+        except (socket.timeout, socket.error, EOFError, IOError) as error:
+            self.close()
+            message = u"Lost the sqlplus session on {0}: {1}; {2}".format(self.automation.hostname, error,
+                                                                         step.error_message)
+            return False, message, None, scanner.errors
+        scanner.close()
+        # The session stays open so there is no exit code, the tail of the output and the errors are logged
+        self.automation._log_command_results(command=['sqlplus', invocation],
+                                             datetime_executed=datetime_executed,
+                                             action='Run sql script in sqlplus session',
+                                             returncode=None,
+                                             stdout=scanner.tail,
+                                             stderr=u'',
+                                             server=self.automation.hostname,
+                                             errors=scanner.errors)
+
+        if scanner.abort_error:
+            self.close()
+            message = u"Aborted sql script {0} after Oracle error {1}.".format(script_file, scanner.abort_error)
+            return True, message, False, scanner.errors
+        if 'SP2-0310' in scanner.tail:
+            message = step.missing_message.format(PATH=script_file, HOSTNAME=self.automation.hostname)
+            return True, message, False, scanner.errors
+
+        if finished:
+            exit_code = 0
+        else:
+            # The script ended the session, report the exit status of sqlplus
+            exit_code = self._channel.recv_exit_status()
+            self.close()
+        result = {'status': True, 'exit_code': exit_code, 'stdout': scanner.tail, 'msg': u''}
+        if exit_code == 0 and scanner.errors:
+            return True, oracle.oracle_errors_message(scanner.error_codes), False, scanner.errors
+        return self.automation._parse_ssh_client_result(result,
+                                                        success_message=step.success_message,
+                                                        error_message=step.error_message) + (scanner.errors,)
+
+    def run_scripts(self, scripts):
+        """
+        :param scripts: A list of (script file, script parameters) tuples (List)
+        :return: A list of result tuples as returned by run_script, in the same order (List)
+        """
+        return [self.run_script(script_file, script_parameters) for script_file, script_parameters in scripts]
+
+    def _read_script_output(self, index, scanner):
+        """
+        :return: True once the END delimiter for the script was read, False if sqlplus exited first (Bool)
+        """
+        begin = '{0}|{1}|BEGIN'.format(SQL_MARKER, index).encode('utf-8')
+        end = '{0}|{1}|END'.format(SQL_MARKER, index).encode('utf-8')
+        started = False
+        while True:
+            while b'\n' in self._buffer:
+                line, self._buffer = self._buffer.split(b'\n', 1)
+                stripped = line.strip()
+                if stripped == begin:
+                    started = True
+                elif stripped == end:
+                    return True
+                elif started:
+                    if scanner.feed(line + b'\n') is False:
+                        return False
+            data = self._channel.recv(32768)
+            if not data:
+                if started and self._buffer:
+                    scanner.feed(self._buffer)
+                self._buffer = b''
+                return False
+            self._buffer += data
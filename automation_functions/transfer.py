@@ -0,0 +1,405 @@
+import hashlib
+import os.path
+import posixpath
+import threading
+import zlib
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+import paramiko
+
+from automation_functions import connection_pool
+
+
+DIGEST_MARKER = '__AF_DIGEST__'
+RANGE_MARKER = '__AF_RANGE__'
+BLOCK_SIZE = 32768
+PARTIAL_SUFFIX = '.af_partial'
+MANIFEST_SUFFIX = '.af_manifest'
+
+
+def local_file_digest(file_name, block_size=1048576):
+    """
+    :param file_name: The local file to hash (String)
+    :param block_size: Bytes read at a time (Int)
+    :return: The sha256 hex digest of the file (String)
+    """
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as file_object:
+        for block in iter(lambda: file_object.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def remote_path_for(file_name, destination_directory):
+    """
+    :return: The remote path a local file is copied to inside destination_directory (String)
+    """
+    return posixpath.join(destination_directory, os.path.basename(file_name))
+
+
+def build_remote_digest_command(remote_files):
+    """
+    :param remote_files: A list of (remote path, expected size) tuples (List)
+    :return: A single shell command printing a marker line with the sha256 of every remote file whose
+    size matches the expected size (String)
+
+    Files that are missing or have a different size are reported with an empty digest without being hashed.
+    """
+    checks = []
+    for index, (remote_path, size) in enumerate(remote_files):
+        quoted_path = quote(remote_path)
+        checks.append('d=; if [ -f {PATH} ] && [ "$(stat -c %s {PATH})" = "{SIZE}" ]; then '
+                      'd=$(sha256sum < {PATH} | cut -d" " -f1); fi; '
+                      'printf \'%s|%s|%s\\n\' {MARKER} {INDEX} "$d"'.format(PATH=quoted_path,
+                                                                          SIZE=size,
+                                                                          MARKER=DIGEST_MARKER,
+                                                                          INDEX=index))
+    return '; '.join(checks)
+
+
+def parse_remote_digest_output(remote_files, stdout):
+    """
+    :param remote_files: The list of (remote path, expected size) tuples the command was built from (List)
+    :param stdout: The stdout of the command built by build_remote_digest_command (String)
+    :return: A dict of remote path to sha256 hex digest for files which exist with the expected size (Dict)
+    """
+    digests = {}
+    for line in stdout.splitlines():
+        position = line.find(DIGEST_MARKER + '|')
+        if position == -1:
+            continue
+        fields = line[position:].strip().split('|')
+        if len(fields) != 3 or not fields[2]:
+            continue
+        try:
+            remote_path = remote_files[int(fields[1])][0]
+        except (ValueError, IndexError):
+            continue
+        digests[remote_path] = fields[2]
+    return digests
+
+
+def upload_files(transport, uploads, max_in_flight=4, block_size=BLOCK_SIZE):
+    """
+    :param transport: An active paramiko Transport
+    :param uploads: A list of (local path, remote path) tuples (List)
+    :param max_in_flight: The number of files uploaded at the same time, each over its own SFTP channel (Int)
+    :param block_size: Bytes written per SFTP write request (Int)
+    :return: A dict of local path to error message for every upload which failed (Dict)
+
+    Writes are pipelined so the client does not wait for each write to be acknowledged before sending the next.
+    """
+    pending = Queue()
+    for upload in uploads:
+        pending.put(upload)
+    errors = {}
+    errors_lock = threading.Lock()
+
+    def worker():
+        sftp = None
+        try:
+            sftp = paramiko.SFTPClient.from_transport(transport)
+            while True:
+                try:
+                    local_path, remote_path = pending.get_nowait()
+                except Empty:
+                    return
+                try:
+                    _upload_file(sftp, local_path, remote_path, block_size)
+                except (IOError, OSError, paramiko.SSHException) as error:
+                    with errors_lock:
+                        errors[local_path] = u"{0}".format(error)
+        except (IOError, OSError, paramiko.SSHException) as error:
+            # The channel could not be opened, fail everything left for this worker
+            while True:
+                try:
+                    local_path, remote_path = pending.get_nowait()
+                except Empty:
+                    break
+                with errors_lock:
+                    errors[local_path] = u"{0}".format(error)
+        finally:
+            if sftp is not None:
+                sftp.close()
+
+    workers = [threading.Thread(target=worker) for _ in range(max(1, min(max_in_flight, len(uploads))))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return errors
+
+
+def plan_ranged_upload(local_path, remote_path, chunk_size):
+    """
+    :param local_path: The local file (String)
+    :param remote_path: The final remote path (String)
+    :param chunk_size: Bytes per range (Int)
+    :return: A dict with the keys local_path, remote_path, partial_path, manifest_path, size, chunk_size,
+    digest (sha256 of the whole file) and chunks, a list of (index, offset, length, sha256) tuples (Dict)
+
+    The file is read once to hash every range and the whole file.
+    """
+    file_digest = hashlib.sha256()
+    chunks = []
+    with open(local_path, 'rb') as local_file:
+        offset = 0
+        while True:
+            chunk_digest = hashlib.sha256()
+            length = 0
+            while length < chunk_size:
+                block = local_file.read(min(1048576, chunk_size - length))
+                if not block:
+                    break
+                chunk_digest.update(block)
+                file_digest.update(block)
+                length += len(block)
+            if not length:
+                break
+            chunks.append((len(chunks), offset, length, chunk_digest.hexdigest()))
+            offset += length
+    return {'local_path': local_path,
+            'remote_path': remote_path,
+            'partial_path': remote_path + PARTIAL_SUFFIX,
+            'manifest_path': remote_path + MANIFEST_SUFFIX,
+            'size': offset,
+            'chunk_size': chunk_size,
+            'digest': file_digest.hexdigest(),
+            'chunks': chunks}
+
+
+def build_resume_query_command(plans):
+    """
+    :param plans: A list of plans from plan_ranged_upload (List)
+    :return: A single shell command printing, for every plan, whether its partial file exists and each
+    line of its manifest (String)
+    """
+    checks = []
+    for index, plan in enumerate(plans):
+        checks.append('if [ -f {PARTIAL} ] && [ -f {MANIFEST} ]; then '
+                      'while IFS= read -r l; do printf \'%s|%s|%s\\n\' {MARKER} {INDEX} "$l"; done < {MANIFEST}; '
+                      'fi'.format(PARTIAL=quote(plan['partial_path']),
+                                  MANIFEST=quote(plan['manifest_path']),
+                                  MARKER=RANGE_MARKER,
+                                  INDEX=index))
+    return '; '.join(checks)
+
+
+def parse_resume_query_output(plans, stdout):
+    """
+    :param plans: The list of plans the command was built from (List)
+    :param stdout: The stdout of the command built by build_resume_query_command (String)
+    :return: A list with the set of already verified chunk indexes for every plan, None where the upload
+    has to start over (List)
+    """
+    manifests = [[] for _ in plans]
+    for line in stdout.splitlines():
+        position = line.find(RANGE_MARKER + '|')
+        if position == -1:
+            continue
+        fields = line[position:].strip().split('|', 2)
+        if len(fields) != 3 or not fields[1].isdigit() or int(fields[1]) >= len(plans):
+            continue
+        manifests[int(fields[1])].append(fields[2].split())
+
+    verified = []
+    for plan, manifest in zip(plans, manifests):
+        header = ['header', str(plan['size']), str(plan['chunk_size']), plan['digest']]
+        if not manifest or manifest[0] != header:
+            # No partial upload of this exact file
+            verified.append(None)
+            continue
+        chunk_digests = dict((str(index), digest) for index, offset, length, digest in plan['chunks'])
+        verified.append(set(int(fields[0]) for fields in manifest[1:]
+                            if len(fields) == 2 and chunk_digests.get(fields[0]) == fields[1]))
+    return verified
+
+
+def build_resume_start_command(plans):
+    """
+    :param plans: A list of plans to start from scratch (List)
+    :return: A single shell command which creates an empty partial file and a new manifest for every plan and
+    prints a marker line for each one that is ready (String)
+    """
+    commands = []
+    for index, plan in enumerate(plans):
+        commands.append('rm -f {PARTIAL} {MANIFEST} && : > {PARTIAL} && '
+                        'printf \'header %s %s %s\\n\' {SIZE} {CHUNK_SIZE} {DIGEST} > {MANIFEST} && '
+                        'printf \'%s|%s|ready\\n\' {MARKER} {INDEX}'.format(PARTIAL=quote(plan['partial_path']),
+                                                                          MANIFEST=quote(plan['manifest_path']),
+                                                                          SIZE=plan['size'],
+                                                                          CHUNK_SIZE=plan['chunk_size'],
+                                                                          DIGEST=plan['digest'],
+                                                                          MARKER=RANGE_MARKER,
+                                                                          INDEX=index))
+    return '; '.join('{{ {0}; }}'.format(command) for command in commands)
+
+
+def build_finish_command(plans):
+    """
+    :param plans: A list of plans whose chunks were all verified (List)
+    :return: A single shell command which checks the whole file hash of every partial file, moves matching
+    files into place and prints a marker line with ok, mismatch or failed for each plan (String)
+
+    The manifest is removed either way, a file which does not match starts over on the next attempt.
+    """
+    checks = []
+    for index, plan in enumerate(plans):
+        checks.append('d=; if [ -f {PARTIAL} ]; then truncate -s {SIZE} {PARTIAL} && '
+                      'd=$(sha256sum < {PARTIAL} | cut -d" " -f1); fi; '
+                      'if [ "$d" = {DIGEST} ]; then if mv -f {PARTIAL} {REMOTE}; then r=ok; else r=failed; fi; '
+                      'else r=mismatch; fi; rm -f {MANIFEST}; '
+                      'printf \'%s|%s|%s\\n\' {MARKER} {INDEX} "$r"'.format(PARTIAL=quote(plan['partial_path']),
+                                                                          REMOTE=quote(plan['remote_path']),
+                                                                          MANIFEST=quote(plan['manifest_path']),
+                                                                          SIZE=plan['size'],
+                                                                          DIGEST=plan['digest'],
+                                                                          MARKER=RANGE_MARKER,
+                                                                          INDEX=index))
+    return '; '.join(checks)
+
+
+def parse_marker_results(count, stdout):
+    """
+    :param count: The number of plans the command was built from (Int)
+    :param stdout: The stdout of a command built by build_resume_start_command or build_finish_command (String)
+    :return: A dict of plan index to the reported result, like 'ready' or 'ok' (Dict)
+    """
+    results = {}
+    for line in stdout.splitlines():
+        position = line.find(RANGE_MARKER + '|')
+        if position == -1:
+            continue
+        fields = line[position:].strip().split('|')
+        if len(fields) == 3 and fields[1].isdigit() and int(fields[1]) < count:
+            results[int(fields[1])] = fields[2]
+    return results
+
+
+def upload_ranges(open_connection, plans, pending_chunks, max_in_flight=4, compress=False, max_attempts=3,
+                  command_timeout=60):
+    """
+    :param open_connection: Called with no arguments, returns a context manager yielding a connected SSHClient
+    which is discarded if the block raises (Callable)
+    :param plans: A list of plans from plan_ranged_upload (List)
+    :param pending_chunks: A list of (plan index, chunk) tuples still to upload (List)
+    :param max_in_flight: The number of ranges uploaded at the same time, each over its own connection (Int)
+    :param compress: gzip every range on the fly and decompress it on the remote side (Bool)
+    :param max_attempts: Attempts per range before its file is given up on (Int)
+    :param command_timeout: Seconds to wait for a range to be written and verified (Int)
+    :return: A tuple of dict of plan index to error message for every file which failed (Dict),
+    bytes sent (Int)
+
+    Every range is written into the partial file at its offset with dd, hashed again on the remote side
+    and recorded in the manifest only if the hash matches, so an interrupted upload resumes with the ranges
+    which are known to be good. A range which fails is retried on a new connection.
+    """
+    pending = Queue()
+    for plan_index, chunk in pending_chunks:
+        pending.put((plan_index, chunk, 1))
+    errors = {}
+    bytes_sent = [0]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                plan_index, chunk, attempt = pending.get_nowait()
+            except Empty:
+                return
+            with lock:
+                if plan_index in errors:
+                    continue
+            plan = plans[plan_index]
+            sent = [0]
+            try:
+                with open_connection() as client:
+                    output = []
+                    exit_code = connection_pool.stream_command_on_transport(
+                        client.get_transport(),
+                        _build_range_command(plan, chunk, compress),
+                        output.append,
+                        command_timeout=command_timeout,
+                        stdin_data=_counted(_read_range(plan['local_path'], chunk, compress), sent),
+                        get_pty=False)
+                    stdout = b''.join(output).decode('utf-8', 'replace')
+                    if exit_code != 0 or parse_marker_results(chunk[0] + 1, stdout).get(chunk[0]) != 'ok':
+                        raise IOError('Range {0} of {1} did not verify.'.format(chunk[0], plan['local_path']))
+            except (IOError, OSError, EOFError, paramiko.SSHException) as error:
+                if attempt < max_attempts:
+                    pending.put((plan_index, chunk, attempt + 1))
+                else:
+                    with lock:
+                        errors[plan_index] = u"{0}".format(error)
+            finally:
+                with lock:
+                    bytes_sent[0] += sent[0]
+
+    workers = [threading.Thread(target=worker) for _ in range(max(1, min(max_in_flight, len(pending_chunks))))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return errors, bytes_sent[0]
+
+
+def _upload_file(sftp, local_path, remote_path, block_size):
+    with open(local_path, 'rb') as local_file:
+        remote_file = sftp.open(remote_path, 'wb')
+        try:
+            remote_file.set_pipelined(True)
+            for block in iter(lambda: local_file.read(block_size), b''):
+                remote_file.write(block)
+        finally:
+            # Closing waits for every outstanding pipelined write to be acknowledged
+            remote_file.close()
+
+
+def _build_range_command(plan, chunk, compress):
+    index, offset, length, digest = chunk
+    return ('{DECOMPRESS}dd of={PARTIAL} bs=1M seek={OFFSET} oflag=seek_bytes conv=notrunc status=none && '
+            'd=$(dd if={PARTIAL} bs=1M skip={OFFSET} count={LENGTH} iflag=skip_bytes,count_bytes status=none | '
+            'sha256sum | cut -d" " -f1) && '
+            'if [ "$d" = {DIGEST} ]; then printf \'%s %s\\n\' {INDEX} "$d" >> {MANIFEST} && '
+            'printf \'%s|%s|ok\\n\' {MARKER} {INDEX}; '
+            'else printf \'%s|%s|mismatch\\n\' {MARKER} {INDEX}; exit 1; fi').format(
+        DECOMPRESS='gzip -dc | ' if compress else '',
+        PARTIAL=quote(plan['partial_path']),
+        MANIFEST=quote(plan['manifest_path']),
+        OFFSET=offset,
+        LENGTH=length,
+        DIGEST=digest,
+        MARKER=RANGE_MARKER,
+        INDEX=index)
+
+
+def _read_range(local_path, chunk, compress, block_size=1048576):
+    index, offset, length, digest = chunk
+    # wbits 31 writes the gzip format gzip -dc expects; level 1 keeps compression ahead of the network
+    compressor = zlib.compressobj(1, zlib.DEFLATED, 31) if compress else None
+    with open(local_path, 'rb') as local_file:
+        local_file.seek(offset)
+        remaining = length
+        while remaining > 0:
+            block = local_file.read(min(block_size, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield compressor.compress(block) if compressor else block
+    if compressor:
+        yield compressor.flush()
+
+
+def _counted(chunks, counter):
+    for chunk in chunks:
+        counter[0] += len(chunk)
+        yield chunk
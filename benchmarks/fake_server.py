@@ -0,0 +1,454 @@
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+
+import paramiko
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+
+# Stand-ins for the privileged and Oracle commands Automation runs. Everything else, [ -f ], mv, mkdir,
+# stat, sha256sum and the shell itself, is the real command working on the sandbox directories
+STUB_COMMANDS = {
+    'sudo': '''#!/bin/bash
+exec "$@"
+''',
+    'su': '''#!/bin/bash
+# su [-] [user] [-c command]
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -|-l|--login) shift ;;
+        -c) exec bash -c "$2" ;;
+        *) shift ;;
+    esac
+done
+exec bash
+''',
+    'chown': '''#!/bin/bash
+# Check the arguments like chown would but leave the owner alone, the server does not run as root
+[ "$1" = "-R" ] && shift
+shift
+status=0
+for path in "$@"; do
+    if [ ! -e "$path" ]; then
+        echo "chown: cannot access '$path': No such file or directory" >&2
+        status=1
+    fi
+done
+exit $status
+''',
+    'mount': '''#!/bin/bash
+if [ $# -eq 0 ]; then
+    cat "$AF_BENCH_STATE/mounts" 2>/dev/null
+    exit 0
+fi
+if [ ! -d "$2" ]; then
+    echo "mount: mount point $2 does not exist" >&2
+    exit 32
+fi
+echo "$1 $2 nfs rw 0 0" >> "$AF_BENCH_STATE/mounts"
+''',
+    'umount': '''#!/bin/bash
+[ "$1" = "-f" ] && shift
+if ! grep -q " $1 " "$AF_BENCH_STATE/mounts" 2>/dev/null; then
+    echo "umount: $1: not mounted" >&2
+    exit 32
+fi
+grep -v " $1 " "$AF_BENCH_STATE/mounts" > "$AF_BENCH_STATE/mounts.new"
+mv "$AF_BENCH_STATE/mounts.new" "$AF_BENCH_STATE/mounts"
+''',
+    'sqlplus': '''#!/bin/bash
+# sqlplus -S logon reads statements from stdin like a sqlplus session, otherwise the @script argument
+# is "run" by printing the ORA- lines written into it
+if [ "$1" = "-S" ]; then
+    while IFS= read -r line; do
+        case "$line" in
+            PROMPT*) echo "${line#PROMPT }" ;;
+            @*) script="${line#@}"; script="${script%% *}"
+                if [ ! -f "$script" ]; then
+                    echo "SP2-0310: unable to open file \\"$script\\""
+                else
+                    grep '^ORA-' "$script"
+                    echo "PL/SQL procedure successfully completed."
+                fi ;;
+            EXIT*|exit*) exit 0 ;;
+        esac
+    done
+    exit 0
+fi
+echo "SQL*Plus: Release 11.2.0.4.0 Production"
+for argument in "$@"; do
+    case "$argument" in
+        @*) script="${argument#@}"
+            if [ ! -f "$script" ]; then
+                echo "SP2-0310: unable to open file \\"$script\\""
+            else
+                grep '^ORA-' "$script"
+                echo "PL/SQL procedure successfully completed."
+            fi ;;
+    esac
+done
+echo "Disconnected from Oracle Database 11g Enterprise Edition Release 11.2.0.4.0"
+''',
+}
+
+
+class LatencyProxy(object):
+    """
+    A TCP proxy which holds every chunk for half the round trip time in each direction and counts the
+    bytes passed, so the SSH handshake, channel opens and data all pay the simulated network latency.
+    """
+
+    def __init__(self, target_port, round_trip_time=0.0):
+        """
+        :param target_port: The local port of the server to forward to (Int)
+        :param round_trip_time: The simulated round trip time in seconds (Float)
+        """
+        self.target_port = target_port
+        self.round_trip_time = round_trip_time
+        self.port = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._socket = None
+        self._closed = False
+
+    def start(self):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen(100)
+        self.port = self._socket.getsockname()[1]
+        _start_thread(self._accept_loop)
+
+    def stop(self):
+        self._closed = True
+        if self._socket is not None:
+            self._socket.close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.bytes_sent = 0
+            self.bytes_received = 0
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                client, address = self._socket.accept()
+            except socket.error:
+                return
+            upstream = socket.create_connection(('127.0.0.1', self.target_port))
+            for connection in (client, upstream):
+                connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._pipe(client, upstream, 'bytes_sent')
+            self._pipe(upstream, client, 'bytes_received')
+
+    def _pipe(self, source, destination, counter):
+        chunks = Queue()
+        delay = self.round_trip_time / 2.0
+
+        def read():
+            while True:
+                try:
+                    data = source.recv(65536)
+                except socket.error:
+                    data = b''
+                if not data:
+                    chunks.put(None)
+                    return
+                with self._lock:
+                    setattr(self, counter, getattr(self, counter) + len(data))
+                chunks.put((time.time() + delay, data))
+
+        def write():
+            while True:
+                chunk = chunks.get()
+                try:
+                    if chunk is None:
+                        destination.shutdown(socket.SHUT_WR)
+                        return
+                    due, data = chunk
+                    wait = due - time.time()
+                    if wait > 0:
+                        time.sleep(wait)
+                    destination.sendall(data)
+                except socket.error:
+                    return
+
+        _start_thread(read)
+        _start_thread(write)
+
+
+class FakeSshServer(object):
+    """
+    An in-process SSH and SFTP server for benchmarks.
+
+    Exec requests run with bash against the real local file system, with sudo, su, chown, mount, umount
+    and sqlplus replaced by stubs, so Automation's commands behave like they would on a host without
+    needing root or Oracle. Any key is accepted. Clients connect to port, which goes through a
+    LatencyProxy adding round_trip_time to every exchange.
+
+    server = FakeSshServer(round_trip_time=0.05)
+    server.start()
+    Automation(hostname='127.0.0.1', username='bench', private_key_file=server.client_key_file, port=server.port)
+    """
+
+    def __init__(self, round_trip_time=0.0):
+        """
+        :param round_trip_time: The simulated network round trip time in seconds (Float)
+        """
+        self.round_trip_time = round_trip_time
+        self.port = None
+        self.connections = 0
+        self.channels = 0
+        self.commands = []
+        self.state_directory = None
+        self.client_key_file = None
+        self._bin_directory = None
+        self._host_key = None
+        self._socket = None
+        self._proxy = None
+        self._transports = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def bytes_sent(self):
+        return self._proxy.bytes_sent
+
+    @property
+    def bytes_received(self):
+        return self._proxy.bytes_received
+
+    def start(self):
+        self.state_directory = tempfile.mkdtemp(prefix='af_bench_server_')
+        self._bin_directory = os.path.join(self.state_directory, 'bin')
+        os.mkdir(self._bin_directory)
+        for name, script in STUB_COMMANDS.items():
+            path = os.path.join(self._bin_directory, name)
+            with open(path, 'w') as stub_file:
+                stub_file.write(script)
+            os.chmod(path, 0o755)
+
+        self._host_key = paramiko.RSAKey.generate(2048)
+        self.client_key_file = os.path.join(self.state_directory, 'id_rsa')
+        paramiko.RSAKey.generate(2048).write_private_key_file(self.client_key_file)
+
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(('127.0.0.1', 0))
+        self._socket.listen(100)
+        _start_thread(self._accept_loop)
+
+        self._proxy = LatencyProxy(self._socket.getsockname()[1], self.round_trip_time)
+        self._proxy.start()
+        self.port = self._proxy.port
+
+    def stop(self):
+        self._closed = True
+        self._proxy.stop()
+        self._socket.close()
+        with self._lock:
+            transports, self._transports = self._transports, []
+        for transport in transports:
+            transport.close()
+        shutil.rmtree(self.state_directory, ignore_errors=True)
+
+    def reset_counters(self):
+        with self._lock:
+            self.connections = 0
+            self.channels = 0
+            self.commands = []
+        self._proxy.reset_counters()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                client, address = self._socket.accept()
+            except socket.error:
+                return
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self._host_key)
+            transport.set_subsystem_handler('sftp', _FakeSftpSubsystem, _FakeSftpServer)
+            with self._lock:
+                self.connections += 1
+                self._transports.append(transport)
+            transport.start_server(server=_FakeServerInterface(self))
+
+    def _run_command(self, channel, command):
+        environment = dict(os.environ,
+                           PATH=self._bin_directory + os.pathsep + os.environ.get('PATH', '/usr/bin:/bin'),
+                           AF_BENCH_STATE=self.state_directory)
+        process = subprocess.Popen(['bash', '-c', command], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, env=environment)
+
+        def feed_stdin():
+            while True:
+                try:
+                    data = channel.recv(32768)
+                except socket.error:
+                    data = b''
+                if not data:
+                    break
+                try:
+                    process.stdin.write(data)
+                    process.stdin.flush()
+                except (IOError, OSError):
+                    break
+            try:
+                process.stdin.close()
+            except (IOError, OSError):
+                pass
+
+        def send_stderr():
+            try:
+                for data in iter(lambda: os.read(process.stderr.fileno(), 32768), b''):
+                    channel.sendall_stderr(data)
+            except (socket.error, EOFError):
+                pass
+
+        _start_thread(feed_stdin)
+        stderr_thread = _start_thread(send_stderr)
+        try:
+            for data in iter(lambda: os.read(process.stdout.fileno(), 32768), b''):
+                channel.sendall(data)
+            stderr_thread.join()
+            channel.send_exit_status(process.wait())
+            channel.close()
+        except (socket.error, EOFError):
+            # The client went away, for example when a pooled connection holding a shell was closed
+            process.kill()
+
+
+class _FakeServerInterface(paramiko.ServerInterface):
+
+    def __init__(self, server):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, channel_id):
+        if kind != 'session':
+            return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+        with self.server._lock:
+            self.server.channels += 1
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixel_width, pixel_height, modes):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        if isinstance(command, bytes):
+            command = command.decode('utf-8')
+        with self.server._lock:
+            self.server.commands.append(command)
+        _start_thread(self.server._run_command, channel, command)
+        return True
+
+
+class _FakeSftpSubsystem(paramiko.SFTPServer):
+    """
+    Reports an exit status when the client ends the session like sshd does, scp fails without one.
+    """
+
+    def finish_subsystem(self):
+        if not self.sock.closed:
+            self.sock.send_exit_status(0)
+        paramiko.SFTPServer.finish_subsystem(self)
+
+
+class _FakeSftpHandle(paramiko.SFTPHandle):
+
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class _FakeSftpServer(paramiko.SFTPServerInterface):
+    """
+    Serves the local file system as is, paths are used unchanged.
+    """
+
+    def open(self, path, flags, attr):
+        try:
+            file_descriptor = os.open(path, flags, 0o644)
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        file_object = os.fdopen(file_descriptor, mode)
+        handle = _FakeSftpHandle(flags)
+        handle.filename = path
+        handle.readfile = file_object
+        handle.writefile = file_object
+        return handle
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def lstat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def list_folder(self, path):
+        try:
+            return [paramiko.SFTPAttributes.from_stat(os.lstat(os.path.join(path, name)), name)
+                    for name in os.listdir(path)]
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+
+    def remove(self, path):
+        return self._call(os.remove, path)
+
+    def rename(self, old_path, new_path):
+        return self._call(os.rename, old_path, new_path)
+
+    def posix_rename(self, old_path, new_path):
+        return self._call(os.rename, old_path, new_path)
+
+    def mkdir(self, path, attr):
+        return self._call(os.mkdir, path)
+
+    def rmdir(self, path):
+        return self._call(os.rmdir, path)
+
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+    @staticmethod
+    def _call(function, *args):
+        try:
+            function(*args)
+        except OSError as error:
+            return paramiko.SFTPServer.convert_errno(error.errno)
+        return paramiko.SFTP_OK
+
+
+def _start_thread(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.daemon = True
+    thread.start()
+    return thread
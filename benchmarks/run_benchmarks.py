@@ -0,0 +1,335 @@
+"""
+Benchmarks Automation against an in-process SSH server with simulated network latency.
+
+Each benchmark is run for every combination of --rtt and --files, --repeat times, each repetition with a
+fresh connection pool which is connected before timing starts. The results are written as JSON with
+the wall time, round trips counted by the instrumentation spans, SSH channels and connections opened
+on the server, and bytes sent and received on the wire. Files are copied in the default scp mode, so
+the system scp client's own connection to the server is counted too.
+
+python benchmarks/run_benchmarks.py --rtt 0 20 100 --files 2 20 --output results.json
+python benchmarks/run_benchmarks.py --baseline results.json
+
+With --baseline the run exits with status 1 if any benchmark uses more round trips or channels than in
+the baseline, or its median wall time is more than --tolerance slower.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import paramiko
+
+from automation_functions import elevated_shell
+from automation_functions.automation import Automation
+from automation_functions.connection_pool import ConnectionPool
+from automation_functions.instrumentation import CallbackSink, Instrumentation
+from fake_server import FakeSshServer
+
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """
+    Register a benchmark function which takes a BenchmarkRun, prepares its files, runs the Automation
+    methods being measured inside run.measure() and returns their result tuples.
+    """
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+    return register
+
+
+class BenchmarkRun(object):
+    """
+    One repetition of one benchmark: a sandbox directory, an Automation connected to the fake server and
+    the measurements taken inside measure().
+    """
+
+    def __init__(self, server, file_count, use_elevated_shells=False):
+        self.server = server
+        self.file_count = file_count
+        self.sandbox = tempfile.mkdtemp(prefix='af_bench_')
+        self.spans = []
+        self.wall_time = None
+        self.pool = ConnectionPool()
+        self.automation = Automation(hostname='127.0.0.1',
+                                     username='bench',
+                                     private_key_file=server.client_key_file,
+                                     port=server.port,
+                                     connection_pool=self.pool,
+                                     use_elevated_shells=use_elevated_shells,
+                                     instrumentation=Instrumentation([CallbackSink(self.spans.append)]))
+        self.counters = None
+
+    def close(self):
+        elevated_shell.get_default_manager().close_all()
+        self.pool.close_all()
+        shutil.rmtree(self.sandbox, ignore_errors=True)
+
+    def path(self, *parts):
+        return os.path.join(self.sandbox, *parts)
+
+    def make_directory(self, *parts):
+        path = self.path(*parts)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        return path
+
+    def make_files(self, directory, count=None, suffix='.txt', content='select 1 from dual;\n'):
+        """
+        :return: The full paths of count new files in the sandbox directory, count defaults to the file count (List)
+        """
+        directory = self.make_directory(directory)
+        paths = []
+        for index in range(self.file_count if count is None else count):
+            path = os.path.join(directory, 'file_{0:05d}{1}'.format(index, suffix))
+            with open(path, 'w') as new_file:
+                new_file.write(content)
+            paths.append(path)
+        return paths
+
+    @contextmanager
+    def measure(self):
+        """
+        Time the block and count the round trips, channels, connections and bytes it used.
+        """
+        self.pool.execute_command('127.0.0.1', 'bench', self.server.client_key_file, ['true'],
+                                  port=self.server.port)
+        self.server.reset_counters()
+        del self.spans[:]
+        start = time.time()
+        yield
+        self.wall_time = time.time() - start
+        self.counters = {'round_trips': sum(span['round_trips'] for span in self.spans if span['parent_id'] is None),
+                         'channels': self.server.channels,
+                         'connections': self.server.connections,
+                         'bytes_sent': self.server.bytes_sent,
+                         'bytes_received': self.server.bytes_received}
+
+
+@benchmark('remote_copy_files')
+def bench_remote_copy_files(run):
+    files = run.make_files('local')
+    destination = run.make_directory('remote')
+    with run.measure():
+        return [run.automation.remote_copy_files(files, destination)]
+
+
+@benchmark('check_files_exist')
+def bench_check_files_exist(run):
+    files = run.make_files('remote')
+    with run.measure():
+        return [run.automation.check_files_exist(files + [run.path('remote', 'missing')])]
+
+
+@benchmark('move_files')
+def bench_move_files(run):
+    files = run.make_files('remote')
+    destination = run.make_directory('moved')
+    with run.measure():
+        return [run.automation.move_files(files, destination)]
+
+
+@benchmark('change_file_ownership')
+def bench_change_file_ownership(run):
+    files = run.make_files('remote')
+    with run.measure():
+        return [run.automation.change_file_ownership('oracle', files, chown_groupname='dba')]
+
+
+@benchmark('create_directory')
+def bench_create_directory(run):
+    directories = [run.path('remote', 'directory_{0:05d}'.format(index)) for index in range(run.file_count)]
+    with run.measure():
+        return [run.automation.create_directory(directory) for directory in directories]
+
+
+@benchmark('execute_shell_script')
+def bench_execute_shell_script(run):
+    script, = run.make_files('remote', count=1, suffix='.sh', content='echo done\n')
+    with run.measure():
+        return [run.automation.execute_shell_script(script)]
+
+
+@benchmark('mount_and_unmount_file_system')
+def bench_mount_and_unmount_file_system(run):
+    mount_directory = run.make_directory('mnt')
+    with run.measure():
+        return [run.automation.mount_file_system('nfs-server:/export/data', mount_directory),
+                run.automation.unmount_file_system(mount_directory)]
+
+
+@benchmark('execute_oracle_sql_script')
+def bench_execute_oracle_sql_script(run):
+    scripts = run.make_files('remote', suffix='.sql')
+    with run.measure():
+        return [run.automation.execute_oracle_sql_script(script, ['TABLESPACE_NAME']) for script in scripts]
+
+
+@benchmark('provisioning_flow_sequential')
+def bench_provisioning_flow_sequential(run):
+    """
+    The example_usage.py flow with one call per step: copy the sql scripts, move them to the oracle home,
+    give them to oracle and run each one.
+    """
+    scripts = run.make_files('local', suffix='.sql')
+    copied = run.make_directory('tmp')
+    oracle_home = run.make_directory('home', 'oracle')
+    moved = [os.path.join(oracle_home, os.path.basename(script)) for script in scripts]
+    with run.measure():
+        results = [run.automation.remote_copy_files(scripts, copied),
+                   run.automation.move_files([os.path.join(copied, os.path.basename(script)) for script in scripts],
+                                             oracle_home),
+                   run.automation.change_file_ownership('oracle', moved)]
+        for script in moved:
+            results.append(run.automation.execute_oracle_sql_script(script, ['TABLESPACE_NAME', 'temp123']))
+        return results
+
+
+@benchmark('provisioning_flow_pipeline')
+def bench_provisioning_flow_pipeline(run):
+    """
+    The example_usage.py flow queued on a pipeline as example_usage.py does it.
+    """
+    scripts = run.make_files('local', suffix='.sql')
+    copied = run.make_directory('tmp')
+    oracle_home = run.make_directory('home', 'oracle')
+    moved = [os.path.join(oracle_home, os.path.basename(script)) for script in scripts]
+    with run.measure():
+        pipeline = run.automation.pipeline()
+        pipeline.remote_copy_files(files=scripts, destination_directory=copied)
+        pipeline.move_files(files=[os.path.join(copied, os.path.basename(script)) for script in scripts],
+                            destination_directory=oracle_home)
+        pipeline.change_file_ownership(chown_username='oracle', files=moved)
+        for script in moved:
+            pipeline.execute_oracle_sql_script(script_file=script, script_parameters=['TABLESPACE_NAME', 'temp123'])
+        return pipeline.execute()
+
+
+def succeeded(result):
+    if len(result) == 2:
+        return bool(result[0])
+    return bool(result[0] and result[2])
+
+
+def run_benchmark(name, server, file_count, repeat, use_elevated_shells=False):
+    """
+    :return: A dict of the benchmark's measurements over every repetition (Dict)
+    """
+    wall_times = []
+    counters = None
+    failures = []
+    for _ in range(repeat):
+        run = BenchmarkRun(server, file_count, use_elevated_shells)
+        try:
+            results = BENCHMARKS[name](run)
+        finally:
+            run.close()
+        wall_times.append(run.wall_time)
+        counters = run.counters
+        failures.extend(u"{0}".format(result[1]) for result in results if not succeeded(result))
+
+    wall_times.sort()
+    measurement = OrderedDict([('benchmark', name),
+                               ('rtt_ms', int(round(server.round_trip_time * 1000))),
+                               ('file_count', file_count),
+                               ('repeat', repeat),
+                               ('wall_time_min', wall_times[0]),
+                               ('wall_time_median', wall_times[len(wall_times) // 2]),
+                               ('wall_times', wall_times)])
+    measurement.update(sorted(counters.items()))
+    measurement['status'] = not failures
+    measurement['failures'] = failures
+    return measurement
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    :return: A list of messages, one per measurement which regressed against the baseline (List)
+    """
+    expected = dict(((entry['benchmark'], entry['rtt_ms'], entry['file_count']), entry)
+                    for entry in baseline['results'])
+    regressions = []
+    for entry in results:
+        key = (entry['benchmark'], entry['rtt_ms'], entry['file_count'])
+        if key not in expected:
+            continue
+        for counter in ('round_trips', 'channels'):
+            if entry[counter] > expected[key][counter]:
+                regressions.append('{0} rtt={1}ms files={2}: {3} went from {4} to {5}'.format(
+                    key[0], key[1], key[2], counter, expected[key][counter], entry[counter]))
+        limit = expected[key]['wall_time_median'] * (1 + tolerance)
+        if entry['wall_time_median'] > limit:
+            regressions.append('{0} rtt={1}ms files={2}: median wall time went from {3:.4f}s to {4:.4f}s'.format(
+                key[0], key[1], key[2], expected[key]['wall_time_median'], entry['wall_time_median']))
+    return regressions
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmark Automation against a local fake SSH server.')
+    parser.add_argument('--rtt', type=float, nargs='+', default=[0.0, 20.0],
+                        help='Simulated round trip times in milliseconds')
+    parser.add_argument('--files', type=int, nargs='+', default=[2, 20],
+                        help='Number of files each benchmark works on')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions of every measurement')
+    parser.add_argument('--benchmark', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help='Benchmarks to run, defaults to all of them')
+    parser.add_argument('--elevated-shells', action='store_true',
+                        help='Run Automation with use_elevated_shells=True')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of standard output')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed median wall time increase over the baseline, 0.25 is 25%%')
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    options = parse_arguments(arguments)
+    results = []
+    for rtt in options.rtt:
+        server = FakeSshServer(round_trip_time=rtt / 1000.0)
+        server.start()
+        try:
+            for file_count in options.files:
+                for name in options.benchmark:
+                    measurement = run_benchmark(name, server, file_count, options.repeat, options.elevated_shells)
+                    results.append(measurement)
+                    sys.stderr.write('{benchmark} rtt={rtt_ms}ms files={file_count}: {wall_time_median:.4f}s '
+                                     '{round_trips} round trips {channels} channels\n'.format(**measurement))
+        finally:
+            server.stop()
+
+    report = OrderedDict([('environment', OrderedDict([('python', platform.python_version()),
+                                                       ('paramiko', paramiko.__version__),
+                                                       ('platform', platform.platform()),
+                                                       ('elevated_shells', options.elevated_shells)])),
+                          ('results', results)])
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), options.tolerance)
+        for regression in regressions:
+            sys.stderr.write('REGRESSION {0}\n'.format(regression))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,35 +20,34 @@ def setup_oracle_table_and_user(tablespace_object):
                        username=settings.DEV_CLOUD_USERNAME,
                        private_key_file=settings.DEV_CLOUD_KEY)
 
-        status, message = a.remote_copy_files(files=[settings.CLOUD_ORACLE_CREATE_TS_SQL_FILEPATH,
-                                                     settings.CLOUD_ORACLE_CREATE_USER_SQL_FILEPATH],
-                                              destination_directory='/tmp/')
-        if not status:
-            return {'status': False, 'message': message}
+        password = 'temp123'
 
-        ssh_status, message, status = a.move_files(files=['/tmp/{0}'.format(settings.CLOUD_ORACLE_CREATE_TS_SQL_FILENAME),
-                                                          '/tmp/{0}'.format(settings.CLOUD_ORACLE_CREATE_USER_SQL_FILENAME)],
-                                                   destination_directory='/home/oracle')
-        if not ssh_status or not status:
-            return {'status': False, 'message': message}
+        # Queue every step and run them in one remote execution after the copy
+        pipeline = a.pipeline()
+        pipeline.remote_copy_files(files=[settings.CLOUD_ORACLE_CREATE_TS_SQL_FILEPATH,
+                                          settings.CLOUD_ORACLE_CREATE_USER_SQL_FILEPATH],
+                                   destination_directory='/tmp/')
+        pipeline.move_files(files=['/tmp/{0}'.format(settings.CLOUD_ORACLE_CREATE_TS_SQL_FILENAME),
+                                   '/tmp/{0}'.format(settings.CLOUD_ORACLE_CREATE_USER_SQL_FILENAME)],
+                            destination_directory='/home/oracle')
+        pipeline.change_file_ownership(chown_username='oracle',
+                                       files=['/home/oracle/{0}'.format(settings.CLOUD_ORACLE_CREATE_TS_SQL_FILENAME),
+                                              '/home/oracle/{0}'.format(settings.CLOUD_ORACLE_CREATE_USER_SQL_FILENAME)])
+        pipeline.execute_oracle_sql_script(script_file='/home/oracle/{0}'.format(settings.CLOUD_ORACLE_CREATE_TS_SQL_FILENAME),
+                                           script_parameters=['{0}'.format(tablespace_name)])
+        pipeline.execute_oracle_sql_script(script_file='/home/oracle/{0}'.format(settings.CLOUD_ORACLE_CREATE_USER_SQL_FILENAME),
+                                           script_parameters=['{0}'.format(tablespace_name),
+                                                              '{0}'.format(tablespace_name),
+                                                              password])
+        results = pipeline.execute()
 
-        ssh_status, message, status = a.change_file_ownership(chown_username='oracle',
-                                                              files=['/home/oracle/{0}'.format(settings.CLOUD_ORACLE_CREATE_TS_SQL_FILENAME),
-                                                                     '/home/oracle/{0}'.format(settings.CLOUD_ORACLE_CREATE_USER_SQL_FILENAME)])
-        if not ssh_status or not status:
-            return {'status': False, 'message': message}
-
-        ssh_status, message, status = a.execute_oracle_sql_script(script_file='/home/oracle/{0}'.format(settings.CLOUD_ORACLE_CREATE_TS_SQL_FILENAME),
-                                                                  script_parameters=['{0}'.format(tablespace_name)])
-        if not ssh_status or not status:
+        status, message = results[0]
+        if not status:
             return {'status': False, 'message': message}
 
-        password = 'temp123'
-
-        ssh_status, message, status = a.execute_oracle_sql_script(script_file='/home/oracle/{0}'.format(settings.CLOUD_ORACLE_CREATE_USER_SQL_FILENAME),
-                                                                  script_parameters=['{0}'.format(tablespace_name),
-                                                                                     '{0}'.format(tablespace_name),
-                                                                                     password])
+        for ssh_status, message, status in results[1:]:
+            if not ssh_status or not status:
+                return {'status': False, 'message': message}
 
         if ssh_status and status:
             # Send oracle tablespace name, user, and password to user
@@ -0,0 +1,39 @@
+import unittest
+
+from automation_functions.automation import Automation, FILE_STAT_MARKER
+
+
+class FileStatOutputTest(unittest.TestCase):
+
+    def test_existence_lines(self):
+        stdout = u"{0}|0|file\n{0}|1|directory\n{0}|2|missing\n".format(FILE_STAT_MARKER)
+        results = Automation._parse_file_stat_output(['/a', '/b', '/c'], stdout)
+        self.assertEqual([results[path]['type'] for path in ('/a', '/b', '/c')], ['file', 'directory', 'missing'])
+        self.assertIsNone(results['/a']['size'])
+
+    def test_metadata_lines(self):
+        stdout = u"{0}|0|file|1024|1500000000|oracle|dba|640\r\n".format(FILE_STAT_MARKER)
+        self.assertEqual(Automation._parse_file_stat_output(['/u01/a'], stdout)['/u01/a'],
+                         {'type': 'file', 'size': 1024, 'mtime': 1500000000, 'owner': 'oracle', 'group': 'dba',
+                          'mode': '640'})
+
+    def test_failed_stat_leaves_metadata_empty(self):
+        stdout = u"{0}|0|file|\n{0}|1|missing|\n".format(FILE_STAT_MARKER)
+        results = Automation._parse_file_stat_output(['/a', '/b'], stdout)
+        self.assertEqual((results['/a']['type'], results['/a']['owner']), ('file', None))
+        self.assertEqual(results['/b'], {'type': 'missing', 'size': None, 'mtime': None, 'owner': None,
+                                         'group': None, 'mode': None})
+
+    def test_malformed_lines_are_ignored(self):
+        stdout = (u"echo {0}|$i|$t\n{0}|5|file\n{0}|x|file\n{0}|0|socket\n{0}|0|file|1|2\n"
+                  u"prompt$ {0}|1|file\n").format(FILE_STAT_MARKER)
+        self.assertEqual(list(Automation._parse_file_stat_output(['/a', '/b'], stdout)), ['/b'])
+
+    def test_stat_command_quotes_paths(self):
+        command = Automation._build_file_stat_command(["/u01/it's here"], include_metadata=True)
+        self.assertIn(FILE_STAT_MARKER, command)
+        self.assertIn("'/u01/it'\"'\"'s here'", command)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+from automation_functions import bulk
+
+
+class NulDelimitedChunksTest(unittest.TestCase):
+
+    def test_paths_are_nul_terminated_and_end_with_an_empty_record(self):
+        chunks = list(bulk.nul_delimited_chunks(['/u01/a', u'/u01/b']))
+        self.assertEqual(chunks, [b'/u01/a\0/u01/b\0\0'])
+
+    def test_chunks_split_at_chunk_size_and_only_the_last_holds_the_end_record(self):
+        chunks = list(bulk.nul_delimited_chunks(['/a', '/b', '/c'], chunk_size=6))
+        self.assertEqual(chunks, [b'/a\0/b\0', b'/c\0\0'])
+
+    def test_paths_with_spaces_and_newlines_are_kept_whole(self):
+        chunks = list(bulk.nul_delimited_chunks(['/u01/my file', '/u01/line\nbreak']))
+        self.assertEqual(b''.join(chunks).split(b'\0'), [b'/u01/my file', b'/u01/line\nbreak', b'', b''])
+
+    def test_empty_list_sends_only_the_end_record(self):
+        self.assertEqual(list(bulk.nul_delimited_chunks([])), [b'\0'])
+
+    def test_paths_are_read_lazily(self):
+        chunks = bulk.nul_delimited_chunks(('/p{0}'.format(index) for index in range(100000)), chunk_size=64)
+        self.assertEqual(next(chunks)[:4], b'/p0\0')
+
+    def test_bad_paths_are_refused(self):
+        self.assertRaises(TypeError, list, bulk.nul_delimited_chunks(['/a', 5]))
+        self.assertRaises(ValueError, list, bulk.nul_delimited_chunks(['/a', '']))
+        self.assertRaises(ValueError, list, bulk.nul_delimited_chunks(['/a\0b']))
+
+
+class ParseBulkOutputTest(unittest.TestCase):
+
+    def test_end_marker(self):
+        stdout = u"changed ownership\n\n__AF_BULK__|END|0|3\n"
+        self.assertEqual(bulk.parse_bulk_output(stdout),
+                         {'missing': None, 'complete': True, 'exit_code': 0, 'count': 3})
+
+    def test_missing_path_keeps_pipes_in_the_path(self):
+        result = bulk.parse_bulk_output(u"__AF_BULK__|MISSING|/u01/a|b\n")
+        self.assertEqual(result['missing'], '/u01/a|b')
+        self.assertIsNone(result['exit_code'])
+
+    def test_incomplete_list(self):
+        self.assertFalse(bulk.parse_bulk_output(u"__AF_BULK__|INCOMPLETE\n")['complete'])
+
+    def test_malformed_end_marker_is_ignored(self):
+        result = bulk.parse_bulk_output(u"__AF_BULK__|END|x|3\n__AF_BULK__|END|1\n")
+        self.assertIsNone(result['exit_code'])
+        self.assertIsNone(result['count'])
+
+    def test_no_output(self):
+        self.assertEqual(bulk.parse_bulk_output(None)['count'], None)
+
+
+class ChunkArgumentsTest(unittest.TestCase):
+
+    def test_chunks_stay_under_the_length(self):
+        self.assertEqual(list(bulk.chunk_arguments(['aaa', 'bbb', 'ccc'], 8)), [['aaa', 'bbb'], ['ccc']])
+
+    def test_an_argument_longer_than_the_length_gets_its_own_chunk(self):
+        self.assertEqual(list(bulk.chunk_arguments(['a' * 20, 'b'], 8)), [['a' * 20], ['b']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import unittest
+
+from automation_functions import client
+
+
+class AbsoluteLocalPathsTest(unittest.TestCase):
+
+    def test_copied_files_are_made_absolute(self):
+        args, kwargs = client.absolute_local_paths('remote_copy_files', (['a/x', '/abs'], 'rel'), {})
+        self.assertEqual(args, [[os.path.abspath('a/x'), '/abs'], 'rel'])
+
+    def test_remote_script_is_left_alone(self):
+        self.assertEqual(client.absolute_local_paths('execute_shell_script', ('s.sh',), {}), (['s.sh'], {}))
+
+    def test_local_script_is_made_absolute(self):
+        args, kwargs = client.absolute_local_paths('execute_shell_script', (),
+                                                   {'script_file_name': 's.sh', 'local_script': True})
+        self.assertEqual(kwargs['script_file_name'], os.path.abspath('s.sh'))
+        args, kwargs = client.absolute_local_paths('execute_oracle_sql_script', ('x.sql', [], 'oracle', True), {})
+        self.assertEqual(args[0], os.path.abspath('x.sql'))
+
+    def test_other_methods_are_left_alone(self):
+        self.assertEqual(client.absolute_local_paths('create_directory', ('rel',), {}), (['rel'], {}))
+
+
+class ExceptionFromResponseTest(unittest.TestCase):
+
+    def test_builtin_errors_keep_their_type(self):
+        for name, error_type in (('TypeError', TypeError), ('IOError', IOError), ('KeyError', KeyError)):
+            error = client.exception_from_response({'type': name, 'message': u"bad"})
+            self.assertTrue(isinstance(error, error_type))
+
+    def test_other_errors_become_runtime_errors_naming_the_type(self):
+        error = client.exception_from_response({'type': 'ElevatedShellError', 'message': u"shell died"})
+        self.assertEqual((type(error), str(error)), (RuntimeError, 'ElevatedShellError: shell died'))
+
+    def test_exceptions_which_are_not_errors_are_not_raised_as_themselves(self):
+        error = client.exception_from_response({'type': 'SystemExit', 'message': u"1"})
+        self.assertEqual(type(error), RuntimeError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+import unittest
+
+from automation_functions.fleet import FleetRunner
+
+
+class FleetRunnerTest(unittest.TestCase):
+
+    def test_duplicate_hosts_are_refused(self):
+        self.assertRaises(ValueError, FleetRunner, ['host1', 'host2', 'host1'])
+
+    def test_hosts_must_be_a_list(self):
+        self.assertRaises(TypeError, FleetRunner, 'host1')
+
+    def test_methods_without_a_status_tuple_are_refused(self):
+        runner = FleetRunner(['host1'])
+        self.assertRaises(ValueError, runner.run, 'execute_oracle_sql_script_streaming', 'x.sql')
+        self.assertRaises(ValueError, runner.run, 'check_files_exist', ['/u01'])
+        self.assertRaises(AttributeError, runner.run, '_execute_remote_command', ['ls'])
+
+
+if __name__ == '__main__':
+    unittest.main()
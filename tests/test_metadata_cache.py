@@ -0,0 +1,96 @@
+import time
+import unittest
+
+from automation_functions.metadata_cache import MetadataCache
+
+
+FILE_RESULT = {'type': 'file', 'size': 10, 'mtime': 1, 'owner': 'oracle', 'group': 'dba', 'mode': '644'}
+
+
+class MetadataCacheTest(unittest.TestCase):
+
+    def test_hit_returns_a_copy(self):
+        cache = MetadataCache()
+        cache.set('host1', '/u01/a', FILE_RESULT, has_metadata=True)
+        result = cache.get('host1', '/u01/a', include_metadata=True)
+        result['size'] = 99
+        self.assertEqual(cache.get('host1', '/u01/a'), FILE_RESULT)
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_entries_expire_after_the_ttl(self):
+        cache = MetadataCache(ttl=-1)
+        cache.set('host1', '/u01/a', FILE_RESULT)
+        self.assertIsNone(cache.get('host1', '/u01/a'))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = MetadataCache(max_entries=2)
+        cache.set('host1', '/a', FILE_RESULT)
+        cache.set('host1', '/b', FILE_RESULT)
+        cache.get('host1', '/a')
+        cache.set('host1', '/c', FILE_RESULT)
+        self.assertIsNone(cache.get('host1', '/b'))
+        self.assertIsNotNone(cache.get('host1', '/a'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_entries_are_kept_per_host_and_user(self):
+        cache = MetadataCache()
+        cache.set('host1', '/u01/a', FILE_RESULT, su_as='oracle')
+        self.assertIsNone(cache.get('host2', '/u01/a', su_as='oracle'))
+        self.assertIsNone(cache.get('host1', '/u01/a', su_as='root'))
+        self.assertIsNotNone(cache.get('host1', '/u01/a', su_as='oracle'))
+
+    def test_existence_entry_does_not_answer_metadata_checks(self):
+        cache = MetadataCache()
+        cache.set('host1', '/u01/a', FILE_RESULT)
+        self.assertIsNone(cache.get('host1', '/u01/a', include_metadata=True))
+        self.assertIsNotNone(cache.get('host1', '/u01/a'))
+
+    def test_mark_directory_drops_its_parents(self):
+        cache = MetadataCache()
+        cache.set('host1', '/u01', {'type': 'missing'}, has_metadata=True)
+        cache.set('host1', '/u01/app', {'type': 'missing'}, has_metadata=True)
+        cache.set('host2', '/u01', {'type': 'missing'}, has_metadata=True)
+        cache.mark_directory('host1', '/u01/app/oracle/')
+        self.assertEqual(cache.get('host1', '/u01/app/oracle/')['type'], 'directory')
+        self.assertIsNone(cache.get('host1', '/u01/app'))
+        self.assertIsNone(cache.get('host1', '/u01'))
+        self.assertEqual(cache.get('host2', '/u01')['type'], 'missing')
+
+    def test_mark_missing_answers_every_check(self):
+        cache = MetadataCache()
+        cache.set('host1', '/u01/a', FILE_RESULT, su_as='oracle')
+        cache.mark_missing('host1', '/u01/a')
+        self.assertIsNone(cache.get('host1', '/u01/a', su_as='oracle'))
+        self.assertEqual(cache.get('host1', '/u01/a', include_metadata=True)['type'], 'missing')
+
+    def test_forget_metadata_keeps_existence(self):
+        cache = MetadataCache()
+        cache.set('host1', '/u01/a', FILE_RESULT, has_metadata=True)
+        cache.forget_metadata('host1', ['/u01/a'])
+        self.assertIsNone(cache.get('host1', '/u01/a', include_metadata=True))
+        self.assertEqual(cache.get('host1', '/u01/a')['owner'], None)
+
+    def test_invalidate_trees_on_one_host(self):
+        cache = MetadataCache()
+        for path in ('/u01', '/u01/a', '/u01/a/b', '/u010'):
+            cache.set('host1', path, FILE_RESULT)
+        cache.set('host2', '/u01/a', FILE_RESULT)
+        cache.invalidate('host1', [], trees=['/u01/'])
+        self.assertEqual([path for path in ('/u01', '/u01/a', '/u01/a/b', '/u010') if cache.get('host1', path)],
+                         ['/u010'])
+        self.assertIsNotNone(cache.get('host2', '/u01/a'))
+
+    def test_invalidate_everything(self):
+        cache = MetadataCache()
+        cache.set('host1', '/a', FILE_RESULT)
+        cache.set('host2', '/a', FILE_RESULT)
+        cache.invalidate('host1')
+        self.assertEqual(len(cache), 1)
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
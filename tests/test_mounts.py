@@ -0,0 +1,59 @@
+import unittest
+
+from automation_functions import mounts
+
+
+class MountFieldTest(unittest.TestCase):
+
+    def test_escape_matches_proc_mounts(self):
+        self.assertEqual(mounts.escape_mount_field('/mnt/my share\\x'), '/mnt/my\\040share\\134x')
+
+    def test_unescape_decodes_every_escape(self):
+        self.assertEqual(mounts.unescape_mount_field('/mnt/a\\040b\\011c\\012d'), '/mnt/a b\tc\nd')
+
+    def test_round_trip_keeps_backslashes_before_octal_digits(self):
+        for field in ('/mnt/a\\040b', '/mnt/a b\\', '//server/share name'):
+            self.assertEqual(mounts.unescape_mount_field(mounts.escape_mount_field(field)), field)
+
+
+class MountWavesTest(unittest.TestCase):
+
+    def test_independent_mounts_share_a_wave(self):
+        self.assertEqual(mounts.mount_waves(['/u01', '/u02']), [[0, 1]])
+
+    def test_nested_mounts_come_after_their_parent(self):
+        self.assertEqual(mounts.mount_waves(['/u01/app/data', '/u01', '/u01/app']), [[1], [2], [0]])
+
+    def test_nested_mounts_are_unmounted_first(self):
+        self.assertEqual(mounts.mount_waves(['/u01', '/u01/app'], deepest_first=True), [[1], [0]])
+
+    def test_sibling_prefix_is_not_nesting(self):
+        self.assertEqual(mounts.mount_waves(['/u01', '/u010']), [[0, 1]])
+
+    def test_duplicate_mount_directories_are_refused(self):
+        self.assertRaises(ValueError, mounts.mount_waves, ['/u01', '/u02', '/u01/'])
+
+    def test_batch_scripts_refuse_duplicates(self):
+        self.assertRaises(ValueError, mounts.build_batch_mount_script, [('nfs:/a', '/u01'), ('nfs:/b', '/u01')])
+        self.assertRaises(ValueError, mounts.build_batch_unmount_script, ['/u01', '/u01'])
+
+
+class ParseBatchOutputTest(unittest.TestCase):
+
+    def test_results_are_placed_by_index(self):
+        stdout = u"__AF_MOUNT__|1|unchanged\n__AF_MOUNT__|0|done|32|mount: busy\r\n"
+        self.assertEqual(mounts.parse_batch_output(3, stdout), [['done', '32', 'mount: busy'], ['unchanged'], None])
+
+    def test_busy_entry_reports_the_mounted_source(self):
+        self.assertEqual(mounts.parse_batch_output(1, u"__AF_MOUNT__|0|busy|nfs:/other\n"), [['busy', 'nfs:/other']])
+
+    def test_out_of_range_and_malformed_lines_are_ignored(self):
+        stdout = u"__AF_MOUNT__|4|unchanged\n__AF_MOUNT__|x|unchanged\n__AF_MOUNT__|0\nmount -a\n"
+        self.assertEqual(mounts.parse_batch_output(2, stdout), [None, None])
+
+    def test_no_output(self):
+        self.assertEqual(mounts.parse_batch_output(1, None), [None])
+
+
+if __name__ == '__main__':
+    unittest.main()
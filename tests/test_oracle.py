@@ -0,0 +1,66 @@
+import unittest
+
+from automation_functions import oracle
+
+
+class OracleOutputScannerTest(unittest.TestCase):
+
+    def test_errors_are_found_in_order(self):
+        scanner = oracle.scan_oracle_output(u"Table created.\nORA-00942: table or view does not exist\n"
+                                            u"ORA-01653: unable to extend table\n")
+        self.assertEqual(scanner.error_codes, [u"ORA-00942", u"ORA-01653"])
+        self.assertEqual(scanner.errors[0]['message'], u"ORA-00942: table or view does not exist")
+
+    def test_error_split_across_chunks_is_found_once(self):
+        scanner = oracle.OracleOutputScanner()
+        for chunk in (u"SQL> ORA-01", u"543: tablespace 'USERS' already", u" exists\nDone.\n"):
+            scanner.feed(chunk)
+        scanner.close()
+        self.assertEqual(scanner.error_codes, [u"ORA-01543"])
+
+    def test_last_line_without_a_line_end_is_scanned_on_close(self):
+        scanner = oracle.OracleOutputScanner()
+        scanner.feed(u"ORA-01920: user name conflicts")
+        self.assertEqual(scanner.error_codes, [])
+        scanner.close()
+        self.assertEqual(scanner.error_codes, [u"ORA-01920"])
+
+    def test_bytes_are_decoded(self):
+        self.assertEqual(oracle.scan_oracle_output(b"ORA-00959: tablespace does not exist\n").error_codes,
+                         [u"ORA-00959"])
+
+    def test_abort_error_stops_feeding(self):
+        scanner = oracle.OracleOutputScanner(abort_on_errors=['ora-01653'])
+        self.assertTrue(scanner.feed(u"ORA-00942: table or view does not exist\n"))
+        self.assertFalse(scanner.feed(u"ORA-01653: unable to extend table\n"))
+        self.assertEqual(scanner.abort_error, u"ORA-01653")
+
+    def test_tail_is_bounded(self):
+        scanner = oracle.OracleOutputScanner(tail_size=10)
+        scanner.feed(u"x" * 100 + u"\n" + u"last line\n")
+        self.assertEqual(scanner.tail, u"last line\n")
+        self.assertEqual(scanner.bytes_seen, 111)
+
+    def test_long_line_without_a_line_end_is_scanned_anyway(self):
+        scanner = oracle.OracleOutputScanner(max_line_size=20)
+        scanner.feed(u"ORA-01555: snapshot too old" + u"x" * 30)
+        self.assertEqual(scanner.error_codes, [u"ORA-01555"])
+
+
+class OracleErrorsMessageTest(unittest.TestCase):
+
+    def test_no_errors(self):
+        self.assertIsNone(oracle.oracle_errors_message([]))
+
+    def test_known_error_has_its_own_message(self):
+        self.assertEqual(oracle.oracle_errors_message([u"ORA-00942", u"ORA-01920"]),
+                         u"Error ORA-01920: Oracle User already exists. Unable to create user.")
+
+    def test_generic_messages(self):
+        self.assertEqual(oracle.oracle_errors_message([u"ORA-00942"]), u"Oracle error occurred ORA-00942.")
+        self.assertEqual(oracle.oracle_errors_message([u"ORA-00942", u"ORA-01653"]),
+                         u"Oracle errors occurred ORA-00942, ORA-01653.")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from automation_functions import script_cache
+
+
+class ScriptCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.local_path = os.path.join(self.directory, 'setup.sh')
+        with open(self.local_path, 'wb') as script_file:
+            script_file.write(b'echo hello\n' * 400)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cached_script_keeps_its_file_name(self):
+        self.assertEqual(script_cache.cached_script_path('/var/cache/af', 'ab' * 32, self.local_path),
+                         '/var/cache/af/' + 'ab' * 32 + '/setup.sh')
+
+    def test_long_script_is_sent_over_several_commands(self):
+        commands = script_cache.build_install_commands(self.local_path, '/var/cache/af/d/setup.sh', 'd', 2048)
+        self.assertTrue(len(commands) > 1)
+        self.assertTrue(all(len(command) < 2048 + 1024 for command in commands))
+        self.assertIn('mv -f', commands[-1])
+        self.assertNotIn('mv -f', commands[0])
+
+    def test_every_install_writes_its_own_partial_file(self):
+        partial_paths = set()
+        for _ in range(2):
+            command = script_cache.build_install_commands(self.local_path, '/var/cache/af/d/setup.sh', 'd', 65536)[0]
+            partial_paths.update(word for word in command.split() if word.endswith(script_cache.PARTIAL_SUFFIX))
+        self.assertEqual(len(partial_paths), 2)
+        for partial_path in partial_paths:
+            self.assertTrue(partial_path.startswith('/var/cache/af/d/setup.sh.'))
+
+    def test_install_outcome(self):
+        self.assertEqual(script_cache.install_outcome(u"__AF_SCRIPT__|installed\n"), 'installed')
+        self.assertEqual(script_cache.install_outcome(u"__AF_SCRIPT__|untrusted\n"), 'untrusted')
+        self.assertIsNone(script_cache.install_outcome(None))
+
+    def test_is_missing(self):
+        self.assertTrue(script_cache.is_missing(u"__AF_SCRIPT__|missing\n"))
+        self.assertFalse(script_cache.is_missing(u"hello\n"))
+
+
+if __name__ == '__main__':
+    unittest.main()
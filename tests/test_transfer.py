@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from automation_functions import transfer
+
+
+class RangedUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.local_path = os.path.join(self.directory, 'datafile')
+        with open(self.local_path, 'wb') as local_file:
+            local_file.write(b'a' * 10 + b'b' * 10 + b'c' * 5)
+        self.plan = transfer.plan_ranged_upload(self.local_path, '/u01/datafile', 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def manifest_output(self, lines, index=0):
+        return u''.join(u"{0}|{1}|{2}\n".format(transfer.RANGE_MARKER, index, line) for line in lines)
+
+    def header(self):
+        return u"header {0} {1} {2}".format(self.plan['size'], self.plan['chunk_size'], self.plan['digest'])
+
+    def test_plan_splits_the_file_into_ranges(self):
+        self.assertEqual(self.plan['size'], 25)
+        self.assertEqual([chunk[:3] for chunk in self.plan['chunks']], [(0, 0, 10), (1, 10, 10), (2, 20, 5)])
+        self.assertEqual(self.plan['partial_path'], '/u01/datafile' + transfer.PARTIAL_SUFFIX)
+        self.assertEqual(self.plan['manifest_path'], '/u01/datafile' + transfer.MANIFEST_SUFFIX)
+
+    def test_empty_file_has_no_ranges(self):
+        empty_path = os.path.join(self.directory, 'empty')
+        open(empty_path, 'wb').close()
+        plan = transfer.plan_ranged_upload(empty_path, '/u01/empty', 10)
+        self.assertEqual((plan['size'], plan['chunks']), (0, []))
+
+    def test_verified_ranges_are_resumed(self):
+        digests = [chunk[3] for chunk in self.plan['chunks']]
+        stdout = self.manifest_output([self.header(), u"0 " + digests[0], u"2 " + digests[2]])
+        self.assertEqual(transfer.parse_resume_query_output([self.plan], stdout), [set([0, 2])])
+
+    def test_ranges_with_a_wrong_digest_are_sent_again(self):
+        stdout = self.manifest_output([self.header(), u"0 " + u"0" * 64, u"1"])
+        self.assertEqual(transfer.parse_resume_query_output([self.plan], stdout), [set()])
+
+    def test_manifest_of_another_file_starts_over(self):
+        stdout = self.manifest_output([u"header 25 10 " + u"f" * 64, u"0 " + self.plan['chunks'][0][3]])
+        self.assertEqual(transfer.parse_resume_query_output([self.plan], stdout), [None])
+
+    def test_missing_manifest_starts_over(self):
+        self.assertEqual(transfer.parse_resume_query_output([self.plan], u"noise\n"), [None])
+
+    def test_lines_for_unknown_plans_are_ignored(self):
+        stdout = self.manifest_output([self.header()]) + self.manifest_output([self.header()], index=5)
+        self.assertEqual(transfer.parse_resume_query_output([self.plan], stdout), [set()])
+
+    def test_marker_results(self):
+        stdout = u"{0}|0|ok\n{0}|1|mismatch\n{0}|7|ok\n".format(transfer.RANGE_MARKER)
+        self.assertEqual(transfer.parse_marker_results(2, stdout), {0: 'ok', 1: 'mismatch'})
+
+
+class RemoteDigestTest(unittest.TestCase):
+
+    def test_remote_path_for(self):
+        self.assertEqual(transfer.remote_path_for('/tmp/dir/setup.sh', '/u01/app'), '/u01/app/setup.sh')
+
+    def test_only_files_with_a_digest_are_returned(self):
+        remote_files = [('/u01/a', 10), ('/u01/b', 20)]
+        stdout = u"{0}|0|{1}\n{0}|1|\n{0}|9|{1}\n".format(transfer.DIGEST_MARKER, u"e" * 64)
+        self.assertEqual(transfer.parse_remote_digest_output(remote_files, stdout), {'/u01/a': u"e" * 64})
+
+
+if __name__ == '__main__':
+    unittest.main()